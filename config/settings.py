@@ -84,6 +84,24 @@ DATABASES = {
     )
 }
 
+# Per-process connection pool (PostgreSQL only). Each request checks a
+# connection out and returns it when it ends, so a process never opens more
+# than TOKEN_DB_POOL_MAX_SIZE however many threads it runs (see README:
+# Connection Pool Sizing)
+TOKEN_DB_POOL = config('TOKEN_DB_POOL', default=False, cast=bool)
+TOKEN_DB_POOL_MIN_SIZE = config('TOKEN_DB_POOL_MIN_SIZE', default=2, cast=int)
+TOKEN_DB_POOL_MAX_SIZE = config('TOKEN_DB_POOL_MAX_SIZE', default=10, cast=int)
+# Seconds a checkout waits for a free connection before failing the request
+TOKEN_DB_POOL_TIMEOUT = config('TOKEN_DB_POOL_TIMEOUT', default=5, cast=float)
+# Ping a connection idle this many seconds before reusing it
+TOKEN_DB_POOL_CHECK_AFTER = config('TOKEN_DB_POOL_CHECK_AFTER', default=30, cast=float)
+# Close connections beyond the minimum once idle this many seconds
+TOKEN_DB_POOL_MAX_IDLE = config('TOKEN_DB_POOL_MAX_IDLE', default=300, cast=float)
+
+if TOKEN_DB_POOL and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASES['default']['ENGINE'] = 'tokens.db_pool'
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
 # ---------------- REDIS / CACHE ----------------
 
 REDIS_URL = config('REDIS_URL', default='redis://localhost:6379/0')
@@ -122,8 +140,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ---------------- DRF & API DOCS ----------------
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'tokens.pagination.SelectablePagination',
     'PAGE_SIZE': 100,
+    # orjson-backed when installed; output matches the stock JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'tokens.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
@@ -141,3 +164,106 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REDIS_LOCK_TIMEOUT = 10
 REDIS_LOCK_BLOCKING_TIMEOUT = 5
+
+# ---------------- QUEUE ENGINE ----------------
+
+# 'orm' reads a slot's queue from the tokens table on every booking,
+# 'memory' keeps an ordered queue per active slot in process memory
+TOKEN_QUEUE_ENGINE = config('TOKEN_QUEUE_ENGINE', default='orm')
+
+# 'dense' stores the displayed token number on every token and shifts the
+# tail on insertion, 'gapped' stores a sparse sort key and derives the number
+# on read (run `manage.py rebalance_queues` after switching)
+TOKEN_ORDERING = config('TOKEN_ORDERING', default='dense')
+
+# 'stored' keeps Token.estimated_time up to date on every queue change,
+# 'derived' computes it on read so a delay only updates the slot row
+# (gapped ordering always derives it)
+TOKEN_ESTIMATED_TIME = config('TOKEN_ESTIMATED_TIME', default='stored')
+
+# ---------------- PATIENT IMPORT ----------------
+
+PATIENT_IMPORT_BATCH_SIZE = config('PATIENT_IMPORT_BATCH_SIZE', default=1000, cast=int)
+
+# ---------------- ALLOCATION MODE ----------------
+
+# 'locking' takes a Redis lock per slot in the request thread, 'sharded'
+# routes every slot mutation to a single-writer worker chosen by slot id
+TOKEN_ALLOCATION_MODE = config('TOKEN_ALLOCATION_MODE', default='locking')
+# 'local' runs shard workers as threads in this process (single-process
+# deployments), 'redis' hands requests to `manage.py run_slot_workers`
+TOKEN_SHARD_TRANSPORT = config('TOKEN_SHARD_TRANSPORT', default='local')
+TOKEN_SHARD_COUNT = config('TOKEN_SHARD_COUNT', default=4, cast=int)
+# Seconds a request waits for its shard worker (must be positive); a request
+# not started by then is dropped and answered with 503
+TOKEN_SHARD_TIMEOUT = config('TOKEN_SHARD_TIMEOUT', default=5, cast=int)
+
+# ---------------- ASYNC VIEWS ----------------
+
+# Serve slot mutations from async views (run under ASGI, see config/asgi.py)
+TOKEN_ASYNC_VIEWS = config('TOKEN_ASYNC_VIEWS', default=False, cast=bool)
+# Threads (and so DB connections) per process for ORM work from async views
+TOKEN_ASYNC_DB_THREADS = config('TOKEN_ASYNC_DB_THREADS', default=16, cast=int)
+
+# ---------------- QUEUE READ CACHE ----------------
+
+# Cache for GET /slots/{id}/tokens/, keyed by Slot.queue_version:
+# 'redis' (default cache, shared), 'local' (per-process LRU) or 'off'
+TOKEN_QUEUE_CACHE = config('TOKEN_QUEUE_CACHE', default='redis')
+TOKEN_QUEUE_CACHE_TTL = config('TOKEN_QUEUE_CACHE_TTL', default=300, cast=int)
+TOKEN_QUEUE_CACHE_SIZE = config('TOKEN_QUEUE_CACHE_SIZE', default=1000, cast=int)
+
+# ---------------- CONDITIONAL GET ----------------
+
+# Strong ETags on slot, token and waiting-list reads, answered with 304 from
+# generation keys in the default cache (must be shared across processes)
+TOKEN_ETAGS = config('TOKEN_ETAGS', default=True, cast=bool)
+# Seconds a generation key lives; an expired one just renews the ETags
+TOKEN_ETAG_TTL = config('TOKEN_ETAG_TTL', default=86400, cast=int)
+
+# ---------------- BOOKING GUARD ----------------
+
+# 'redis' keeps a per-day set of booked patients so same-day duplicates are
+# refused before the slot lock; 'off' relies on the indexed database check
+TOKEN_BOOKING_GUARD = config('TOKEN_BOOKING_GUARD', default='off')
+
+# ---------------- WAITING LIST INDEX ----------------
+
+# 'redis' mirrors each slot's waiting list in a sorted set so promotion and
+# the by_slot listing skip the ordered query; 'off' reads the table
+TOKEN_WAITLIST_INDEX = config('TOKEN_WAITLIST_INDEX', default='off')
+
+# ---------------- QUEUE EVENTS ----------------
+
+# Live queue events on /slots/{id}/events/ (Server-Sent Events): 'local'
+# delivers within this process only, 'redis' fans out through Redis pub/sub
+# to every process, 'off' disables the stream
+TOKEN_EVENT_BROKER = config('TOKEN_EVENT_BROKER', default='off')
+# Events buffered per client before it is told to resync instead
+TOKEN_EVENT_BUFFER = config('TOKEN_EVENT_BUFFER', default=100, cast=int)
+# Seconds between keepalive comments on an idle stream
+TOKEN_EVENT_HEARTBEAT = config('TOKEN_EVENT_HEARTBEAT', default=15, cast=int)
+# Serve streams under WSGI too. Each open stream then holds a worker thread,
+# so only enable this with threaded workers sized for the expected clients
+TOKEN_EVENT_WSGI_STREAMS = config('TOKEN_EVENT_WSGI_STREAMS', default=False, cast=bool)
+
+# ---------------- METRICS ----------------
+
+# Prometheus text format on /metrics: service call, slot lock and HTTP
+# latencies plus queue and waiting-list depth. Off costs one settings lookup.
+TOKEN_METRICS = config('TOKEN_METRICS', default=False, cast=bool)
+
+if TOKEN_METRICS:
+    MIDDLEWARE.insert(0, 'tokens.metrics.MetricsMiddleware')
+
+# ---------------- SQL TRACING ----------------
+
+# Per-request query count, DB time and repeated-statement (N+1) detection;
+# offenders are logged on 'tokens.sql', and DEBUG adds X-SQL-* headers
+TOKEN_SQL_TRACE = config('TOKEN_SQL_TRACE', default=False, cast=bool)
+TOKEN_SQL_TRACE_MAX_QUERIES = config('TOKEN_SQL_TRACE_MAX_QUERIES', default=50, cast=int)
+TOKEN_SQL_TRACE_MAX_DB_MS = config('TOKEN_SQL_TRACE_MAX_DB_MS', default=200, cast=int)
+TOKEN_SQL_TRACE_REPEAT = config('TOKEN_SQL_TRACE_REPEAT', default=5, cast=int)
+
+if TOKEN_SQL_TRACE:
+    MIDDLEWARE.insert(0, 'tokens.sql_trace.SQLTraceMiddleware')
@@ -0,0 +1,383 @@
+"""
+Concurrent load test for the OPD Token Allocation System
+Fires bookings, cancellations, emergencies and delays at a handful of slots at
+once (the 9 AM rush), reports throughput, latency percentiles and lock
+timeouts, then checks that every slot's queue is still consistent.
+
+Against a running server (local, Docker or deployed):
+    python loadtest.py --url http://localhost:8000/api/v1 --workers 50 --requests 2000
+
+In-process (test database plus fake Redis, needs `pip install "fakeredis[lua]"`):
+    python loadtest.py --in-process --workers 20 --requests 500
+
+With --metrics (server running with TOKEN_METRICS=True) the DB pool and slot
+lock wait figures from /metrics are printed after the run, for sizing the
+connection pool (see README: Connection Pool Sizing).
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+BASE_URL = "http://localhost:8000/api/v1"
+
+OPERATIONS = ('book', 'cancel', 'emergency', 'delay')
+CATEGORIES = {'PRIORITY_PAID': 1, 'FOLLOWUP': 2, 'ONLINE': 5, 'WALKIN': 4}
+
+
+def parse_mix(value):
+    """'book=80,cancel=15,emergency=5,delay=2' -> {operation: weight}"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}' (use {', '.join(OPERATIONS)})")
+        try:
+            mix[name.strip()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid weight for '{name}': {weight!r}")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0
+    index = max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+class LoadTest:
+    def __init__(self, base_url, args):
+        self.base_url = base_url.rstrip('/')
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.random_lock = threading.Lock()
+        self.local = threading.local()
+        self.slot_ids = []
+        self.patient_ids = []
+        self.booked = []
+        self.booked_lock = threading.Lock()
+        self.results = []
+        self.results_lock = threading.Lock()
+
+    # ---------------- HTTP ----------------
+
+    @property
+    def session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=4))
+            session.mount('https://', HTTPAdapter(pool_maxsize=4))
+            self.local.session = session
+        return session
+
+    def call(self, method, path, **kwargs):
+        return self.session.request(method, f"{self.base_url}{path}", timeout=self.args.timeout, **kwargs)
+
+    # ---------------- SETUP ----------------
+
+    def setup(self, pool):
+        """Create a doctor, the contended slots and the patient pool"""
+        response = self.call('POST', '/doctors/', json={'name': 'Dr. Load Test', 'specialization': 'General'})
+        response.raise_for_status()
+        doctor_id = response.json()['id']
+
+        start = (datetime.now() + timedelta(days=1)).replace(hour=9, minute=0, second=0, microsecond=0)
+        for i in range(self.args.slots):
+            response = self.call('POST', '/slots/', json={
+                'doctor': doctor_id,
+                'start_time': (start + timedelta(hours=i)).isoformat(),
+                'end_time': (start + timedelta(hours=i + 1)).isoformat(),
+                'max_capacity': self.args.capacity,
+            })
+            response.raise_for_status()
+            self.slot_ids.append(response.json()['id'])
+
+        run_id = int(time.time())
+
+        def create_patient(i):
+            response = self.call('POST', '/patients/', json={
+                'name': f"Load Patient {i}",
+                'phone': f"9{run_id % 10 ** 5:05d}{i:04d}",
+            })
+            response.raise_for_status()
+            return response.json()['id']
+
+        self.patient_ids = list(pool.map(create_patient, range(self.args.patients)))
+        print(f"Setup: {len(self.slot_ids)} slots x {self.args.capacity} places, {len(self.patient_ids)} patients")
+
+    # ---------------- OPERATIONS ----------------
+
+    def pick_slot(self):
+        # Zipf-like skew: slot k gets weight 1 / k**skew, so the first slots are the hot ones
+        weights = [1 / (rank ** self.args.skew) for rank in range(1, len(self.slot_ids) + 1)]
+        with self.random_lock:
+            return self.random.choices(self.slot_ids, weights)[0]
+
+    def pick(self, population, weights=None):
+        with self.random_lock:
+            return self.random.choices(population, weights)[0]
+
+    def book(self):
+        response = self.call('POST', '/tokens/', json={
+            'slot_id': self.pick_slot(),
+            'patient_id': self.pick(self.patient_ids),
+            'category': self.pick(list(CATEGORIES), list(CATEGORIES.values())),
+        })
+        if response.status_code == 201:
+            with self.booked_lock:
+                self.booked.append(response.json()['id'])
+        return response
+
+    def cancel(self):
+        with self.booked_lock:
+            if not self.booked:
+                token_id = None
+            else:
+                with self.random_lock:
+                    index = self.random.randrange(len(self.booked))
+                self.booked[index], self.booked[-1] = self.booked[-1], self.booked[index]
+                token_id = self.booked.pop()
+        if token_id is None:
+            return None
+        return self.call('DELETE', f"/tokens/{token_id}/")
+
+    def emergency(self):
+        response = self.call('POST', '/tokens/emergency/', json={
+            'slot_id': self.pick_slot(),
+            'patient_id': self.pick(self.patient_ids),
+        })
+        if response.status_code == 201:
+            with self.booked_lock:
+                self.booked.append(response.json()['token']['id'])
+        return response
+
+    def delay(self):
+        return self.call('PUT', f"/slots/{self.pick_slot()}/delay/", json={'delay_minutes': 5})
+
+    def run_one(self, operation):
+        started = time.perf_counter()
+        error = None
+        try:
+            response = getattr(self, operation)()
+            if response is None:
+                # Nothing to cancel yet; book instead
+                operation = 'book'
+                started = time.perf_counter()
+                response = self.book()
+            status = response.status_code
+            if status >= 400:
+                try:
+                    body = response.json()
+                    error = body.get('error') or body.get('detail') or str(body)
+                except ValueError:
+                    error = response.text[:80]
+        except requests.RequestException as e:
+            status = None
+            error = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with self.results_lock:
+            self.results.append((operation, status, elapsed, error))
+
+    def run(self, pool):
+        operations = list(self.args.mix)
+        weights = [self.args.mix[operation] for operation in operations]
+        plan = [self.pick(operations, weights) for _ in range(self.args.requests)]
+
+        started = time.perf_counter()
+        list(pool.map(self.run_one, plan))
+        return time.perf_counter() - started
+
+    # ---------------- REPORTING ----------------
+
+    def report(self, elapsed):
+        total = len(self.results)
+        by_operation = defaultdict(list)
+        for result in self.results:
+            by_operation[result[0]].append(result)
+
+        print(f"\n{total} requests in {elapsed:.2f}s with {self.args.workers} workers -> {total / elapsed:.1f} req/s")
+        print(f"{'operation':<10} {'count':>6} {'2xx':>6} {'4xx':>6} {'503':>6} {'error':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for operation in OPERATIONS:
+            results = by_operation.get(operation)
+            if not results:
+                continue
+            statuses = Counter(
+                'error' if status is None or (status >= 500 and status != 503)
+                else '503' if status == 503
+                else f"{status // 100}xx"
+                for _, status, _, _ in results
+            )
+            latencies = sorted(elapsed * 1000 for _, _, elapsed, _ in results)
+            print(
+                f"{operation:<10} {len(results):>6} {statuses['2xx']:>6} {statuses['4xx']:>6} "
+                f"{statuses['503']:>6} {statuses['error']:>6} {percentile(latencies, 50):>8.1f} "
+                f"{percentile(latencies, 95):>8.1f} {percentile(latencies, 99):>8.1f}"
+            )
+
+        timeouts = sum(1 for _, status, _, _ in self.results if status == 503)
+        print(f"Lock timeouts (503): {timeouts} ({timeouts / total * 100 if total else 0:.2f}%)")
+
+        errors = Counter(error for _, _, _, error in self.results if error)
+        if errors:
+            print("Most common rejections:")
+            for error, count in errors.most_common(5):
+                print(f"  {count:>6}  {error}")
+
+    def report_metrics(self):
+        """Print the server's DB pool and slot lock series (cumulative since it started)"""
+        url = self.base_url.split('/api/')[0] + '/metrics'
+        try:
+            response = self.session.get(url, timeout=self.args.timeout)
+        except requests.RequestException as e:
+            print(f"\nCould not read {url}: {type(e).__name__}")
+            return
+        if response.status_code != 200:
+            print(f"\n{url} answered {response.status_code} (is TOKEN_METRICS on?)")
+            return
+        prefixes = ('opd_db_pool_', 'opd_slot_lock_wait_seconds_sum', 'opd_slot_lock_wait_seconds_count',
+                    'opd_slot_lock_timeouts_total')
+        print(f"\nServer metrics ({url}):")
+        for line in response.text.splitlines():
+            if line.startswith(prefixes) and '_bucket' not in line:
+                print(f"  {line}")
+
+    def verify(self):
+        """
+        Check the queue invariants of every slot after the run
+        Returns: list of violation messages
+        """
+        violations = []
+        bookings = Counter()
+        for slot_id in self.slot_ids:
+            slot = self.call('GET', f"/slots/{slot_id}/").json()
+            tokens = self.call('GET', f"/slots/{slot_id}/tokens/").json()
+            confirmed = [token for token in tokens if token['status'] == 'CONFIRMED']
+
+            numbers = sorted(token['token_number'] for token in confirmed)
+            if numbers != list(range(1, len(confirmed) + 1)):
+                violations.append(f"slot {slot_id}: confirmed token numbers are not 1..{len(confirmed)}: {numbers}")
+            if slot['current_capacity'] > slot['max_capacity']:
+                violations.append(f"slot {slot_id}: current_capacity {slot['current_capacity']} > max {slot['max_capacity']}")
+
+            # Emergencies may exceed capacity; regular bookings may not
+            regular = [token for token in confirmed if token['category'] != 'EMERGENCY']
+            if len(regular) > slot['max_capacity']:
+                violations.append(f"slot {slot_id}: {len(regular)} regular confirmed tokens > max {slot['max_capacity']}")
+            bookings.update(token['patient'] for token in regular)
+
+        # All slots are on the same day
+        for patient_id, count in bookings.items():
+            if count > 1:
+                violations.append(f"patient {patient_id}: {count} confirmed bookings on the same day")
+        return violations
+
+
+def start_in_process_server():
+    """
+    Serve the project from this process on a throwaway test database
+    Redis is replaced by fakeredis, so locks and caches work without a server.
+    Returns: (base_url, stop function)
+    """
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    try:
+        from fakeredis import FakeConnection
+    except ImportError:
+        sys.exit('--in-process needs fakeredis: pip install "fakeredis[lua]"')
+
+    import django
+    from django.conf import settings
+    settings.CACHES['default'].setdefault('OPTIONS', {})['CONNECTION_POOL_KWARGS'] = {
+        'connection_class': FakeConnection
+    }
+    settings.ALLOWED_HOSTS = ['*']
+    django.setup()
+
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+    from django.db import connection
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    connection.close()
+
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_internal_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        from tokens.db_pool.pool import close_pools
+        server.shutdown()
+        server.server_close()
+        # Pooled connections would keep the test database from being dropped
+        close_pools()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    return f"http://127.0.0.1:{server.server_address[1]}/api/v1", stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default=BASE_URL, help=f"API base URL (default {BASE_URL})")
+    parser.add_argument('--in-process', action='store_true', help='Start a server on a test database with fake Redis')
+    parser.add_argument('--workers', type=int, default=50, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=2000, help='Operations to send')
+    parser.add_argument('--slots', type=int, default=3, help='Slots competing for the load')
+    parser.add_argument('--capacity', type=int, default=30, help='max_capacity of each slot')
+    parser.add_argument('--patients', type=int, default=500, help='Size of the patient pool')
+    parser.add_argument('--skew', type=float, default=1.0, help='Zipf exponent for slot choice (0 = uniform)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('book=80,cancel=15,emergency=5'),
+                        help='Operation weights (default book=80,cancel=15,emergency=5); '
+                             'add e.g. delay=2 to include delays, which stop a slot taking new bookings')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for a repeatable run')
+    parser.add_argument('--metrics', action='store_true', help="Print the server's DB pool and lock metrics after the run")
+    args = parser.parse_args()
+
+    stop = None
+    base_url = args.url
+    if args.in_process:
+        base_url, stop = start_in_process_server()
+
+    try:
+        test = LoadTest(base_url, args)
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            test.setup(pool)
+            elapsed = test.run(pool)
+        test.report(elapsed)
+        if args.metrics:
+            test.report_metrics()
+
+        violations = test.verify()
+        if violations:
+            print(f"\n❌ {len(violations)} invariant violations:")
+            for violation in violations:
+                print(f"  {violation}")
+            return 1
+        print("\n✅ Invariants hold: no capacity overrun, dense unique token numbers, one booking per patient per day")
+        return 0
+    finally:
+        if stop:
+            stop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,26 @@
 from django.contrib import admin
-from .models import Doctor, Slot, Patient, Token, WaitingList
+from .models import Doctor, Slot, Patient, Token, WaitingList, DailyReportRollup
+from .queue_cache import bump_queue_version, doctor_renamed, patient_renamed
+
+
+class QueueRowAdmin(admin.ModelAdmin):
+    """Token and waiting-list edits bypass the service, so they invalidate the slots' cached reads"""
+
+    def save_model(self, request, obj, form, change):
+        old_slot_id = form.initial.get('slot') if change else None
+        super().save_model(request, obj, form, change)
+        for slot_id in {obj.slot_id, old_slot_id} - {None}:
+            bump_queue_version(slot_id)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_queue_version(obj.slot_id)
+
+    def delete_queryset(self, request, queryset):
+        slot_ids = set(queryset.values_list('slot_id', flat=True))
+        super().delete_queryset(request, queryset)
+        for slot_id in slot_ids:
+            bump_queue_version(slot_id)
 
 
 @admin.register(Doctor)
@@ -8,6 +29,11 @@ class DoctorAdmin(admin.ModelAdmin):
     search_fields = ['name', 'specialization']
     list_filter = ['specialization']
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:
+            doctor_renamed(obj.id)
+
 
 @admin.register(Slot)
 class SlotAdmin(admin.ModelAdmin):
@@ -23,19 +49,31 @@ class PatientAdmin(admin.ModelAdmin):
     list_display = ['name', 'phone', 'email', 'created_at']
     search_fields = ['name', 'phone', 'email']
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'name' in form.changed_data:
+            patient_renamed(obj.id)
+
 
 @admin.register(Token)
-class TokenAdmin(admin.ModelAdmin):
+class TokenAdmin(QueueRowAdmin):
     list_display = ['token_number', 'patient', 'slot', 'category', 'priority', 'status', 'estimated_time']
     list_filter = ['status', 'category', 'slot__start_time']
     search_fields = ['patient__name', 'slot__doctor__name']
-    readonly_fields = ['priority', 'estimated_time', 'created_at', 'updated_at']
+    readonly_fields = ['priority', 'estimated_time', 'booked_at', 'created_at', 'updated_at']
     date_hierarchy = 'created_at'
 
 
 @admin.register(WaitingList)
-class WaitingListAdmin(admin.ModelAdmin):
+class WaitingListAdmin(QueueRowAdmin):
     list_display = ['patient', 'slot', 'category', 'priority', 'created_at']
     list_filter = ['category', 'slot__start_time']
     search_fields = ['patient__name']
     readonly_fields = ['priority', 'created_at']
+
+
+@admin.register(DailyReportRollup)
+class DailyReportRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'doctor', 'category', 'status', 'tokens', 'slots', 'capacity']
+    list_filter = ['date', 'doctor', 'category', 'status']
+    readonly_fields = ['date', 'doctor', 'category', 'status', 'tokens', 'slots', 'capacity']
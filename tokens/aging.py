@@ -0,0 +1,179 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .etags import touch_slots
+from .events import publish_on_commit
+from .models import Slot, Token, WaitingList, derived_estimated_time, gapped_ordering
+from .queue_engine import SlotQueue
+from .services import TokenAllocationService
+from .waitlist_index import get_waitlist_index
+
+# Ids per UPDATE ... WHERE id IN (...) statement
+WRITE_CHUNK = 500
+
+
+def aged_priorities(categories, booked_at, now):
+    """
+    calculate_priority over parallel columns of categories and booking times
+    Returns: list of priorities, same order as the input columns
+    """
+    service = TokenAllocationService
+    now = now.timestamp()
+    return [
+        round(
+            service.PRIORITY_VALUES.get(category, 5) -
+            min((now - booked.timestamp()) / 3600 * service.TIME_BONUS_PER_HOUR, service.MAX_TIME_BONUS),
+            2
+        )
+        for category, booked in zip(categories, booked_at)
+    ]
+
+
+def write_grouped(model, field, changes):
+    """
+    Store (id, value) pairs with one UPDATE per distinct value
+    Priorities move in 0.01 steps and queue positions repeat from slot to
+    slot, so a pass over any number of rows writes a few hundred distinct
+    values at most.
+    """
+    by_value = defaultdict(list)
+    for row_id, value in changes:
+        by_value[value].append(row_id)
+    for value, row_ids in by_value.items():
+        for start in range(0, len(row_ids), WRITE_CHUNK):
+            model.objects.filter(id__in=row_ids[start:start + WRITE_CHUNK]).update(**{field: value})
+
+
+def queue_order(rows):
+    """
+    Token ids of one slot in aged queue order
+    rows: (id, category, booked_at, priority) in current queue order.
+    Emergencies hold the head in their current order (insert_emergency puts
+    each new one at position 1 with a fixed priority 1.0); everyone else
+    follows by priority, ties by booking time, then by current place.
+    """
+    emergencies = [row[0] for row in rows if row[1] == 'EMERGENCY']
+    others = sorted((row for row in rows if row[1] != 'EMERGENCY'), key=lambda row: (row[3], row[2]))
+    return emergencies + [row[0] for row in others]
+
+
+def age_priorities(now=None, batch_slots=500):
+    """
+    Recompute the time bonus of waiting-list entries and confirmed tokens
+    Covers every open slot, batch_slots slots per transaction. Each batch
+    locks its slot rows in id order before any token row (the order every
+    queue mutation locks in, so a concurrent release waits instead of
+    deadlocking), reads the priority inputs as columns, writes back only changed priorities and re-lays out
+    the queues whose order changed.
+    Returns: Counter of slots, tokens, waiting and reordered
+    """
+    now = now or timezone.now()
+    slot_ids = list(Slot.objects.filter(
+        status__in=['ACTIVE', 'DELAYED'],
+        end_time__gte=now
+    ).order_by('id').values_list('id', flat=True))
+
+    totals = Counter()
+    for start in range(0, len(slot_ids), batch_slots):
+        with transaction.atomic():
+            totals.update(_age_slots(slot_ids[start:start + batch_slots], now))
+    totals['slots'] = len(slot_ids)
+    return totals
+
+
+def _age_slots(slot_ids, now):
+    slots = {slot.id: slot for slot in Slot.objects.select_for_update().filter(id__in=slot_ids).order_by('id')}
+    counts = Counter()
+    # Slots whose queue or waiting list changed
+    touched = set()
+
+    rows = list(Token.objects.filter(
+        slot_id__in=list(slots),
+        status='CONFIRMED'
+    ).order_by('slot_id', 'sort_key', 'token_number').values_list(
+        'id', 'slot_id', 'category', 'booked_at', 'priority', 'token_number'
+    ))
+    if rows:
+        token_ids, token_slots, categories, booked, priorities, numbers = zip(*rows)
+        aged = aged_priorities(categories, booked, now)
+        # Emergency tokens keep the fixed priority insert_emergency gave them
+        aged = [old if category == 'EMERGENCY' else new for category, old, new in zip(categories, priorities, aged)]
+        changed = [(token_id, new) for token_id, old, new in zip(token_ids, priorities, aged) if new != old]
+        write_grouped(Token, 'priority', changed)
+        counts['tokens'] = len(changed)
+
+        touched = {slot_id for slot_id, old, new in zip(token_slots, priorities, aged) if new != old}
+        queues = defaultdict(list)
+        for row in zip(token_ids, token_slots, categories, booked, aged):
+            if row[1] in touched:
+                queues[row[1]].append((row[0], row[2], row[3], row[4]))
+        reordered = {}
+        for slot_id, queue in queues.items():
+            order = queue_order(queue)
+            if order != [row[0] for row in queue]:
+                reordered[slot_id] = order
+        _write_layout(slots, reordered, dict(zip(token_ids, numbers)))
+        counts['reordered'] = len(reordered)
+        for slot_id in reordered:
+            publish_on_commit(slot_id, slots[slot_id].queue_version + 1, [{'type': 'reordered'}])
+
+    waiting = list(WaitingList.objects.filter(
+        slot_id__in=list(slots)
+    ).order_by().values_list('id', 'slot_id', 'category', 'created_at', 'priority'))
+    if waiting:
+        entry_ids, entry_slots, categories, created, priorities = zip(*waiting)
+        aged = aged_priorities(categories, created, now)
+        changed = [row for row in zip(entry_ids, entry_slots, categories, created, priorities, aged) if row[5] != row[4]]
+        write_grouped(WaitingList, 'priority', [(row[0], row[5]) for row in changed])
+        get_waitlist_index().add([
+            WaitingList(id=entry_id, slot=slots[slot_id], category=category, created_at=booked, priority=new)
+            for entry_id, slot_id, category, booked, _, new in changed
+        ])
+        counts['waiting'] = len(changed)
+        touched.update(row[1] for row in changed)
+
+    # Cached queues and boards carry priorities, so every touched slot gets a new version
+    if touched:
+        Slot.objects.filter(id__in=touched).update(queue_version=F('queue_version') + 1)
+        touch_slots(touched)
+    return counts
+
+
+def _write_layout(slots, reordered, numbers):
+    """
+    Store new queue orders ({slot_id: token ids in order})
+    numbers maps token ids to their current token_number. Gapped ordering
+    rewrites sort keys; dense ordering parks the moved tokens on negative
+    numbers first so the unique live-number constraint never sees two
+    tokens on one number, then flips them back in one statement per chunk.
+    """
+    if not reordered:
+        return
+    if gapped_ordering():
+        write_grouped(Token, 'sort_key', [
+            (token_id, index * SlotQueue.SORT_KEY_GAP)
+            for order in reordered.values()
+            for index, token_id in enumerate(order)
+        ])
+        return
+
+    moved = [
+        (token_id, -position)
+        for order in reordered.values()
+        for position, token_id in enumerate(order, start=1)
+        if numbers[token_id] != position
+    ]
+    write_grouped(Token, 'token_number', moved)
+    for start in range(0, len(moved), WRITE_CHUNK):
+        Token.objects.filter(
+            id__in=[token_id for token_id, _ in moved[start:start + WRITE_CHUNK]]
+        ).update(token_number=-F('token_number'))
+
+    if not derived_estimated_time():
+        for slot_id in reordered:
+            Token.objects.filter(slot_id=slot_id, status='CONFIRMED').update(
+                estimated_time=TokenAllocationService._estimated_time_expression(slots[slot_id])
+            )
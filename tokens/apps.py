@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 class TokensConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tokens'
     verbose_name = 'Token Management'
+
+    def ready(self):
+        if getattr(settings, 'TOKEN_SQL_TRACE', False):
+            from .sql_trace import install_trace_wrapper
+            connection_created.connect(install_trace_wrapper)
+        if getattr(settings, 'TOKEN_ETAGS', True):
+            from .etags import connect_signals
+            connect_signals()
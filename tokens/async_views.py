@@ -0,0 +1,236 @@
+import json
+
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from .booking_guard import get_booking_guard
+from .models import Slot, Token
+from .serializers import (
+    SlotSerializer, TokenSerializer, TokenCreateSerializer,
+    EmergencyTokenSerializer, SlotDelaySerializer, BulkTokenCreateSerializer
+)
+from .views import TokenViewSet, bulk_response_data, emergency_response_data
+from .workers import arun_bulk_allocation, arun_slot_operation, run_in_db_thread
+
+
+def json_renderer():
+    """The API's configured JSON renderer, so both request paths return the same bytes"""
+    for renderer_class in api_settings.DEFAULT_RENDERER_CLASSES:
+        if issubclass(renderer_class, JSONRenderer):
+            return renderer_class()
+    return JSONRenderer()
+
+
+def api_response(data, status=200):
+    renderer = json_renderer()
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
+
+
+def parse_json(request):
+    """
+    Decode a JSON request body
+    Returns: (data, error_response)
+    """
+    try:
+        return json.loads(request.body or b'{}'), None
+    except ValueError as e:
+        return None, api_response({'detail': f'JSON parse error - {e}'}, status=400)
+
+
+def lock_error(e):
+    return api_response({'error': f'Failed to acquire lock: {str(e)}'}, status=503)
+
+
+def not_found():
+    return api_response({'detail': 'Not found.'}, status=404)
+
+
+def serialize_token(token):
+    return TokenSerializer(token).data
+
+
+def token_slot_id(token_id):
+    return Token.objects.filter(id=token_id).values_list('slot_id', flat=True).first()
+
+
+def slot_data(slot_id):
+    slot = Slot.objects.select_related('doctor').filter(id=slot_id).first()
+    return SlotSerializer(slot).data if slot else None
+
+
+class AsyncSlotView(View):
+    """
+    Async endpoint for a slot mutation
+    Waiting for the slot lock (or shard worker) suspends the coroutine, so a
+    single ASGI process can keep thousands of queued requests without a thread
+    each; ORM work runs on the bounded DB pool. HTTP methods listed in
+    viewset_actions are served by the regular DRF viewset on that pool.
+    """
+
+    viewset = None
+    viewset_actions = {}
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    def dispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        if method in self.viewset_actions or (method == 'head' and 'get' in self.viewset_actions):
+            return self.delegate(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def _allowed_methods(self):
+        return super()._allowed_methods() + [method.upper() for method in self.viewset_actions]
+
+    async def delegate(self, request, *args, **kwargs):
+        view = self.viewset.as_view(self.viewset_actions)
+
+        def call():
+            return view(request, *args, **kwargs).render()
+
+        return await run_in_db_thread(call)
+
+
+class TokenListView(AsyncSlotView):
+    viewset = TokenViewSet
+    viewset_actions = {'get': 'list'}
+
+    async def post(self, request):
+        """Request a new token with priority-based allocation"""
+        data, error_response = parse_json(request)
+        if error_response:
+            return error_response
+
+        serializer = TokenCreateSerializer(data=data)
+        if not serializer.is_valid():
+            return api_response(serializer.errors, status=400)
+
+        slot_id = serializer.validated_data['slot_id']
+        patient_id = serializer.validated_data['patient_id']
+        if await run_in_db_thread(get_booking_guard().already_booked, slot_id, patient_id):
+            return api_response({'error': "Patient already has a booking for this day"}, status=400)
+
+        try:
+            token, error = await arun_slot_operation(
+                slot_id, 'allocate_token', slot_id, patient_id,
+                serializer.validated_data['category']
+            )
+        except Exception as e:
+            return lock_error(e)
+
+        if not token:
+            return api_response({'error': error}, status=400)
+        return api_response(await run_in_db_thread(serialize_token, token), status=201)
+
+
+class TokenBulkView(AsyncSlotView):
+    async def post(self, request):
+        """Allocate a batch of tokens across one or more slots"""
+        data, error_response = parse_json(request)
+        if error_response:
+            return error_response
+
+        serializer = BulkTokenCreateSerializer(data=data)
+        if not serializer.is_valid():
+            return api_response(serializer.errors, status=400)
+
+        try:
+            results = await arun_bulk_allocation(serializer.validated_data['allocations'])
+        except Exception as e:
+            return lock_error(e)
+
+        return api_response(await run_in_db_thread(bulk_response_data, results))
+
+
+class TokenEmergencyView(AsyncSlotView):
+    async def post(self, request):
+        """Insert an emergency patient at position 1"""
+        data, error_response = parse_json(request)
+        if error_response:
+            return error_response
+
+        serializer = EmergencyTokenSerializer(data=data)
+        if not serializer.is_valid():
+            return api_response(serializer.errors, status=400)
+
+        slot_id = serializer.validated_data['slot_id']
+        try:
+            token, error = await arun_slot_operation(
+                slot_id, 'insert_emergency', slot_id, serializer.validated_data['patient_id']
+            )
+        except Exception as e:
+            return lock_error(e)
+
+        if not token:
+            return api_response({'error': error}, status=400)
+        return api_response(await run_in_db_thread(emergency_response_data, token), status=201)
+
+
+class TokenDetailView(AsyncSlotView):
+    viewset = TokenViewSet
+    viewset_actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update'}
+
+    async def delete(self, request, pk):
+        """Cancel a token"""
+        slot_id = await run_in_db_thread(token_slot_id, pk)
+        if slot_id is None:
+            return not_found()
+
+        try:
+            success, message = await arun_slot_operation(slot_id, 'cancel_token', pk)
+        except Exception as e:
+            return lock_error(e)
+
+        if not success:
+            return api_response({'error': message}, status=400)
+        return api_response({'message': message})
+
+
+class TokenNoShowView(AsyncSlotView):
+    async def post(self, request, pk):
+        """Mark a token as no-show"""
+        slot_id = await run_in_db_thread(token_slot_id, pk)
+        if slot_id is None:
+            return not_found()
+
+        try:
+            success, message = await arun_slot_operation(slot_id, 'mark_no_show', pk)
+        except Exception as e:
+            return lock_error(e)
+
+        if not success:
+            return api_response({'error': message}, status=400)
+        return api_response({'message': message})
+
+
+class SlotDelayView(AsyncSlotView):
+    async def put(self, request, pk):
+        """Mark a slot as delayed and update all token times"""
+        if not await run_in_db_thread(Slot.objects.filter(id=pk).exists):
+            return not_found()
+
+        data, error_response = parse_json(request)
+        if error_response:
+            return error_response
+
+        serializer = SlotDelaySerializer(data=data)
+        if not serializer.is_valid():
+            return api_response(serializer.errors, status=400)
+
+        try:
+            success, message = await arun_slot_operation(
+                pk, 'delay_slot', pk, serializer.validated_data['delay_minutes']
+            )
+        except Exception as e:
+            return lock_error(e)
+
+        if not success:
+            return api_response({'error': message}, status=400)
+        return api_response({
+            'message': message,
+            'slot': await run_in_db_thread(slot_data, pk)
+        })
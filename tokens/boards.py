@@ -0,0 +1,141 @@
+from .models import Token, WaitingList, derived_estimated_time, gapped_ordering
+from .queue_cache import get_queue_cache
+
+# Dictionaries for the category and status columns, sent with full snapshots
+CATEGORIES = [code for code, _ in Token.CATEGORY_CHOICES]
+STATUSES = [code for code, _ in Token.STATUS_CHOICES]
+
+# Slot columns read alongside the rows, so the header and the version come
+# from the same statement as the rows they describe
+HEADER_COLUMNS = (
+    'slot__queue_version', 'slot__status', 'slot__delay_minutes',
+    'slot__start_time', 'slot__end_time', 'slot__doctor__name',
+)
+
+
+def epoch(value):
+    """Whole seconds since the Unix epoch (None stays None)"""
+    return None if value is None else int(value.timestamp())
+
+
+class TokenBoard:
+    """
+    A slot's queue as compact rows
+    [id (16 bytes), number, patient name, category index, status index,
+    priority, estimated time], in queue order.
+    """
+
+    name = 'tokens'
+
+    def read(self, slot):
+        number = 'queue_position' if gapped_ordering() else 'token_number'
+        estimate = 'queue_estimated_time' if derived_estimated_time() else 'estimated_time'
+        return Token.objects.filter(slot=slot).in_queue_order().values_list(
+            'id', number, 'patient__name', 'category', 'status', 'priority', estimate, *HEADER_COLUMNS
+        )
+
+    def row(self, values):
+        token_id, number, patient_name, category, status, priority, estimated_time = values
+        return [
+            token_id.bytes, number, patient_name, CATEGORIES.index(category),
+            STATUSES.index(status), priority, epoch(estimated_time),
+        ]
+
+
+class WaitingBoard:
+    """
+    A slot's waiting list as compact rows
+    [id (16 bytes), patient name, category index, priority, booked at],
+    best priority first.
+    """
+
+    name = 'waiting'
+
+    def read(self, slot):
+        return WaitingList.objects.filter(slot=slot).order_by('priority', 'created_at').values_list(
+            'id', 'patient__name', 'category', 'priority', 'created_at', *HEADER_COLUMNS
+        )
+
+    def row(self, values):
+        entry_id, patient_name, category, priority, created_at = values
+        return [entry_id.bytes, patient_name, CATEGORIES.index(category), priority, epoch(created_at)]
+
+
+BOARDS = {board.name: board for board in (TokenBoard(), WaitingBoard())}
+
+
+def build_board(board, slot):
+    """
+    Read a board for a slot (one query)
+    Returns: {'version', 'header', 'rows'}
+    """
+    width = len(HEADER_COLUMNS)
+    values = list(board.read(slot))
+    if values:
+        version, status, delay, start, end, doctor = values[0][-width:]
+    else:
+        version, status, delay = slot.queue_version, slot.status, slot.delay_minutes
+        start, end, doctor = slot.start_time, slot.end_time, slot.doctor.name
+    return {
+        'version': version,
+        'header': {
+            'doctor': doctor,
+            'start': epoch(start),
+            'end': epoch(end),
+            'status': status,
+            'delay': delay,
+        },
+        'rows': [board.row(row[:-width]) for row in values],
+    }
+
+
+def board_snapshot(board, slot, since=None):
+    """
+    Response body for a board request
+    A full snapshot carries the header, the category and status dictionaries
+    and every row. When `since` names a version still held by the queue
+    cache, only the rows added or changed since then (`upsert`) and the ids
+    of rows gone since then (`remove`) are sent, with `base` set to `since`.
+    """
+    cache = get_queue_cache()
+    current = _load(cache, board, slot.id, slot.queue_version)
+    if current is None:
+        current = build_board(board, slot)
+        # An empty board took its version from the slot row read earlier,
+        # which may predate the rows; it is cheap to rebuild, so not stored
+        if current['rows']:
+            _store(cache, board, slot.id, current)
+
+    data = {'slot': slot.id.bytes, 'version': current['version'], **current['header']}
+    base = None
+    if since is not None:
+        base = current if since == current['version'] else _load(cache, board, slot.id, since)
+    if base is None:
+        data.update(categories=CATEGORIES, statuses=STATUSES)
+        data[board.name] = current['rows']
+        return data
+
+    previous = {row[0]: row for row in base['rows']}
+    ids = {row[0] for row in current['rows']}
+    data['base'] = since
+    data['upsert'] = [row for row in current['rows'] if previous.get(row[0]) != row]
+    data['remove'] = [row_id for row_id in previous if row_id not in ids]
+    return data
+
+
+def _key(board, slot_id, version):
+    return f"board:{board.name}:{slot_id}:{version}"
+
+
+def _load(cache, board, slot_id, version):
+    try:
+        return cache.get(_key(board, slot_id, version))
+    except Exception:
+        return None
+
+
+def _store(cache, board, slot_id, snapshot):
+    try:
+        cache.set(_key(board, slot_id, snapshot['version']), snapshot)
+    except Exception:
+        pass
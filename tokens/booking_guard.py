@@ -0,0 +1,103 @@
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Slot
+
+
+class NullBookingGuard:
+    """
+    Early rejection of same-day duplicate bookings
+    Keeps one Redis set per day of the patients holding a confirmed token,
+    so a duplicate request can be refused before the slot lock and the
+    allocation transaction. The set is advisory: sets are only written after
+    commit, so the indexed check inside allocate_token stays authoritative
+    and a missing or unreachable set just means the request takes the normal
+    path. This base class tracks nothing (TOKEN_BOOKING_GUARD=off).
+    """
+
+    name = 'off'
+
+    def already_booked(self, slot_id, patient_id):
+        return False
+
+    def add(self, day, patient_ids):
+        """Record confirmed bookings once the current transaction commits"""
+
+    def remove(self, day, patient_ids):
+        """Forget released bookings once the current transaction commits"""
+
+
+class RedisBookingGuard(NullBookingGuard):
+    """Per-day patient sets in the default Redis, expiring the day after"""
+
+    name = 'redis'
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self._client = get_redis_connection('default')
+
+    def key(self, day):
+        return cache.make_key(f"booked_patients:{day.isoformat()}")
+
+    def already_booked(self, slot_id, patient_id):
+        start_time = Slot.objects.filter(id=slot_id).values_list('start_time', flat=True).first()
+        if start_time is None:
+            return False
+        try:
+            return bool(self._client.sismember(self.key(timezone.localdate(start_time)), str(patient_id)))
+        except Exception:
+            return False
+
+    def add(self, day, patient_ids):
+        members = [str(patient_id) for patient_id in patient_ids]
+        if not members:
+            return
+        expires = datetime.combine(day + timedelta(days=2), time.min, tzinfo=timezone.get_current_timezone())
+
+        def write():
+            try:
+                pipe = self._client.pipeline()
+                pipe.sadd(self.key(day), *members)
+                pipe.expireat(self.key(day), int(expires.timestamp()))
+                pipe.execute()
+            except Exception:
+                pass
+
+        transaction.on_commit(write)
+
+    def remove(self, day, patient_ids):
+        members = [str(patient_id) for patient_id in patient_ids]
+        if not members:
+            return
+
+        def write():
+            try:
+                self._client.srem(self.key(day), *members)
+            except Exception:
+                pass
+
+        transaction.on_commit(write)
+
+
+BOOKING_GUARDS = {
+    'off': NullBookingGuard,
+    'redis': RedisBookingGuard,
+}
+
+_booking_guard = None
+
+
+def get_booking_guard():
+    """Return the guard selected by settings.TOKEN_BOOKING_GUARD"""
+    global _booking_guard
+    name = getattr(settings, 'TOKEN_BOOKING_GUARD', 'off')
+    if _booking_guard is None or _booking_guard.name != name:
+        try:
+            _booking_guard = BOOKING_GUARDS[name]()
+        except KeyError:
+            raise ValueError(f"Unknown TOKEN_BOOKING_GUARD: {name}")
+    return _booking_guard
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from django.utils.asyncio import async_unsafe
+
+from .pool import get_pool
+
+
+def pool_options():
+    return {
+        'min_size': getattr(settings, 'TOKEN_DB_POOL_MIN_SIZE', 2),
+        'max_size': getattr(settings, 'TOKEN_DB_POOL_MAX_SIZE', 10),
+        'timeout': getattr(settings, 'TOKEN_DB_POOL_TIMEOUT', 5),
+        'check_after': getattr(settings, 'TOKEN_DB_POOL_CHECK_AFTER', 30),
+        'max_idle': getattr(settings, 'TOKEN_DB_POOL_MAX_IDLE', 300),
+    }
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend whose connections come from a per-process pool
+    Django's connect()/close() become a checkout and a return, so with
+    CONN_MAX_AGE=0 a thread holds a connection only for the length of a
+    request and the pool caps the connections the whole process opens.
+    """
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = get_pool(conn_params, pool_options())
+        connection = pool.getconn(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # Normally set while connecting; a reused connection keeps the level
+        # it was opened with
+        self.isolation_level = IsolationLevel(
+            self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED)
+        )
+        self._pool = pool
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._pool.putconn(self.connection)
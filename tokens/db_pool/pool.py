@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+from ..metrics import POOL_TIMEOUTS, POOL_WAIT, metrics_enabled
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """No pooled connection became free within the checkout timeout"""
+
+
+class ConnectionPool:
+    """
+    Bounded set of connections to one database, shared by a process's threads
+    Connections are opened on demand, up to max_size at once; a checkout
+    beyond that waits up to `timeout` seconds for one to come back and then
+    raises PoolTimeout. A connection idle for `check_after` seconds is pinged
+    before it is handed out (replaced if the ping fails), and idle ones
+    beyond min_size are closed after `max_idle` seconds.
+    """
+
+    def __init__(self, name, min_size, max_size, timeout, check_after, max_idle):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_idle = max_idle
+        # (connection, returned_at); checkouts take the most recent, so the
+        # oldest ones are those left to expire when load drops
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.timeouts = 0
+
+    def getconn(self, connect):
+        """Check out a connection, opening one with connect() when the pool has room"""
+        started = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = started + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        if metrics_enabled():
+                            POOL_TIMEOUTS.inc(database=self.name)
+                        raise PoolTimeout(
+                            f"No database connection free after {self.timeout}s "
+                            f"({self.max_size} in use, TOKEN_DB_POOL_MAX_SIZE)"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                else:
+                    # Reserve the place now, connect outside the lock
+                    connection, returned_at = None, None
+                    self._size += 1
+            finally:
+                self._waiting -= 1
+        if metrics_enabled():
+            POOL_WAIT.observe(time.monotonic() - started, database=self.name)
+
+        if connection is not None:
+            if self._healthy(connection, returned_at):
+                return connection
+            _close_quietly(connection)
+        try:
+            return connect()
+        except Exception:
+            self._release_place()
+            raise
+
+    def putconn(self, connection):
+        """Return a connection; one left in a transaction is rolled back, a broken one closed"""
+        if not connection.closed:
+            status = connection.get_transaction_status()
+            if status in (extensions.TRANSACTION_STATUS_INTRANS, extensions.TRANSACTION_STATUS_INERROR):
+                try:
+                    connection.rollback()
+                except psycopg2.Error:
+                    pass
+        if connection.closed or connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            _close_quietly(connection)
+            self._release_place()
+            return
+
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            if self._closed:
+                expired.append(connection)
+                self._size -= 1
+            else:
+                self._idle.append((connection, now))
+                while len(self._idle) > 1 and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+                    expired.append(self._idle.popleft()[0])
+                    self._size -= 1
+            self._cond.notify()
+        for stale in expired:
+            _close_quietly(stale)
+
+    def close(self):
+        """Close idle connections; those checked out are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for connection in idle:
+            _close_quietly(connection)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                'database': self.name,
+                'size': self._size,
+                'idle': idle,
+                'in_use': self._size - idle,
+                'waiting': self._waiting,
+                'timeouts': self.timeouts,
+            }
+
+    def _healthy(self, connection, returned_at):
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _release_place(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except psycopg2.Error:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(conn_params, options):
+    """
+    The process's pool for a set of connection parameters
+    Keyed by the parameters, so the test database and the 'postgres'
+    maintenance connection never share a pool with the main database.
+    """
+    key = tuple(sorted((name, repr(value)) for name, value in conn_params.items()))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(conn_params.get('dbname') or '', **options)
+        return pool
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_pools():
+    """Close every pool in this process (before dropping a database, at shutdown)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,176 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Doctor, Patient, Slot, Token, WaitingList
+
+# Generation keys: any slot's queue or fields, and one slot
+SLOTS_KEY = 'etag:slots'
+SLOT_KEY = 'etag:slot:{slot_id}'
+
+
+def etags_enabled():
+    return getattr(settings, 'TOKEN_ETAGS', True)
+
+
+def new_generation():
+    return uuid.uuid4().hex
+
+
+def _set_generations(keys):
+    generation = new_generation()
+    try:
+        cache.set_many({key: generation for key in keys}, getattr(settings, 'TOKEN_ETAG_TTL', 86400))
+    except Exception:
+        # Unreachable cache: readers cannot confirm a match either (see generations)
+        pass
+
+
+def touch_slots(slot_ids):
+    """Give the slots (and every listing) new ETags once the transaction commits"""
+    if not etags_enabled():
+        return
+    keys = [SLOTS_KEY, *(SLOT_KEY.format(slot_id=slot_id) for slot_id in slot_ids)]
+    transaction.on_commit(lambda: _set_generations(keys))
+
+
+def generations(slot_id=None):
+    """
+    Current generations for a scope (all slots, or one slot)
+    Missing keys are started with a fresh generation. Returns None when the
+    cache cannot be read, so no ETag is sent or matched.
+    """
+    keys = [SLOT_KEY.format(slot_id=slot_id) if slot_id else SLOTS_KEY]
+    try:
+        values = cache.get_many(keys)
+        for key in keys:
+            if key not in values:
+                cache.add(key, new_generation(), getattr(settings, 'TOKEN_ETAG_TTL', 86400))
+                values[key] = cache.get(key)
+    except Exception:
+        return None
+    if any(values[key] is None for key in keys):
+        return None
+    return [values[key] for key in keys]
+
+
+def slot_changed(sender, instance, **kwargs):
+    touch_slots([instance.pk])
+
+
+def named_slot_ids(model, pk):
+    """Slots whose responses show a doctor's or patient's name"""
+    if model is Doctor:
+        return set(Slot.objects.filter(doctor_id=pk).values_list('id', flat=True))
+    return (
+        set(Token.objects.filter(patient_id=pk).values_list('slot_id', flat=True)) |
+        set(WaitingList.objects.filter(patient_id=pk).values_list('slot_id', flat=True))
+    )
+
+
+def name_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Note the name a doctor or patient is saved over"""
+    instance._etag_old_name = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is None or 'name' in update_fields:
+        instance._etag_old_name = sender.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+def name_changed(sender, instance, created=False, **kwargs):
+    """Renew only the slots showing a renamed doctor or patient"""
+    old_name = getattr(instance, '_etag_old_name', None)
+    if created or old_name is None or old_name == instance.name:
+        return
+    touch_slots(named_slot_ids(sender, instance.pk))
+
+
+def queue_row_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Note the slot a token or waiting entry is being moved out of"""
+    instance._etag_old_slot_id = None
+    if raw or instance._state.adding:
+        return
+    if update_fields is None or {'slot', 'slot_id'} & set(update_fields):
+        instance._etag_old_slot_id = sender.objects.filter(pk=instance.pk).values_list('slot_id', flat=True).first()
+
+
+def queue_row_changed(sender, instance, **kwargs):
+    touch_slots({instance.slot_id, getattr(instance, '_etag_old_slot_id', None)} - {None})
+
+
+def connect_signals():
+    """
+    Writes that may bypass the service (API, admin, shell) renew ETags
+    Slot, token and waiting-list rows renew their slots (a moved row both
+    of them). A renamed doctor or patient renews the slots showing the name;
+    new ones appear nowhere yet, and deleting one deletes (and signals) its
+    slots, tokens and waiting entries.
+    """
+    for signal in (post_save, post_delete):
+        signal.connect(slot_changed, sender=Slot, dispatch_uid=f'etag_slot_{signal is post_save}')
+        for model in (Token, WaitingList):
+            signal.connect(queue_row_changed, sender=model, dispatch_uid=f'etag_{model.__name__}_{signal is post_save}')
+    for model in (Token, WaitingList):
+        pre_save.connect(queue_row_saving, sender=model, dispatch_uid=f'etag_{model.__name__}_pre_save')
+    for model in (Doctor, Patient):
+        pre_save.connect(name_saving, sender=model, dispatch_uid=f'etag_{model.__name__}_pre_save')
+        post_save.connect(name_changed, sender=model, dispatch_uid=f'etag_{model.__name__}_True')
+
+
+class ConditionalGetMixin:
+    """
+    Strong ETags and If-None-Match for viewset reads
+    The ETag hashes the scope's generations (renewed after every committed
+    change, see touch_slots), the full path and the negotiated media type,
+    so it is known before any query runs. A match is answered with 304
+    after content negotiation and permission checks, without calling the
+    handler. Views list the actions in etag_actions and may scope an action
+    to one slot with etag_slot_id().
+    """
+
+    etag_actions = ('list', 'retrieve')
+
+    def etag_slot_id(self, request):
+        """Slot the current action reads, or None for any slot"""
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        if not etags_enabled() or request.method not in ('GET', 'HEAD') or self.action not in self.etag_actions:
+            return
+        scope = generations(self.etag_slot_id(request))
+        if scope is None:
+            return
+        digest = hashlib.blake2b(
+            '|'.join([*scope, request.get_full_path(), request.accepted_media_type]).encode(),
+            digest_size=16
+        ).hexdigest()
+        self.etag = f'"{digest}"'
+        matches = parse_etags(request.headers.get('If-None-Match', ''))
+        if self.etag in matches or '*' in matches:
+            raise NotModified
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'etag', None) and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            patch_vary_headers(response, ['Accept'])
+        return response
+
+
+class NotModified(Exception):
+    """Raised from ConditionalGetMixin.initial on an If-None-Match hit"""
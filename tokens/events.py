@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger('tokens.events')
+
+# Service outcome -> event type for released tokens
+RELEASE_EVENTS = {'CANCELLED': 'cancelled', 'NO_SHOW': 'no_show'}
+
+
+def token_event(kind, token, position=None):
+    """Event for one token; position is its place in the queue after the change"""
+    return {
+        'type': kind,
+        'token': str(token.id),
+        'category': token.category,
+        'status': token.status,
+        'position': position,
+    }
+
+
+def publish_on_commit(slot_id, version, events):
+    """
+    Publish a slot's queue events once the surrounding transaction commits
+    version is the Slot.queue_version the change produced (None when not
+    known), so a client can fetch the board delta since its last version.
+    """
+    broker = get_event_broker()
+    if broker.name == 'off' or not events:
+        return
+    events = [{'slot': str(slot_id), 'version': version, **event} for event in events]
+
+    def publish():
+        try:
+            broker.publish(slot_id, events)
+        except Exception:
+            # The change is committed; listeners resync on their next poll
+            logger.exception("Failed to publish queue events for slot %s", slot_id)
+
+    transaction.on_commit(publish)
+
+
+class Subscription:
+    """
+    One client's bounded event buffer
+    Events are pushed from any thread. When the client falls more than
+    `size` events behind, the buffer is dropped and the next batch is a
+    single resync event telling it to reload the slot's board.
+    """
+
+    RESYNC = {'type': 'resync'}
+
+    def __init__(self, slot_id, size, loop=None):
+        self.slot_id = slot_id
+        self.size = size
+        self._events = deque()
+        self._overflowed = False
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._ready = asyncio.Event() if loop else threading.Event()
+
+    def push(self, events):
+        """Buffer events; returns False if that overflowed the buffer"""
+        with self._lock:
+            overflowed = self._overflowed or len(self._events) + len(events) > self.size
+            if overflowed:
+                self._events.clear()
+                self._overflowed = True
+            else:
+                self._events.extend(events)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        else:
+            self._ready.set()
+        return not overflowed
+
+    def drain(self):
+        with self._lock:
+            events = [{'slot': str(self.slot_id), **self.RESYNC}] if self._overflowed else list(self._events)
+            self._events.clear()
+            self._overflowed = False
+            self._ready.clear()
+        return events
+
+    def wait(self, timeout):
+        """Next batch of events, or [] after timeout seconds (blocking)"""
+        self._ready.wait(timeout)
+        return self.drain()
+
+    async def await_events(self, timeout):
+        """Next batch of events, or [] after timeout seconds (on the subscription's loop)"""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.drain()
+
+
+class NullEventBroker:
+    """
+    Fan-out of queue events to streaming clients
+    This base class publishes nothing and refuses subscribers
+    (TOKEN_EVENT_BROKER=off).
+    """
+
+    name = 'off'
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+        self.overflows = 0
+
+    def publish(self, slot_id, events):
+        pass
+
+    def subscribe(self, slot_id, loop=None):
+        """
+        Register a client for a slot's events
+        Pass the running event loop from async code so wake-ups are
+        scheduled on it.
+        """
+        subscription = Subscription(slot_id, getattr(settings, 'TOKEN_EVENT_BUFFER', 100), loop)
+        with self._lock:
+            self._subscriptions[str(slot_id)].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(str(subscription.slot_id))
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[str(subscription.slot_id)]
+
+    def deliver(self, slot_id, events):
+        """Hand events to this process's subscribers of the slot"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(str(slot_id), ()))
+        for subscription in subscriptions:
+            if not subscription.push(events):
+                self.overflows += 1
+
+    def stats(self):
+        with self._lock:
+            subscribers = sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+        return {'backend': self.name, 'subscribers': subscribers, 'overflows': self.overflows}
+
+
+class LocalEventBroker(NullEventBroker):
+    """
+    Events reach subscribers in this process only
+    Valid when one process serves both the writes and the streams
+    (runserver, a single ASGI worker).
+    """
+
+    name = 'local'
+
+    def publish(self, slot_id, events):
+        self.deliver(slot_id, events)
+
+
+class RedisEventBroker(NullEventBroker):
+    """
+    Events go through Redis pub/sub, so every process sees every write
+    Each process runs one listener thread on a pattern subscription and
+    fans messages out to its own subscribers; slots nobody here watches
+    are dropped on arrival.
+    """
+
+    name = 'redis'
+    CHANNEL = 'queue_events:{slot_id}'
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def publish(self, slot_id, events):
+        from django_redis import get_redis_connection
+        channel = cache.make_key(self.CHANNEL.format(slot_id=slot_id))
+        get_redis_connection('default').publish(channel, json.dumps(events))
+
+    def subscribe(self, slot_id, loop=None):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='queue-events', daemon=True)
+                self._listener.start()
+        return super().subscribe(slot_id, loop)
+
+    def _listen(self):
+        from django_redis import get_redis_connection
+        pattern = cache.make_key(self.CHANNEL.format(slot_id='*'))
+        while True:
+            try:
+                pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(pattern)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    events = json.loads(message['data'])
+                    if events:
+                        self.deliver(events[0]['slot'], events)
+            except Exception:
+                logger.exception("Queue event listener failed; reconnecting")
+                time.sleep(1)
+
+
+EVENT_BROKERS = {
+    'off': NullEventBroker,
+    'local': LocalEventBroker,
+    'redis': RedisEventBroker,
+}
+
+_event_broker = None
+
+
+def get_event_broker():
+    """Return the broker selected by settings.TOKEN_EVENT_BROKER"""
+    global _event_broker
+    name = getattr(settings, 'TOKEN_EVENT_BROKER', 'off')
+    if _event_broker is None or _event_broker.name != name:
+        try:
+            _event_broker = EVENT_BROKERS[name]()
+        except KeyError:
+            raise ValueError(f"Unknown TOKEN_EVENT_BROKER: {name}")
+    return _event_broker
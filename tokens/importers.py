@@ -0,0 +1,127 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+
+from .models import Patient
+from .serializers import PatientSerializer
+
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+
+
+def detect_format(content_type='', filename=''):
+    """Guess the import format from a content type or file name"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    filename = (filename or '').lower()
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl') \
+            or filename.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if content_type in ('text/csv', 'application/csv') or filename.endswith('.csv'):
+        return 'csv'
+    return None
+
+
+class PatientImporter:
+    """
+    Streams patient rows from CSV or NDJSON into the patients table
+    Rows are read lazily and handled one chunk at a time: validated with
+    PatientSerializer, de-duplicated on phone (within the chunk and against
+    existing patients) and inserted with bulk_create, so memory stays flat
+    whatever the size of the file. Each chunk commits on its own.
+    """
+
+    def __init__(self, batch_size=None, max_errors=1000):
+        self.batch_size = batch_size or getattr(settings, 'PATIENT_IMPORT_BATCH_SIZE', 1000)
+        self.max_errors = max_errors
+        self.processed = 0
+        self.created = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors = []
+
+    def iter_rows(self, lines, fmt):
+        """Yield (line_number, row) from an iterable of text lines"""
+        if fmt == 'csv':
+            reader = csv.DictReader(lines)
+            for row in reader:
+                yield reader.line_num, row
+        elif fmt == 'ndjson':
+            for line_number, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {'__error__': f"Invalid JSON: {e}"}
+                yield line_number, row
+        else:
+            raise ValueError(f"Unsupported import format: {fmt}")
+
+    def import_chunks(self, lines, fmt):
+        """Import chunk by chunk, yielding the running counts after each"""
+        rows = self.iter_rows(lines, fmt)
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk)
+            yield self.summary(include_errors=False)
+
+    def run(self, lines, fmt, progress=None):
+        """
+        Import all rows; progress is called with the running counts after each chunk
+        Returns: summary dict
+        """
+        for counts in self.import_chunks(lines, fmt):
+            if progress:
+                progress(counts)
+        return self.summary()
+
+    def summary(self, include_errors=True):
+        summary = {
+            'processed': self.processed,
+            'created': self.created,
+            'duplicates': self.duplicates,
+            'failed': self.failed,
+        }
+        if include_errors:
+            summary['errors'] = self.errors
+        return summary
+
+    def _import_chunk(self, chunk):
+        candidates = {}
+        for line_number, row in chunk:
+            self.processed += 1
+            if not isinstance(row, dict) or '__error__' in row:
+                error = row.get('__error__') if isinstance(row, dict) else "Row must be an object"
+                self._record_error(line_number, {'non_field_errors': [error]})
+                continue
+
+            serializer = PatientSerializer(data=row)
+            if not serializer.is_valid():
+                self._record_error(line_number, dict(serializer.errors))
+                continue
+
+            phone = serializer.validated_data['phone']
+            if phone in candidates:
+                self.duplicates += 1
+                continue
+            candidates[phone] = Patient(**serializer.validated_data)
+
+        existing = set(Patient.objects.filter(
+            phone__in=list(candidates)
+        ).values_list('phone', flat=True))
+        new_patients = [patient for phone, patient in candidates.items() if phone not in existing]
+
+        Patient.objects.bulk_create(new_patients, batch_size=self.batch_size)
+
+        self.duplicates += len(candidates) - len(new_patients)
+        self.created += len(new_patients)
+
+    def _record_error(self, line_number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_number, 'errors': errors})
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from tokens.aging import age_priorities
+
+
+class Command(BaseCommand):
+    help = "Apply the booking-time bonus to waiting-list entries and confirmed tokens of open slots"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-slots', type=int, default=500, help='Slots locked and aged per transaction')
+
+    def handle(self, *args, **options):
+        counts = age_priorities(batch_slots=options['batch_slots'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Aged {counts['slots']} open slots: {counts['tokens']} tokens and "
+            f"{counts['waiting']} waiting entries changed priority, {counts['reordered']} queues reordered"
+        ))
@@ -0,0 +1,154 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tokens.aging import WRITE_CHUNK, age_priorities
+from tokens.models import Doctor, Patient, Slot, Token, WaitingList, gapped_ordering
+from tokens.queue_engine import SlotQueue
+from tokens.services import TokenAllocationService
+
+# Booking ages are spread over this many minutes in 6-minute steps
+AGE_SPAN = 12 * 60
+
+
+class Command(BaseCommand):
+    help = "Time the priority aging job over a synthetic set of open slots (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=100000, help='Tokens plus waiting-list entries to seed')
+        parser.add_argument('--tokens-per-slot', type=int, default=80)
+        parser.add_argument('--waiting-per-slot', type=int, default=20)
+        parser.add_argument('--batch-slots', type=int, default=500, help='Slots aged per transaction')
+
+    def handle(self, *args, **options):
+        per_slot = options['tokens_per_slot'] + options['waiting_per_slot']
+        if per_slot <= 0 or options['entries'] < per_slot:
+            raise CommandError("--entries must cover at least one slot")
+
+        self.stdout.write(f"{'pass':<24} {'tokens':>8} {'waiting':>8} {'queues':>7} {'queries':>8} {'ms':>9}")
+        with transaction.atomic():
+            started = time.perf_counter()
+            now = self.seed(options['entries'] // per_slot, options['tokens_per_slot'], options['waiting_per_slot'])
+            self.stdout.write(f"Seeded {options['entries'] // per_slot * per_slot} entries in "
+                              f"{time.perf_counter() - started:.1f}s")
+
+            for label, at in [
+                ('first pass', now),
+                ('unchanged (same time)', now),
+                ('steady state (+6 min)', now + timedelta(minutes=6)),
+            ]:
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    counts = age_priorities(now=at, batch_slots=options['batch_slots'])
+                    elapsed = (time.perf_counter() - started) * 1000
+                queries = sum(1 for query in captured.captured_queries if 'SAVEPOINT' not in query['sql'])
+                self.stdout.write(
+                    f"{label:<24} {counts['tokens']:>8} {counts['waiting']:>8} "
+                    f"{counts['reordered']:>7} {queries:>8} {elapsed:>9.0f}"
+                )
+
+            disordered = self.disordered_queues()
+            transaction.set_rollback(True)
+
+        if disordered:
+            raise CommandError(f"{disordered} queues are out of priority order after aging")
+        self.stdout.write(self.style.SUCCESS("All queues in priority order"))
+
+    def seed(self, slot_count, tokens_per_slot, waiting_per_slot):
+        """
+        Open slots with confirmed tokens and waiting entries booked over the
+        last AGE_SPAN minutes, queued as they would have been at booking time
+        Returns: the time the ages are measured from
+        """
+        now = timezone.now()
+        doctor = Doctor.objects.create(name="Aging Benchmark Doctor", specialization="Benchmark")
+        start = now.replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        slots = Slot.objects.bulk_create([
+            Slot(
+                doctor=doctor,
+                start_time=start + timedelta(hours=i),
+                end_time=start + timedelta(hours=i + 1),
+                max_capacity=tokens_per_slot,
+                current_capacity=tokens_per_slot
+            )
+            for i in range(slot_count)
+        ], batch_size=WRITE_CHUNK)
+        patients = Patient.objects.bulk_create([
+            Patient(name=f"Aging Patient {i}", phone=f"7{i:09d}")
+            for i in range(1000)
+        ])
+
+        categories = [category for category in TokenAllocationService.PRIORITY_VALUES if category != 'EMERGENCY']
+        # (model, minutes since booking) -> waiting-list ids; created_at is
+        # filled in on save, so their ages are written after the insert
+        # (tokens age from booked_at, set directly)
+        ages = defaultdict(list)
+        tokens = []
+        waiting = []
+        serial = 0
+        for slot in slots:
+            booked = []
+            for i in range(tokens_per_slot):
+                serial += 1
+                category = 'EMERGENCY' if i == 0 else categories[serial % len(categories)]
+                booked.append((self.booking_age(serial), category))
+            # Queue order at booking time: base priority, then earliest booking
+            booked.sort(key=lambda row: (TokenAllocationService.PRIORITY_VALUES[row[1]], -row[0]))
+            for position, (age, category) in enumerate(booked, start=1):
+                token = Token(
+                    slot=slot,
+                    patient=patients[(serial + position) % len(patients)],
+                    token_number=position,
+                    sort_key=(position - 1) * SlotQueue.SORT_KEY_GAP if gapped_ordering() else 0,
+                    priority=TokenAllocationService.PRIORITY_VALUES[category],
+                    category=category,
+                    status='CONFIRMED',
+                    estimated_time=TokenAllocationService.calculate_estimated_time(slot, position),
+                    slot_date=slot.date,
+                    booked_at=now - timedelta(minutes=age)
+                )
+                tokens.append(token)
+            for i in range(waiting_per_slot):
+                serial += 1
+                category = categories[serial % len(categories)]
+                entry = WaitingList(
+                    slot=slot,
+                    patient=patients[serial % len(patients)],
+                    category=category,
+                    priority=TokenAllocationService.PRIORITY_VALUES[category]
+                )
+                waiting.append(entry)
+                ages[WaitingList, self.booking_age(serial)].append(entry.id)
+
+        Token.objects.bulk_create(tokens, batch_size=WRITE_CHUNK)
+        WaitingList.objects.bulk_create(waiting, batch_size=WRITE_CHUNK)
+        for (model, age), ids in ages.items():
+            for index in range(0, len(ids), WRITE_CHUNK):
+                model.objects.filter(id__in=ids[index:index + WRITE_CHUNK]).update(
+                    created_at=now - timedelta(minutes=age)
+                )
+        return now
+
+    def booking_age(self, serial):
+        """Minutes since booking, mid-way between two 6-minute aging steps"""
+        return 3 + (serial * 37) % AGE_SPAN // 6 * 6
+
+    def disordered_queues(self):
+        """Slots whose non-emergency tokens are not in priority order"""
+        previous = {}
+        disordered = set()
+        for slot_id, category, priority in Token.objects.filter(
+            status='CONFIRMED',
+            slot__doctor__name="Aging Benchmark Doctor"
+        ).order_by('slot_id', 'sort_key', 'token_number').values_list('slot_id', 'category', 'priority').iterator():
+            if category == 'EMERGENCY':
+                continue
+            if priority < previous.get(slot_id, float('-inf')):
+                disordered.add(slot_id)
+            previous[slot_id] = priority
+        return len(disordered)
@@ -0,0 +1,159 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tokens.models import Doctor, Patient, Slot, Token
+from tokens.queue_engine import SlotQueue, get_queue_engine
+from tokens.services import TokenAllocationService
+
+
+# Upper bound on SQL statements per call (savepoints aside), whatever the
+# queue length; set to the dense ordering / orm engine path, the most costly
+QUERY_BUDGETS = {
+    'allocate_token': 11,
+    'cancel_token': 11,
+    'mark_no_show': 11,
+    'insert_emergency': 9,
+    'delay_slot': 3,
+}
+
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class Rollback(Exception):
+    """Raised to undo one benchmarked call"""
+
+
+class Command(BaseCommand):
+    help = "Time TokenAllocationService operations across queue sizes and enforce per-call query budgets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,1000', help='Comma-separated queue lengths (default 10,100,1000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed calls per operation and size')
+        parser.add_argument('--operation', dest='operations', action='append', choices=list(QUERY_BUDGETS),
+                            help='Only benchmark this operation (repeatable)')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError(f"Invalid --sizes: {options['sizes']}")
+        operations = options['operations'] or list(QUERY_BUDGETS)
+
+        self.stdout.write(f"{'operation':<18} {'tokens':>7} {'queries':>8} {'budget':>7} {'median ms':>10} {'p95 ms':>8}")
+        failures = []
+        # Nothing written here outlives the run
+        with transaction.atomic():
+            get_queue_engine().clear()
+            for operation in operations:
+                counts = {}
+                for size in sizes:
+                    slot, token, patient = self.seed_queue(size, options['repeat'])
+                    counts[size], timings = self.measure(operation, slot, token, patient, options['repeat'])
+                    budget = QUERY_BUDGETS[operation]
+                    over = counts[size] > budget
+                    if over:
+                        failures.append(f"{operation} ran {counts[size]} queries at {size} tokens (budget {budget})")
+                    line = (
+                        f"{operation:<18} {size:>7} {counts[size]:>8} {budget:>7} "
+                        f"{statistics.median(timings):>10.2f} {self.p95(timings):>8.2f}"
+                    )
+                    self.stdout.write(self.style.ERROR(line) if over else line)
+
+                if counts[sizes[-1]] > counts[sizes[0]]:
+                    failures.append(
+                        f"{operation} query count grows with the queue "
+                        f"({counts[sizes[0]]} at {sizes[0]} tokens, {counts[sizes[-1]]} at {sizes[-1]})"
+                    )
+            transaction.set_rollback(True)
+        get_queue_engine().clear()
+
+        if failures:
+            raise CommandError("Query budget exceeded:\n  " + "\n  ".join(failures))
+        self.stdout.write(self.style.SUCCESS("All operations within their query budgets"))
+
+    def seed_queue(self, size, repeat):
+        """
+        A slot holding `size` confirmed tokens with mixed priorities
+        Returns: (slot, token in the middle of the queue, patient with no booking)
+        """
+        doctor = Doctor.objects.create(name=f"Benchmark Doctor {size}", specialization="Benchmark")
+        start = timezone.now().replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        slot = Slot.objects.create(
+            doctor=doctor,
+            start_time=start,
+            end_time=start + timedelta(hours=1),
+            max_capacity=size + repeat + 10,
+            current_capacity=size
+        )
+        patients = Patient.objects.bulk_create([
+            Patient(name=f"Benchmark Patient {size}-{i}", phone=f"8{size:05d}{i:05d}")
+            for i in range(size + 1)
+        ], batch_size=1000)
+
+        priorities = sorted(1 + 4 * i / size for i in range(size))
+        tokens = Token.objects.bulk_create([
+            Token(
+                slot=slot,
+                patient=patients[i],
+                token_number=i + 1,
+                sort_key=i * SlotQueue.SORT_KEY_GAP,
+                priority=priority,
+                category='ONLINE',
+                status='CONFIRMED',
+                estimated_time=TokenAllocationService.calculate_estimated_time(slot, i + 1),
+                slot_date=slot.date
+            )
+            for i, priority in enumerate(priorities)
+        ], batch_size=1000)
+
+        # Calls are rolled back, so nothing would ever reach an in-memory engine
+        engine = get_queue_engine()
+        engine.commit(engine.load(slot))
+        return slot, tokens[size // 2], patients[-1]
+
+    def measure(self, operation, slot, token, patient, repeat):
+        """
+        Call the operation `repeat` times, rolling each call back
+        Returns: (queries per call, list of call times in ms)
+        """
+        calls = {
+            'allocate_token': lambda: TokenAllocationService.allocate_token(slot.id, patient.id, 'FOLLOWUP'),
+            'cancel_token': lambda: TokenAllocationService.cancel_token(token.id),
+            'mark_no_show': lambda: TokenAllocationService.mark_no_show(token.id),
+            'insert_emergency': lambda: TokenAllocationService.insert_emergency(slot.id, patient.id),
+            'delay_slot': lambda: TokenAllocationService.delay_slot(slot.id, 5),
+        }
+        call = calls[operation]
+
+        queries = 0
+        timings = []
+        # The first call is not timed
+        for attempt in range(repeat + 1):
+            try:
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as captured:
+                        started = time.perf_counter()
+                        result, error = call()
+                        elapsed = (time.perf_counter() - started) * 1000
+                    if not result:
+                        raise CommandError(f"{operation} failed: {error}")
+                    raise Rollback
+            except Rollback:
+                pass
+            if attempt:
+                timings.append(elapsed)
+                queries = max(queries, sum(
+                    1 for query in captured.captured_queries
+                    if not query['sql'].startswith(SAVEPOINT_STATEMENTS)
+                ))
+        return queries, timings
+
+    def p95(self, timings):
+        ordered = sorted(timings)
+        return ordered[max(0, round(len(ordered) * 0.95) - 1)]
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from tokens.query_plans import SEED_SIZED, full_scans, hot_queries, plan_sample, seed_plan_data, table_sizes
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the hot allocation, queue and report queries and fail on full table scans. "
+        "The defaults are calibrated against the seeded schedule: 20 doctors x 50 slots x 20 tokens "
+        "with 5 waiting each, eight slots per doctor per day ending tomorrow (about 38,000 rows) "
+        "and --min-rows 1000; queries over tables the seed keeps small (SEED_SIZED) are held to the "
+        "seeded table size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-seed', action='store_true', help='Check against the existing data instead of a seeded schedule')
+        parser.add_argument('--doctors', type=int, default=20)
+        parser.add_argument('--slots-per-doctor', type=int, default=50)
+        parser.add_argument('--tokens-per-slot', type=int, default=20)
+        parser.add_argument('--min-rows', type=int, default=1000, help='Only flag full scans of tables larger than this')
+
+    def handle(self, *args, **options):
+        # Seeded rows never outlive the check
+        with transaction.atomic():
+            if not options['no_seed']:
+                rows = seed_plan_data(options['doctors'], options['slots_per_doctor'], options['tokens_per_slot'])
+                self.stdout.write(f"Seeded {rows} rows")
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            failures = self.check_plans(options['min_rows'], options['verbosity'], seeded=not options['no_seed'])
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError(f"{len(failures)} hot queries regressed to full table scans: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use indexes"))
+
+    def check_plans(self, min_rows, verbosity, seeded=False):
+        sample = plan_sample()
+        if sample is None:
+            raise CommandError("No confirmed tokens to build the hot queries from")
+
+        sizes = table_sizes()
+        failures = []
+        for name, queryset in hot_queries(sample):
+            limit = min_rows
+            if seeded and name in SEED_SIZED:
+                limit = max(min_rows, sizes[SEED_SIZED[name]])
+            try:
+                scans, plan = full_scans(queryset, sizes, limit)
+            except ValueError as e:
+                raise CommandError(str(e))
+            if scans:
+                failures.append(name)
+                tables = ', '.join(f"{table} ({rows} rows)" for table, rows in scans)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}: {tables}"))
+            else:
+                self.stdout.write(f"ok         {name}")
+            if scans or verbosity > 1:
+                self.stdout.write(f"    {plan}".replace('\n', '\n    '))
+        return failures
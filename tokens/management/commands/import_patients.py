@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tokens.importers import IMPORT_FORMATS, PatientImporter, detect_format
+
+
+class Command(BaseCommand):
+    help = "Import patients from a CSV (name,phone,email) or NDJSON file, skipping known phones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, help='Rows per validation/insert chunk')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(filename=path)
+        if fmt is None:
+            raise CommandError("Cannot tell the format from the file name, pass --format")
+
+        importer = PatientImporter(batch_size=options['batch_size'])
+
+        def progress(counts):
+            self.stdout.write(
+                f"{counts['processed']} rows: {counts['created']} created, "
+                f"{counts['duplicates']} duplicates, {counts['failed']} failed"
+            )
+
+        if path == '-':
+            summary = importer.run(sys.stdin, fmt, progress)
+        else:
+            with open(path, newline='', encoding='utf-8-sig') as handle:
+                summary = importer.run(handle, fmt, progress)
+
+        for error in summary['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['created']} patients from {summary['processed']} rows"
+        ))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tokens.models import Slot
+from tokens.services import TokenAllocationService
+
+
+class Command(BaseCommand):
+    help = "Rewrite slot queues for the current TOKEN_ORDERING (run after switching modes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slot', dest='slot_ids', action='append', help='Slot UUID (repeatable)')
+        parser.add_argument('--all', action='store_true', help='Include past and cancelled slots')
+
+    def handle(self, *args, **options):
+        slots = Slot.objects.all()
+        if options['slot_ids']:
+            slots = slots.filter(id__in=options['slot_ids'])
+        elif not options['all']:
+            slots = slots.filter(status__in=['ACTIVE', 'DELAYED'])
+
+        ordering = getattr(settings, 'TOKEN_ORDERING', 'dense')
+        count = 0
+        for slot_id in slots.values_list('id', flat=True).iterator():
+            success, message = TokenAllocationService.renumber_slot(slot_id)
+            if success:
+                count += 1
+            else:
+                self.stderr.write(f"{slot_id}: {message}")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebalanced {count} slots for '{ordering}' ordering"))
@@ -0,0 +1,22 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tokens.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute daily report rollups from the slots and tokens tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', dest='dates', action='append', help='Report date YYYY-MM-DD (repeatable, default: all)')
+
+    def handle(self, *args, **options):
+        try:
+            dates = [date.fromisoformat(value) for value in options['dates'] or []]
+        except ValueError as e:
+            raise CommandError(f"Invalid --date: {e}")
+
+        rows = rebuild_rollups(dates or None)
+        scope = ', '.join(str(day) for day in dates) if dates else 'all dates'
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} rollup rows for {scope}"))
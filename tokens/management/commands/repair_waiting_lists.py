@@ -0,0 +1,50 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from tokens.models import Slot, WaitingList
+from tokens.waitlist_index import get_waitlist_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Redis waiting-list sorted sets that no longer match the waiting_list table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slot', dest='slot_ids', action='append', help='Slot UUID (repeatable)')
+
+    def handle(self, *args, **options):
+        index = get_waitlist_index()
+        if not hasattr(index, 'rebuild'):
+            raise CommandError(f"TOKEN_WAITLIST_INDEX is '{index.name}'; there is no index to repair")
+
+        if options['slot_ids']:
+            slot_ids = set(map(uuid.UUID, options['slot_ids']))
+        else:
+            # Slots that can still promote, plus every slot with a set
+            slot_ids = set(WaitingList.objects.filter(
+                slot__end_time__gte=timezone.now()
+            ).order_by().values_list('slot_id', flat=True).distinct())
+            for slot_id in index.slot_ids():
+                try:
+                    slot_ids.add(uuid.UUID(slot_id))
+                except ValueError:
+                    continue
+
+        repaired = 0
+        for slot_id in slot_ids:
+            # The slot row lock is taken by every queue mutation, so no
+            # promotion or waitlisting can commit while the set is rebuilt
+            with transaction.atomic():
+                slot = Slot.objects.select_for_update().only('id', 'end_time').filter(id=slot_id).first()
+                if slot is None:
+                    rebuilt = index.clear(slot_id)
+                else:
+                    entries = list(WaitingList.objects.filter(slot=slot).order_by())
+                    rebuilt = index.rebuild(slot, entries)
+            if rebuilt:
+                repaired += 1
+                self.stdout.write(f"{slot_id}: rebuilt" if slot else f"{slot_id}: dropped set of a deleted slot")
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {len(slot_ids)} slots, repaired {repaired}"))
@@ -0,0 +1,36 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tokens.workers import RedisTransport, get_transport
+
+
+class Command(BaseCommand):
+    help = "Run single-writer slot workers for TOKEN_ALLOCATION_MODE=sharded with the redis transport"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--shard', dest='shards', type=int, action='append',
+            help='Shard index to serve (repeatable, default: all shards)'
+        )
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+
+        transport = get_transport()
+        if not isinstance(transport, RedisTransport):
+            raise CommandError("Slot workers only run as separate processes with TOKEN_SHARD_TRANSPORT=redis")
+
+        shard_count = getattr(settings, 'TOKEN_SHARD_COUNT', 4)
+        shards = options['shards'] or list(range(shard_count))
+        invalid = [shard for shard in shards if not 0 <= shard < shard_count]
+        if invalid:
+            raise CommandError(f"Shards must be between 0 and {shard_count - 1}: {invalid}")
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        signal.signal(signal.SIGINT, lambda *_: stopping.append(True))
+
+        self.stdout.write(f"Serving slot shards {shards}")
+        transport.serve(shards, stop=lambda: bool(stopping))
+        self.stdout.write("Slot workers stopped")
@@ -0,0 +1,38 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tokens.booking_guard import get_booking_guard
+from tokens.models import Slot, Token
+
+
+class Command(BaseCommand):
+    help = "Backfill Token.slot_date from slot start times and reload the booking guard"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--guard', action='store_true', help='Also load upcoming confirmed bookings into TOKEN_BOOKING_GUARD')
+
+    def handle(self, *args, **options):
+        slots_by_date = defaultdict(list)
+        for slot in Slot.objects.only('id', 'start_time').iterator():
+            slots_by_date[slot.date].append(slot.id)
+
+        updated = 0
+        for day, slot_ids in slots_by_date.items():
+            updated += Token.objects.filter(slot_id__in=slot_ids).exclude(slot_date=day).update(slot_date=day)
+        self.stdout.write(self.style.SUCCESS(f"Updated slot_date on {updated} tokens"))
+
+        if options['guard']:
+            guard = get_booking_guard()
+            bookings = defaultdict(list)
+            for patient_id, day in Token.objects.filter(
+                status='CONFIRMED',
+                slot_date__gte=timezone.localdate()
+            ).values_list('patient_id', 'slot_date').iterator():
+                bookings[day].append(patient_id)
+            for day, patient_ids in bookings.items():
+                guard.add(day, patient_ids)
+            self.stdout.write(self.style.SUCCESS(
+                f"Loaded {sum(map(len, bookings.values()))} bookings into the '{guard.name}' booking guard"
+            ))
@@ -0,0 +1,318 @@
+import time
+from functools import wraps
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils import timezone
+
+
+def metrics_enabled():
+    return getattr(settings, 'TOKEN_METRICS', False)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram(Counter):
+    """Cumulative buckets plus sum and count per label set"""
+
+    kind = 'histogram'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for index, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(buckets), total, count) for key, (buckets, total, count) in self._values.items()}
+        for key, (buckets, total, count) in values.items():
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, observed in zip(self.BUCKETS, buckets):
+                cumulative += observed
+                yield f"{self.name}_bucket", labels + (('le', repr(float(bound))),), cumulative
+            yield f"{self.name}_bucket", labels + (('le', '+Inf'),), count
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Gauge:
+    """Values read from the database or process state at scrape time"""
+
+    def __init__(self, name, help_text, collect, kind='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        for labels, value in self.collect():
+            yield self.name, labels, value
+
+
+def waiting_list_sizes():
+    from django.db.models import Count
+    from .models import WaitingList
+    rows = WaitingList.objects.filter(
+        slot__status__in=['ACTIVE', 'DELAYED'],
+        slot__end_time__gte=timezone.now()
+    ).order_by().values('slot_id').annotate(n=Count('id'))
+    return [((('slot', row['slot_id']),), row['n']) for row in rows]
+
+
+def queue_depths():
+    from django.db.models import Count
+    from .models import Token
+    rows = Token.objects.filter(
+        status='CONFIRMED',
+        slot__status__in=['ACTIVE', 'DELAYED'],
+        slot__end_time__gte=timezone.now()
+    ).order_by().values('slot_id').annotate(n=Count('id'))
+    return [((('slot', row['slot_id']),), row['n']) for row in rows]
+
+
+def queue_cache_counters():
+    from .queue_cache import get_queue_cache
+    stats = get_queue_cache().stats()
+    return [
+        ((('backend', stats['backend']), ('result', 'hit')), stats['hits']),
+        ((('backend', stats['backend']), ('result', 'miss')), stats['misses']),
+    ]
+
+
+def event_broker_stats():
+    from .events import get_event_broker
+    return get_event_broker().stats()
+
+
+def event_subscribers():
+    stats = event_broker_stats()
+    return [((('backend', stats['backend']),), stats['subscribers'])]
+
+
+def event_overflows():
+    stats = event_broker_stats()
+    return [((('backend', stats['backend']),), stats['overflows'])]
+
+
+def db_pool_connections():
+    from .db_pool.pool import pool_stats
+    return [
+        ((('database', stats['database']), ('state', state)), stats[state])
+        for stats in pool_stats()
+        for state in ('in_use', 'idle')
+    ]
+
+
+def db_pool_waiting():
+    from .db_pool.pool import pool_stats
+    return [((('database', stats['database']),), stats['waiting']) for stats in pool_stats()]
+
+
+OPERATION_DURATION = Histogram(
+    'opd_operation_duration_seconds',
+    'TokenAllocationService call duration, including its transaction',
+    ('operation', 'outcome')
+)
+LOCK_WAIT = Histogram('opd_slot_lock_wait_seconds', 'Time spent waiting for a slot lock')
+LOCK_HOLD = Histogram('opd_slot_lock_hold_seconds', 'Time a slot lock was held')
+LOCK_TIMEOUTS = Counter('opd_slot_lock_timeouts_total', 'Slot lock acquisitions that gave up (503 responses)')
+HTTP_DURATION = Histogram(
+    'opd_http_request_duration_seconds',
+    'HTTP request duration per route',
+    ('route', 'method', 'status')
+)
+POOL_WAIT = Histogram('opd_db_pool_wait_seconds', 'Time spent checking out a pooled DB connection', ('database',))
+POOL_TIMEOUTS = Counter(
+    'opd_db_pool_timeouts_total',
+    'DB connection checkouts that gave up (TOKEN_DB_POOL_TIMEOUT)',
+    ('database',)
+)
+
+REGISTRY = [
+    OPERATION_DURATION,
+    LOCK_WAIT,
+    LOCK_HOLD,
+    LOCK_TIMEOUTS,
+    HTTP_DURATION,
+    POOL_WAIT,
+    POOL_TIMEOUTS,
+    Gauge('opd_db_pool_connections', 'Pooled DB connections in this process by state', db_pool_connections),
+    Gauge('opd_db_pool_waiting', 'Threads waiting for a pooled DB connection', db_pool_waiting),
+    Gauge('opd_waiting_list_size', 'Waiting-list entries per open slot', waiting_list_sizes),
+    Gauge('opd_slot_queue_depth', 'Confirmed tokens per open slot', queue_depths),
+    Gauge('opd_queue_cache_lookups_total', 'Slot queue cache lookups', queue_cache_counters, kind='counter'),
+    Gauge('opd_event_subscribers', 'Open queue event streams in this process', event_subscribers),
+    Gauge(
+        'opd_event_buffer_overflows_total',
+        'Event batches dropped for clients that fell behind (sent a resync)',
+        event_overflows,
+        kind='counter'
+    ),
+]
+
+
+def render():
+    """Registry in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{format_labels(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """GET /metrics (404 unless TOKEN_METRICS is on)"""
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def observe_operation(operation):
+    """Time a service method; (None/False, error) results count as rejected"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics_enabled():
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'rejected' if isinstance(result, tuple) and not result[0] else 'ok'
+                return result
+            finally:
+                OPERATION_DURATION.observe(time.perf_counter() - started, operation=operation, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+class ObservedLock:
+    """Wraps a sync or async Redis lock to time waits and holds"""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self._acquired_at = None
+
+    def _waited(self, started):
+        self._acquired_at = time.perf_counter()
+        LOCK_WAIT.observe(self._acquired_at - started)
+
+    def _released(self):
+        LOCK_HOLD.observe(time.perf_counter() - self._acquired_at)
+
+    def __enter__(self):
+        started = time.perf_counter()
+        try:
+            self._lock.__enter__()
+        except Exception:
+            LOCK_TIMEOUTS.inc()
+            raise
+        self._waited(started)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            return self._lock.__exit__(*exc_info)
+        finally:
+            self._released()
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        try:
+            await self._lock.__aenter__()
+        except Exception:
+            LOCK_TIMEOUTS.inc()
+            raise
+        self._waited(started)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            return await self._lock.__aexit__(*exc_info)
+        finally:
+            self._released()
+
+
+def observe_lock(lock):
+    return ObservedLock(lock) if metrics_enabled() else lock
+
+
+class MetricsMiddleware:
+    """Per-route request latency (added to MIDDLEWARE when TOKEN_METRICS is on)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    def record(self, request, response, started):
+        match = getattr(request, 'resolver_match', None)
+        HTTP_DURATION.observe(
+            time.perf_counter() - started,
+            route=match.view_name if match else 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
@@ -1,5 +1,9 @@
 import uuid
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, Count, ExpressionWrapper, F, OuterRef, Q, Subquery, Value, When, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 
@@ -33,6 +37,7 @@ class Slot(models.Model):
     current_capacity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
     delay_minutes = models.IntegerField(default=0)
+    queue_version = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -44,6 +49,17 @@ class Slot(models.Model):
                 name='capacity_not_exceeded'
             )
         ]
+        indexes = [
+            models.Index(fields=['start_time'], name='slot_start_time_idx'),
+            # Keyset pagination order (tokens.pagination)
+            models.Index(fields=['created_at', 'id'], name='slot_created_idx'),
+            # Open slots the memory queue engine warms up on first use
+            models.Index(
+                fields=['end_time'],
+                condition=models.Q(status__in=['ACTIVE', 'DELAYED']),
+                name='slot_open_end_time_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.doctor.name} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
@@ -52,22 +68,112 @@ class Slot(models.Model):
     def available_capacity(self):
         return self.max_capacity - self.current_capacity
 
+    @property
+    def date(self):
+        """Local calendar date of the slot (the day a booking counts against)"""
+        return timezone.localdate(self.start_time)
+
 
 class Patient(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=200)
-    phone = models.CharField(max_length=20)
+    phone = models.CharField(max_length=20, db_index=True)
     email = models.EmailField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'patients'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='patient_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.phone})"
 
 
+def gapped_ordering():
+    """True when queue order lives in Token.sort_key instead of token_number"""
+    return getattr(settings, 'TOKEN_ORDERING', 'dense') == 'gapped'
+
+
+def derived_estimated_time():
+    """True when estimated times of confirmed tokens are computed on read"""
+    return gapped_ordering() or getattr(settings, 'TOKEN_ESTIMATED_TIME', 'stored') == 'derived'
+
+
+class TokenQuerySet(models.QuerySet):
+    def _tokens_ahead(self):
+        """Count of confirmed tokens queued ahead of the outer token"""
+        return Token.objects.filter(
+            slot=OuterRef('slot'),
+            status='CONFIRMED'
+        ).filter(
+            Q(sort_key__lt=OuterRef('sort_key')) |
+            Q(sort_key=OuterRef('sort_key'), token_number__lt=OuterRef('token_number'))
+        ).order_by().values('slot').annotate(ahead=Count('pk')).values('ahead')
+
+    def _queue_window(self):
+        """Row number of each confirmed token among the queryset's confirmed tokens of its slot"""
+        return Window(
+            RowNumber(),
+            partition_by=[F('slot_id'), F('status')],
+            order_by=[F('sort_key').asc(), F('token_number').asc()]
+        )
+
+    def for_display(self, whole_queues=False):
+        """
+        Annotate the displayed token number and estimated time
+        With gapped ordering the live position of a confirmed token is derived
+        from sort_key, and with derived estimated times the estimate is computed
+        from the slot's start, delay and that position. Released tokens keep
+        the values frozen when they left the queue.
+        The position is a COUNT subquery per row, which suits single tokens and
+        bounded pages. whole_queues=True numbers the rows with one window
+        function instead; only use it when the filter keeps every confirmed
+        token of each slot it returns.
+        """
+        queryset = self
+        number = F('token_number')
+        if gapped_ordering():
+            position = self._queue_window() if whole_queues else Coalesce(Subquery(self._tokens_ahead()), 0) + Value(1)
+            queryset = queryset.annotate(
+                queue_position=Case(
+                    When(status='CONFIRMED', then=position),
+                    default=F('token_number'),
+                    output_field=models.IntegerField()
+                )
+            )
+            number = F('queue_position')
+
+        if derived_estimated_time():
+            from .services import TokenAllocationService
+            minute = Value(timedelta(minutes=1))
+            offset = ExpressionWrapper(
+                F('slot__delay_minutes') * minute +
+                (number - 1) * TokenAllocationService.AVG_CONSULTATION_TIME * minute,
+                output_field=models.DurationField()
+            )
+            queryset = queryset.annotate(
+                queue_estimated_time=Case(
+                    When(status='CONFIRMED', then=F('slot__start_time') + offset),
+                    default=F('estimated_time'),
+                    output_field=models.DateTimeField()
+                )
+            )
+        return queryset
+
+    def in_queue_order(self):
+        """
+        Whole slot queues ordered by displayed token number
+        Positions come from a window over the queryset (see for_display), so
+        filter by slot (and status) only and drop other rows afterwards.
+        """
+        if not gapped_ordering():
+            return self.for_display().order_by('token_number')
+        return self.for_display(whole_queues=True).order_by('queue_position', 'sort_key', 'token_number')
+
+
 class Token(models.Model):
     CATEGORY_CHOICES = [
         ('EMERGENCY', 'Emergency'),
@@ -88,21 +194,77 @@ class Token(models.Model):
     slot = models.ForeignKey(Slot, on_delete=models.CASCADE, related_name='tokens')
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='tokens')
     token_number = models.IntegerField()
+    sort_key = models.BigIntegerField(default=0)
     priority = models.FloatField()
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='CONFIRMED')
     estimated_time = models.DateTimeField()
+    # Copy of slot.date so the same-day duplicate check needs no join
+    slot_date = models.DateField(null=True, editable=False)
     actual_time = models.DateTimeField(null=True, blank=True)
+    # When the patient first asked for a place: the token's creation, or the
+    # waiting-list entry it was promoted from. Priority aging counts from here.
+    booked_at = models.DateTimeField(default=timezone.now, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TokenQuerySet.as_manager()
+
     class Meta:
         db_table = 'tokens'
         ordering = ['slot', 'token_number']
-        unique_together = [['slot', 'token_number']]
+        constraints = [
+            # Cancelled/no-show tokens keep their last number, so uniqueness
+            # only applies to the live queue
+            models.UniqueConstraint(
+                fields=['slot', 'token_number'],
+                condition=models.Q(status='CONFIRMED'),
+                name='unique_confirmed_token_number'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['slot', 'status', 'sort_key'], name='token_queue_order_idx'),
+            models.Index(fields=['slot', 'status', 'token_number'], name='token_queue_number_idx'),
+            models.Index(fields=['created_at', 'id'], name='token_created_idx'),
+            models.Index(
+                fields=['patient', 'slot_date'],
+                condition=models.Q(status='CONFIRMED'),
+                name='token_patient_day_idx'
+            ),
+        ]
 
     def __str__(self):
-        return f"Token #{self.token_number} - {self.patient.name}"
+        return f"Token #{self.display_number} - {self.patient.name}"
+
+    def save(self, *args, **kwargs):
+        # Keep slot_date in step whenever the slot may have changed
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'slot' in update_fields or 'slot_id' in update_fields:
+            self.slot_date = self.slot.date
+            if update_fields is not None:
+                kwargs['update_fields'] = [*update_fields, 'slot_date']
+        super().save(*args, **kwargs)
+
+    @property
+    def display_number(self):
+        """Token number shown to patients (live position while confirmed)"""
+        if not gapped_ordering() or self.status != 'CONFIRMED':
+            return self.token_number
+        if hasattr(self, 'queue_position'):
+            return self.queue_position
+        return Token.objects.filter(pk=self.pk).for_display().values_list(
+            'queue_position', flat=True
+        ).get()
+
+    @property
+    def display_estimated_time(self):
+        """Estimated time for the displayed token number"""
+        if not derived_estimated_time() or self.status != 'CONFIRMED':
+            return self.estimated_time
+        if hasattr(self, 'queue_estimated_time'):
+            return self.queue_estimated_time
+        from .services import TokenAllocationService
+        return TokenAllocationService.calculate_estimated_time(self.slot, self.display_number)
 
 
 class WaitingList(models.Model):
@@ -116,6 +278,46 @@ class WaitingList(models.Model):
     class Meta:
         db_table = 'waiting_list'
         ordering = ['priority', 'created_at']
+        indexes = [
+            models.Index(fields=['slot', 'priority', 'created_at'], name='waiting_slot_order_idx'),
+            models.Index(fields=['created_at', 'id'], name='waiting_created_idx'),
+        ]
 
     def __str__(self):
         return f"Waiting - {self.patient.name} for {self.slot}"
+
+
+class DailyReportRollup(models.Model):
+    """
+    Report counters per (date, hour, doctor, category, status)
+    Rows with a category and status count tokens; the row with both blank
+    holds the slot count and capacity for that doctor and hour. Hour is the
+    local start hour of the slot. Maintained by tokens.rollups in the same
+    transaction as the change it counts; the daily and range reports both
+    aggregate from it.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    date = models.DateField()
+    # Coarser time buckets of date, so range reports group on plain columns
+    week = models.DateField()
+    month = models.DateField()
+    hour = models.SmallIntegerField(default=0)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='daily_rollups')
+    category = models.CharField(max_length=20, blank=True, default='')
+    status = models.CharField(max_length=20, blank=True, default='')
+    tokens = models.IntegerField(default=0)
+    slots = models.IntegerField(default=0)
+    capacity = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'daily_report_rollups'
+        ordering = ['date', 'hour', 'doctor', 'category', 'status']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'hour', 'doctor', 'category', 'status'],
+                name='unique_daily_report_rollup'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.hour:02d}h {self.doctor_id} {self.category or '-'}/{self.status or '-'}"
@@ -0,0 +1,139 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination
+    Rows are ordered by the view's `cursor_ordering` (default created_at, id:
+    immutable and unique together). The cursor holds those values for the
+    last row served and the next page filters past them, so page N is an
+    index range scan just like page 1 and no COUNT(*) is run.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering = ('created_at', 'id')
+    page_size = api_settings.PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.fields = tuple(getattr(view, 'cursor_ordering', self.ordering))
+        model = queryset.model
+
+        queryset = queryset.order_by(*self.fields)
+        position = self.decode_cursor(request, model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = [self.cursor_value(rows[-1], field) for field in self.fields] if self.has_next else None
+        return rows
+
+    def cursor_value(self, row, field):
+        """A row's ordering value as cursor text (rows may be instances or values() dicts)"""
+        value = row[field] if isinstance(row, dict) else getattr(row, field)
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    def after(self, position):
+        """Rows strictly after `position` in the (ascending) ordering"""
+        pairs = list(zip(self.fields, position))
+        field, value = pairs[-1]
+        condition = Q(**{f"{field}__gt": value})
+        for field, value in reversed(pairs[:-1]):
+            condition = Q(**{f"{field}__gt": value}) | (Q(**{field: value}) & condition)
+        # Bound on the leading column so the database can range-scan its index
+        field, value = pairs[0]
+        return Q(**{f"{field}__gte": value}) & condition
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+        except (ValueError, TypeError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position):
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode()).decode('ascii')
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        return self.encode_cursor(self.next_position) if self.has_next else None
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class SelectablePagination(PageNumberPagination):
+    """
+    Page numbers by default, keyset pages when the request asks for them
+    `?pagination=cursor` starts at the first keyset page; the `next` links
+    carry `?cursor=`, which keeps the client in keyset mode.
+    """
+
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def __init__(self):
+        self.keyset = None
+
+    def wants_keyset(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor' or
+            self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.wants_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': "Set to 'cursor' for keyset pages (no count, constant cost per page)",
+                'schema': {'type': 'string', 'enum': ['page', 'cursor']},
+            },
+            {
+                'name': self.keyset_class.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Keyset cursor from a previous next link',
+                'schema': {'type': 'string'},
+            },
+        ]
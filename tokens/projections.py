@@ -0,0 +1,80 @@
+from rest_framework import serializers
+
+from .models import derived_estimated_time, gapped_ordering
+
+# Formats like the DateTimeFields the serializers build (ISO 8601, current
+# timezone, 'Z' for UTC)
+DATETIME = serializers.DateTimeField()
+
+TOKEN_COLUMNS = (
+    'id', 'slot_id', 'slot__doctor__name', 'slot__start_time', 'slot__end_time',
+    'patient_id', 'patient__name', 'token_number', 'priority', 'category', 'status',
+    'estimated_time', 'actual_time', 'created_at', 'updated_at',
+)
+
+WAITING_COLUMNS = ('id', 'slot_id', 'patient_id', 'patient__name', 'category', 'priority', 'created_at')
+
+
+def token_projection(queryset):
+    """
+    Columns TokenSerializer reads, joined in SQL
+    Pass a queryset that went through for_display() or in_queue_order().
+    """
+    columns = list(TOKEN_COLUMNS)
+    if gapped_ordering():
+        columns.append('queue_position')
+    if derived_estimated_time():
+        columns.append('queue_estimated_time')
+    return queryset.values(*columns)
+
+
+def token_data(rows):
+    """TokenSerializer(many=True).data for token_projection rows, without field objects"""
+    number = 'queue_position' if gapped_ordering() else 'token_number'
+    estimate = 'queue_estimated_time' if derived_estimated_time() else 'estimated_time'
+    datetime = DATETIME.to_representation
+    return [
+        {
+            'id': str(row['id']),
+            'slot': row['slot_id'],
+            # get_slot_info returns raw datetimes, left to the JSON encoder
+            'slot_info': {
+                'doctor': row['slot__doctor__name'],
+                'start_time': row['slot__start_time'],
+                'end_time': row['slot__end_time'],
+            },
+            'patient': row['patient_id'],
+            'patient_name': row['patient__name'],
+            'token_number': row[number],
+            'priority': row['priority'],
+            'category': row['category'],
+            'status': row['status'],
+            'estimated_time': datetime(row[estimate]),
+            'actual_time': datetime(row['actual_time']),
+            'created_at': datetime(row['created_at']),
+            'updated_at': datetime(row['updated_at']),
+        }
+        for row in rows
+    ]
+
+
+def waiting_projection(queryset):
+    """Columns WaitingListSerializer reads, joined in SQL"""
+    return queryset.values(*WAITING_COLUMNS)
+
+
+def waiting_data(rows):
+    """WaitingListSerializer(many=True).data for waiting_projection rows"""
+    datetime = DATETIME.to_representation
+    return [
+        {
+            'id': str(row['id']),
+            'slot': row['slot_id'],
+            'patient': row['patient_id'],
+            'patient_name': row['patient__name'],
+            'category': row['category'],
+            'priority': row['priority'],
+            'created_at': datetime(row['created_at']),
+        }
+        for row in rows
+    ]
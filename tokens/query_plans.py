@@ -0,0 +1,189 @@
+import re
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import DailyReportRollup, Doctor, Patient, Slot, Token, WaitingList
+from .pagination import KeysetPagination
+from .rollups import local_day_range, rebuild_rollups
+
+
+# Plan lines that read a whole table, per database vendor; the second group
+# marks a SQLite walk in index order, which a LIMIT can stop early
+FULL_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)()'),
+    'sqlite': re.compile(r'\bSCAN (\w+)\b( USING (?:COVERING )?INDEX)?'),
+}
+
+
+# Hot queries over a table the seeded schedule keeps small, with that table.
+# At seed size a sequential read of it can be the planner's right call, so a
+# seeded run only flags them against the table's size after seeding; --no-seed
+# checks them against --min-rows like every other query
+SEED_SIZED = {
+    'queue engine: warm open slots': 'slots',
+}
+
+
+def seed_plan_data(doctors=20, slots_per_doctor=50, tokens_per_slot=20, waiting_per_slot=5):
+    """
+    Bulk-insert a synthetic schedule big enough for realistic query plans
+    Slots run eight per doctor per day and end tomorrow, so like a live
+    schedule most of them are history: their visits are completed and only
+    today's later slots and tomorrow's are still open.
+    Run it inside a transaction that is rolled back afterwards.
+    Returns: number of rows written
+    """
+    now = timezone.now()
+    days = -(-slots_per_doctor // 8)
+    first_day = local_day_range(timezone.localdate())[0] - timedelta(days=max(days - 2, 0))
+
+    doctor_rows = Doctor.objects.bulk_create([
+        Doctor(name=f"Plan Doctor {i}", specialization=f"Specialization {i % 5}")
+        for i in range(doctors)
+    ])
+    slot_rows = Slot.objects.bulk_create([
+        Slot(
+            doctor=doctor,
+            start_time=first_day + timedelta(days=i // 8, hours=9 + i % 8),
+            end_time=first_day + timedelta(days=i // 8, hours=10 + i % 8),
+            max_capacity=tokens_per_slot + waiting_per_slot,
+            current_capacity=tokens_per_slot
+        )
+        for doctor in doctor_rows
+        for i in range(slots_per_doctor)
+    ], batch_size=1000)
+    patient_rows = Patient.objects.bulk_create([
+        Patient(name=f"Plan Patient {i}", phone=f"9{i:09d}")
+        for i in range(max(len(slot_rows) * tokens_per_slot // 4, 1))
+    ], batch_size=1000)
+
+    tokens = []
+    waiting = []
+    categories = [category for category, _ in Token.CATEGORY_CHOICES]
+    for slot_index, slot in enumerate(slot_rows):
+        booked = 'COMPLETED' if slot.end_time < now else 'CONFIRMED'
+        for number in range(1, tokens_per_slot + 1):
+            patient = patient_rows[(slot_index * tokens_per_slot + number) % len(patient_rows)]
+            tokens.append(Token(
+                slot=slot,
+                patient=patient,
+                token_number=number,
+                priority=number,
+                category=categories[number % len(categories)],
+                status='CANCELLED' if number % 10 == 0 else booked,
+                estimated_time=slot.start_time + timedelta(minutes=10 * (number - 1)),
+                slot_date=slot.date
+            ))
+        for i in range(waiting_per_slot):
+            waiting.append(WaitingList(
+                slot=slot,
+                patient=patient_rows[(slot_index + i) % len(patient_rows)],
+                category='WALKIN',
+                priority=5
+            ))
+    Token.objects.bulk_create(tokens, batch_size=1000)
+    WaitingList.objects.bulk_create(waiting, batch_size=1000)
+    rollups = rebuild_rollups()
+
+    return len(doctor_rows) + len(slot_rows) + len(patient_rows) + len(tokens) + len(waiting) + rollups
+
+
+def plan_sample():
+    """Rows from the database to parameterize the hot queries with"""
+    token = Token.objects.filter(status='CONFIRMED').select_related('slot', 'patient').order_by('slot_date').last()
+    if token is None:
+        return None
+    return SimpleNamespace(
+        token=token,
+        slot=token.slot,
+        patient=token.patient,
+        day=token.slot_date,
+        patient_ids=list(Patient.objects.values_list('id', flat=True)[:50]),
+    )
+
+
+def hot_queries(sample):
+    """
+    (name, queryset) for the hot reads and the row selections of the hot writes
+    Orderings match the callers: exists(), update() and subqueries drop the
+    model's default ordering, so those entries clear it too.
+    """
+    slot, day = sample.slot, sample.day
+    keyset = KeysetPagination()
+    keyset.fields = keyset.ordering
+    return [
+        ('allocate: same-day duplicate check', Token.objects.filter(
+            patient=sample.patient, status='CONFIRMED', slot_date=day
+        ).order_by()[:1]),
+        ('bulk: booked patients', Token.objects.filter(
+            patient_id__in=sample.patient_ids, status='CONFIRMED', slot_date__in=[day]
+        ).order_by().values_list('patient_id', 'slot_date')),
+        ('queue engine: load slot queue', Token.objects.filter(
+            slot=slot, status='CONFIRMED'
+        ).order_by('sort_key', 'token_number').values_list('id', 'priority', 'sort_key')),
+        ('queue engine: warm open slots', Slot.objects.filter(
+            status__in=['ACTIVE', 'DELAYED'], end_time__gte=timezone.now()
+        ).order_by()),
+        ('resequence: tokens to shift', Token.objects.filter(
+            slot=slot, status='CONFIRMED', token_number__gte=2
+        ).order_by()),
+        ('release: next waiting patient', WaitingList.objects.filter(
+            slot=slot
+        ).order_by('priority', 'created_at')[:1]),
+        ('slots: list page', Slot.objects.select_related('doctor').all()[:50]),
+        ('slots: queue view', Token.objects.filter(
+            slot=slot
+        ).select_related('patient').in_queue_order()),
+        ('emergency: affected tokens', Token.objects.filter(
+            slot=slot, status='CONFIRMED'
+        ).in_queue_order()),
+        ('waiting list: by slot', WaitingList.objects.select_related('slot', 'patient').filter(
+            slot=slot
+        ).order_by('priority', 'created_at')),
+        ('reports: daily', DailyReportRollup.objects.filter(date=day)),
+        ('reports: range by day', DailyReportRollup.objects.filter(
+            date__gte=day - timedelta(days=7), date__lte=day
+        ).values('date').annotate(tokens=Sum('tokens')).order_by()),
+        ('tokens: keyset page', Token.objects.filter(
+            keyset.after([sample.token.created_at, sample.token.id])
+        ).order_by(*keyset.fields)[:keyset.page_size + 1]),
+        ('patients: keyset page', Patient.objects.filter(
+            keyset.after([sample.patient.created_at, sample.patient.id])
+        ).order_by(*keyset.fields)[:keyset.page_size + 1]),
+        ('rollups: slots of a day', Slot.objects.filter(
+            start_time__gte=local_day_range(day)[0], start_time__lt=local_day_range(day)[1]
+        ).order_by()),
+    ]
+
+
+def table_sizes():
+    return {
+        model._meta.db_table: model.objects.count()
+        for model in apps.get_app_config('tokens').get_models()
+    }
+
+
+def full_scans(queryset, sizes, min_rows):
+    """
+    Tables a queryset's plan reads in full, limited to those above min_rows
+    Returns: (list of (table, rows), plan text)
+    """
+    pattern = FULL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise ValueError(f"EXPLAIN checks are not supported on {connection.vendor}")
+    plan = queryset.explain()
+    bounded = queryset.query.is_sliced and 'TEMP B-TREE FOR ORDER BY' not in plan
+    scans = []
+    for table, index_walk in dict.fromkeys(pattern.findall(plan)):
+        if index_walk and bounded:
+            continue
+        # Aliased subquery tables (U0, T3...) are sized conservatively
+        rows = sizes.get(table, max(sizes.values(), default=0))
+        if rows > min_rows:
+            scans.append((table, rows))
+    return scans, plan
@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .etags import named_slot_ids, touch_slots
+from .events import publish_on_commit
+from .models import Doctor, Patient, Slot
+
+
+def bump_queue_version(slot_id):
+    """Invalidate cached reads of a slot's queue after a change made outside the service"""
+    Slot.objects.filter(id=slot_id).update(queue_version=F('queue_version') + 1)
+    touch_slots([slot_id])
+    publish_on_commit(slot_id, None, [{'type': 'changed'}])
+
+
+def bump_queue_versions(slot_ids):
+    """bump_queue_version for many slots, with one UPDATE"""
+    slot_ids = list(slot_ids)
+    if not slot_ids:
+        return
+    Slot.objects.filter(id__in=slot_ids).update(queue_version=F('queue_version') + 1)
+    touch_slots(slot_ids)
+    for slot_id in slot_ids:
+        publish_on_commit(slot_id, None, [{'type': 'changed'}])
+
+
+def patient_renamed(patient_id):
+    """Cached queues and waiting lists show patient names: invalidate every slot the patient is in"""
+    bump_queue_versions(named_slot_ids(Patient, patient_id))
+
+
+def doctor_renamed(doctor_id):
+    """Cached queues show the doctor's name: invalidate all of the doctor's slots"""
+    bump_queue_versions(named_slot_ids(Doctor, doctor_id))
+
+
+class NullQueueCache:
+    """
+    Read-through cache for serialized slot queues
+    Entries are keyed by slot id and Slot.queue_version, which every queue
+    mutation bumps in the same transaction, so a stored entry is never stale
+    and nothing has to be deleted; superseded versions simply age out.
+    This base class caches nothing (TOKEN_QUEUE_CACHE=off).
+    """
+
+    name = 'off'
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = Lock()
+
+    def key(self, slot):
+        return f"slot_tokens:{slot.id}:{slot.queue_version}"
+
+    def fetch(self, slot, build):
+        """
+        Return the cached queue for this slot version, building it on a miss
+        Returns: (data, hit)
+        """
+        try:
+            data = self.get(self.key(slot))
+        except Exception:
+            data = None
+        if data is not None:
+            self._count(hit=True)
+            return data, True
+
+        self._count(hit=False)
+        data = build()
+        try:
+            self.set(self.key(slot), data)
+        except Exception:
+            pass
+        return data, False
+
+    def get(self, key):
+        return None
+
+    def set(self, key, data):
+        pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups * 100, 2) if lookups else 0,
+        }
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'TOKEN_QUEUE_CACHE_TTL', 300)
+
+
+class RedisQueueCache(NullQueueCache):
+    """Entries live in the default (Redis) cache, shared by all processes"""
+
+    name = 'redis'
+
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, key, data):
+        cache.set(key, data, self.timeout)
+
+
+class LocalQueueCache(NullQueueCache):
+    """Entries live in a per-process LRU"""
+
+    name = 'local'
+
+    def __init__(self):
+        super().__init__()
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data):
+        max_entries = getattr(settings, 'TOKEN_QUEUE_CACHE_SIZE', 1000)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+
+QUEUE_CACHES = {
+    'off': NullQueueCache,
+    'redis': RedisQueueCache,
+    'local': LocalQueueCache,
+}
+
+_queue_cache = None
+
+
+def get_queue_cache():
+    """Return the cache selected by settings.TOKEN_QUEUE_CACHE"""
+    global _queue_cache
+    name = getattr(settings, 'TOKEN_QUEUE_CACHE', 'redis')
+    if _queue_cache is None or _queue_cache.name != name:
+        try:
+            _queue_cache = QUEUE_CACHES[name]()
+        except KeyError:
+            raise ValueError(f"Unknown TOKEN_QUEUE_CACHE: {name}")
+    return _queue_cache
@@ -0,0 +1,253 @@
+from bisect import bisect_right
+from threading import RLock
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Slot, Token
+
+
+class SlotQueue:
+    """
+    Ordered view of the CONFIRMED tokens of one slot
+    Entries are kept in queue order; because the queue is sorted by priority
+    (ties by arrival) the parallel priority list stays non-decreasing and the
+    insertion point for a priority is a binary search.
+    """
+
+    # Spacing of sort keys for gapped ordering
+    SORT_KEY_GAP = 1 << 20
+
+    def __init__(self, slot_id, version=0):
+        self.slot_id = slot_id
+        self.version = version
+        self._token_ids = []
+        self._priorities = []
+        self._sort_keys = []
+
+    @classmethod
+    def from_rows(cls, slot_id, rows, version=0):
+        """Build from (token_id, priority, sort_key) rows already in queue order"""
+        queue = cls(slot_id, version)
+        for token_id, priority, sort_key in rows:
+            queue._token_ids.append(token_id)
+            queue._priorities.append(priority)
+            queue._sort_keys.append(sort_key)
+        return queue
+
+    def copy(self):
+        queue = SlotQueue(self.slot_id, self.version)
+        queue._token_ids = self._token_ids[:]
+        queue._priorities = self._priorities[:]
+        queue._sort_keys = self._sort_keys[:]
+        return queue
+
+    def __len__(self):
+        return len(self._token_ids)
+
+    def token_ids(self):
+        """Token ids in queue order"""
+        return list(self._token_ids)
+
+    def position_of(self, token_id):
+        """1-based position of a queued token, or None"""
+        try:
+            return self._token_ids.index(token_id) + 1
+        except ValueError:
+            return None
+
+    def position_for(self, priority):
+        """1-based position a new token with this priority would take"""
+        return bisect_right(self._priorities, priority) + 1
+
+    def insert(self, token_id, priority, position):
+        """Insert a token at position (dense ordering); later tokens move back one"""
+        index = position - 1
+        self._token_ids.insert(index, token_id)
+        self._priorities.insert(index, priority)
+        self._sort_keys.insert(index, 0)
+
+    def insert_sparse(self, token_id, priority, position):
+        """
+        Insert a token at position (gapped ordering)
+        The new token gets a sort key between its neighbours; only when they
+        are adjacent is a window around the insertion point re-spaced.
+        Returns: (sort_key, list of (token_id, new_sort_key) for re-spaced tokens)
+        """
+        index = position - 1
+        keys = self._sort_keys
+        lo = keys[index - 1] if index > 0 else None
+        hi = keys[index] if index < len(keys) else None
+
+        if lo is None and hi is None:
+            sort_key = 0
+        elif lo is None:
+            sort_key = hi - self.SORT_KEY_GAP
+        elif hi is None:
+            sort_key = lo + self.SORT_KEY_GAP
+        elif hi - lo > 1:
+            sort_key = (lo + hi) // 2
+        else:
+            return self._insert_rebalanced(token_id, priority, index)
+
+        self._token_ids.insert(index, token_id)
+        self._priorities.insert(index, priority)
+        keys.insert(index, sort_key)
+        return sort_key, []
+
+    def _insert_rebalanced(self, token_id, priority, index):
+        """Re-space the smallest window around index that has room"""
+        keys = self._sort_keys
+        size = len(keys)
+        radius = 1
+        while True:
+            start = max(index - radius, 0)
+            end = min(index + radius, size)
+            lo = keys[start - 1] if start > 0 else None
+            hi = keys[end] if end < size else None
+            count = end - start + 1
+            if lo is None or hi is None:
+                step = self.SORT_KEY_GAP
+                if lo is not None:
+                    base = lo + step
+                elif hi is not None:
+                    base = hi - count * step
+                else:
+                    base = 0
+                break
+            if hi - lo > 2 * (count + 1):
+                step = (hi - lo) // (count + 1)
+                base = lo + step
+                break
+            radius *= 2
+
+        self._token_ids.insert(index, token_id)
+        self._priorities.insert(index, priority)
+        keys.insert(index, None)
+
+        respaced = []
+        for offset in range(count):
+            i = start + offset
+            new_key = base + offset * step
+            if i != index and keys[i] != new_key:
+                respaced.append((self._token_ids[i], new_key))
+            keys[i] = new_key
+        return keys[index], respaced
+
+    def remove(self, token_id):
+        """
+        Remove a token from the queue; later tokens move forward one
+        Returns: the 1-based position it held, or None
+        """
+        try:
+            index = self._token_ids.index(token_id)
+        except ValueError:
+            return None
+        del self._token_ids[index]
+        del self._priorities[index]
+        del self._sort_keys[index]
+        return index + 1
+
+
+class ORMQueueEngine:
+    """Reads the queue from the tokens table on every call (reference path)"""
+
+    name = 'orm'
+
+    def load(self, slot):
+        rows = Token.objects.filter(
+            slot=slot,
+            status='CONFIRMED'
+        ).order_by('sort_key', 'token_number').values_list('id', 'priority', 'sort_key')
+        return SlotQueue.from_rows(slot.id, rows, slot.queue_version)
+
+    def commit(self, queue):
+        pass
+
+    def discard(self, slot_id):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryQueueEngine(ORMQueueEngine):
+    """
+    Keeps one SlotQueue per active slot in process memory
+    A cached queue is only trusted while its version matches
+    Slot.queue_version, so changes made by other processes trigger a reload.
+    Callers get a copy and hand it back through commit() once their
+    transaction has committed, so a rollback never leaks into the cache.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        self._queues = {}
+        self._lock = RLock()
+        self._warmed = False
+
+    def load(self, slot):
+        if not self._warmed:
+            self.rebuild(Slot.objects.filter(
+                status__in=['ACTIVE', 'DELAYED'],
+                end_time__gte=timezone.now()
+            ))
+        with self._lock:
+            queue = self._queues.get(slot.id)
+        if queue is not None and queue.version == slot.queue_version:
+            return queue.copy()
+        return super().load(slot)
+
+    def commit(self, queue):
+        with self._lock:
+            self._queues[queue.slot_id] = queue
+
+    def discard(self, slot_id):
+        with self._lock:
+            self._queues.pop(slot_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._queues.clear()
+
+    def rebuild(self, slots):
+        """Load queues for the given slots from the tokens table"""
+        queues = {}
+        rows = Token.objects.filter(
+            slot__in=slots,
+            status='CONFIRMED'
+        ).order_by('slot_id', 'sort_key', 'token_number').values_list(
+            'slot_id', 'id', 'priority', 'sort_key'
+        )
+        for slot_id, token_id, priority, sort_key in rows:
+            queues.setdefault(slot_id, []).append((token_id, priority, sort_key))
+
+        with self._lock:
+            self._queues.clear()
+            for slot in slots:
+                self._queues[slot.id] = SlotQueue.from_rows(
+                    slot.id, queues.get(slot.id, []), slot.queue_version
+                )
+            self._warmed = True
+        return len(self._queues)
+
+
+QUEUE_ENGINES = {
+    'orm': ORMQueueEngine,
+    'memory': MemoryQueueEngine,
+}
+
+_engine = None
+
+
+def get_queue_engine():
+    """Return the engine selected by settings.TOKEN_QUEUE_ENGINE"""
+    global _engine
+    name = getattr(settings, 'TOKEN_QUEUE_ENGINE', 'orm')
+    if _engine is None or _engine.name != name:
+        try:
+            _engine = QUEUE_ENGINES[name]()
+        except KeyError:
+            raise ValueError(f"Unknown TOKEN_QUEUE_ENGINE: {name}")
+    return _engine
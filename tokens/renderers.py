@@ -0,0 +1,71 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional; the stock encoder is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional; board endpoints only offer JSON without it
+    msgpack = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed
+    Output is byte-for-byte what JSONRenderer produces with the default
+    UNICODE_JSON / COMPACT_JSON settings: datetimes and anything orjson does
+    not know go through DRF's encoder, and U+2028/U+2029 are escaped. Indented
+    output, non-default settings and data orjson refuses fall back to
+    JSONRenderer.
+    """
+
+    OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+    _default = staticmethod(JSONEncoder().default)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or not self.compact or self.ensure_ascii or
+            self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._default, option=self.OPTIONS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack encoding for the board snapshots of tokens.boards
+    Selected with `Accept: application/x-msgpack` or `?format=msgpack`.
+    Anything else rendered through it (error bodies) goes through DRF's JSON
+    encoder for types MessagePack has no form for.
+    """
+
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    _default = staticmethod(JSONEncoder().default)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self._default, use_bin_type=True)
+
+
+def board_renderers():
+    """Renderer classes for endpoints that also serve board snapshots"""
+    renderers = list(api_settings.DEFAULT_RENDERER_CLASSES)
+    if msgpack is not None:
+        renderers.append(MessagePackRenderer)
+    return renderers
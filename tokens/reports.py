@@ -0,0 +1,121 @@
+from django.db.models import Q, Sum
+
+from .models import DailyReportRollup, Doctor
+
+
+REPORT_DIMENSIONS = ('doctor', 'specialization', 'category', 'status', 'hour')
+
+# Rollup column each interval is grouped on in the database; year buckets
+# are rolled up from months in process
+REPORT_INTERVALS = {
+    'day': 'date',
+    'week': 'week',
+    'month': 'month',
+    'year': 'month',
+}
+
+TOKEN_DIMENSIONS = {'category', 'status'}
+
+
+def report_metrics(totals, with_capacity=True):
+    """Rates for a set of summed counters (same fields as the daily report)"""
+    total = totals['total_tokens']
+    metrics = {
+        **totals,
+        'cancellation_rate': round(totals['cancelled_tokens'] / total * 100, 2) if total else 0,
+        'no_show_rate': round(totals['no_show_tokens'] / total * 100, 2) if total else 0,
+    }
+    if with_capacity:
+        capacity = totals['total_capacity']
+        metrics['capacity_utilization'] = round(totals['confirmed_tokens'] / capacity * 100, 2) if capacity else 0
+    return metrics
+
+
+def range_report(start_date, end_date, group_by=(), interval=None, doctor_id=None, specialization=None):
+    """
+    Aggregate report counters over a date range
+    The database sums the rollup table on plain columns (time bucket,
+    doctor_id, hour, category, status); doctor names, specializations and
+    year buckets are then rolled up in process from that much smaller result,
+    so no join or date function runs per rollup row. Slot and capacity totals
+    are only returned when no token dimension (category, status) is grouped on.
+    Returns: dict with the range, the totals and one row per group
+    """
+    rollups = DailyReportRollup.objects.filter(date__gte=start_date, date__lte=end_date)
+    if doctor_id:
+        rollups = rollups.filter(doctor_id=doctor_id)
+    if specialization:
+        rollups = rollups.filter(doctor_id__in=Doctor.objects.filter(specialization=specialization).values('id'))
+
+    with_capacity = not TOKEN_DIMENSIONS & set(group_by)
+    if not with_capacity:
+        rollups = rollups.exclude(category='')
+
+    fields = []
+    if interval:
+        fields.append(REPORT_INTERVALS[interval])
+    if {'doctor', 'specialization'} & set(group_by):
+        fields.append('doctor_id')
+    fields.extend(dimension for dimension in group_by if dimension in ('category', 'status', 'hour'))
+
+    aggregates = {
+        'total_tokens': Sum('tokens'),
+        'confirmed_tokens': Sum('tokens', filter=Q(status='CONFIRMED')),
+        'cancelled_tokens': Sum('tokens', filter=Q(status='CANCELLED')),
+        'no_show_tokens': Sum('tokens', filter=Q(status='NO_SHOW')),
+        'completed_tokens': Sum('tokens', filter=Q(status='COMPLETED')),
+    }
+    if with_capacity:
+        aggregates['total_slots'] = Sum('slots')
+        aggregates['total_capacity'] = Sum('capacity')
+
+    if fields:
+        grouped = list(rollups.values(*fields).annotate(**aggregates).order_by())
+    else:
+        grouped = [rollups.aggregate(**aggregates)]
+
+    doctors = {}
+    if 'doctor_id' in fields:
+        doctors = {
+            doctor.id: doctor
+            for doctor in Doctor.objects.filter(id__in={group['doctor_id'] for group in grouped})
+        }
+
+    def group_key(group):
+        key = {}
+        if interval:
+            period = group[REPORT_INTERVALS[interval]]
+            key['period'] = period.replace(month=1) if interval == 'year' else period
+        for dimension in group_by:
+            if dimension == 'doctor':
+                key['doctor_id'] = group['doctor_id']
+                key['doctor_name'] = doctors[group['doctor_id']].name
+            elif dimension == 'specialization':
+                key['specialization'] = doctors[group['doctor_id']].specialization
+            else:
+                key[dimension] = group[dimension]
+        return tuple(key.items())
+
+    totals = dict.fromkeys(aggregates, 0)
+    buckets = {}
+    for group in grouped:
+        key = group_key(group) if fields else ()
+        counters = buckets.setdefault(key, dict.fromkeys(aggregates, 0))
+        for name in aggregates:
+            value = group[name] or 0
+            counters[name] += value
+            totals[name] += value
+
+    rows = [
+        {**dict(key), **report_metrics(counters, with_capacity)}
+        for key, counters in sorted(buckets.items(), key=lambda item: [value for _, value in item[0]])
+    ] if fields else []
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'group_by': list(group_by),
+        'interval': interval,
+        'totals': report_metrics(totals, with_capacity),
+        'rows': rows,
+    }
@@ -0,0 +1,146 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractHour, TruncDate
+from django.utils import timezone
+
+from .models import DailyReportRollup, Slot, Token
+
+
+def date_buckets(day):
+    """Week (Monday) and month (1st) a date rolls up into"""
+    return {'week': day - timedelta(days=day.weekday()), 'month': day.replace(day=1)}
+
+
+def local_day_range(day):
+    """[start, end) datetimes of a local calendar day"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def slot_bucket(slot):
+    """(date, hour) a slot and its tokens are reported under"""
+    start = timezone.localtime(slot.start_time)
+    return start.date(), start.hour
+
+
+class RollupChanges:
+    """
+    Collects counter deltas for DailyReportRollup and writes them in one go
+    Call apply() inside the transaction that made the changes so the report
+    never disagrees with the tokens table, and only once per transaction:
+    rows are locked in sorted order within one apply(), so a second apply()
+    in the same transaction can take rows in the opposite order to a
+    concurrent one and deadlock.
+    """
+
+    def __init__(self):
+        # (date, hour, doctor_id, category, status) -> [tokens, slots, capacity]
+        self._deltas = defaultdict(lambda: [0, 0, 0])
+
+    def add_tokens(self, slot, category, status, count=1):
+        self._deltas[(*slot_bucket(slot), slot.doctor_id, category, status)][0] += count
+
+    def move_tokens(self, slot, category, old_status, new_status, count=1):
+        self.add_tokens(slot, category, old_status, -count)
+        self.add_tokens(slot, category, new_status, count)
+
+    def add_slot(self, slot, count=1):
+        delta = self._deltas[(*slot_bucket(slot), slot.doctor_id, '', '')]
+        delta[1] += count
+        delta[2] += count * slot.max_capacity
+
+    def add_slot_with_tokens(self, slot, count=1):
+        """Count a slot and every token booked into it (count=-1 removes them)"""
+        self.add_slot(slot, count)
+        grouped = Token.objects.filter(slot=slot).values('category', 'status').annotate(n=Count('id'))
+        for row in grouped:
+            self.add_tokens(slot, row['category'], row['status'], count * row['n'])
+
+    def apply(self):
+        deltas = sorted(
+            (key, value) for key, value in self._deltas.items() if any(value)
+        )
+        self._deltas.clear()
+        if not deltas:
+            return
+
+        # Make sure every row exists, then increment in a fixed order so
+        # concurrent writers cannot deadlock on the counters
+        DailyReportRollup.objects.bulk_create([
+            DailyReportRollup(
+                date=date, **date_buckets(date), hour=hour,
+                doctor_id=doctor_id, category=category, status=status
+            )
+            for (date, hour, doctor_id, category, status), _ in deltas
+        ], ignore_conflicts=True)
+        for (date, hour, doctor_id, category, status), (tokens, slots, capacity) in deltas:
+            DailyReportRollup.objects.filter(
+                date=date, hour=hour, doctor_id=doctor_id, category=category, status=status
+            ).update(
+                tokens=F('tokens') + tokens,
+                slots=F('slots') + slots,
+                capacity=F('capacity') + capacity
+            )
+
+
+def record_tokens(slot, category, status, count=1):
+    changes = RollupChanges()
+    changes.add_tokens(slot, category, status, count)
+    changes.apply()
+
+
+@transaction.atomic
+def rebuild_rollups(dates=None):
+    """
+    Recompute rollups from the slots and tokens tables
+    Returns: number of rollup rows written
+    """
+    rollups = DailyReportRollup.objects.all()
+    slots = Slot.objects.all()
+    if dates:
+        rollups = rollups.filter(date__in=dates)
+        # Ranges rather than start_time__date so the start_time index applies
+        slots = slots.filter(reduce(or_, (
+            Q(start_time__gte=start, start_time__lt=end)
+            for start, end in map(local_day_range, dates)
+        )))
+    rollups.delete()
+
+    rows = []
+    token_counts = Token.objects.filter(slot__in=slots).annotate(
+        date=TruncDate('slot__start_time'),
+        hour=ExtractHour('slot__start_time')
+    ).values('date', 'hour', 'slot__doctor_id', 'category', 'status').annotate(n=Count('id')).order_by()
+    for row in token_counts:
+        rows.append(DailyReportRollup(
+            date=row['date'],
+            **date_buckets(row['date']),
+            hour=row['hour'],
+            doctor_id=row['slot__doctor_id'],
+            category=row['category'],
+            status=row['status'],
+            tokens=row['n']
+        ))
+
+    slot_totals = slots.annotate(
+        date=TruncDate('start_time'),
+        hour=ExtractHour('start_time')
+    ).values('date', 'hour', 'doctor_id').annotate(n=Count('id'), capacity=Sum('max_capacity')).order_by()
+    for row in slot_totals:
+        rows.append(DailyReportRollup(
+            date=row['date'],
+            **date_buckets(row['date']),
+            hour=row['hour'],
+            doctor_id=row['doctor_id'],
+            slots=row['n'],
+            capacity=row['capacity']
+        ))
+
+    DailyReportRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
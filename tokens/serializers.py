@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Doctor, Slot, Patient, Token, WaitingList
+from .reports import REPORT_DIMENSIONS, REPORT_INTERVALS
 
 
 class DoctorSerializer(serializers.ModelSerializer):
@@ -33,6 +34,8 @@ class PatientSerializer(serializers.ModelSerializer):
 class TokenSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.name', read_only=True)
     slot_info = serializers.SerializerMethodField()
+    token_number = serializers.IntegerField(source='display_number', read_only=True)
+    estimated_time = serializers.DateTimeField(source='display_estimated_time', read_only=True)
 
     class Meta:
         model = Token
@@ -57,6 +60,28 @@ class TokenCreateSerializer(serializers.Serializer):
     category = serializers.ChoiceField(choices=Token.CATEGORY_CHOICES)
 
 
+class BulkTokenCreateSerializer(serializers.Serializer):
+    allocations = serializers.ListField(
+        child=TokenCreateSerializer(),
+        allow_empty=False,
+        max_length=500
+    )
+
+
+class BulkTokenResultSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=['allocated', 'waitlisted', 'rejected'])
+    token = TokenSerializer(allow_null=True)
+    error = serializers.CharField(allow_null=True)
+
+
+class BulkTokenResponseSerializer(serializers.Serializer):
+    allocated = serializers.IntegerField()
+    waitlisted = serializers.IntegerField()
+    rejected = serializers.IntegerField()
+    results = BulkTokenResultSerializer(many=True)
+
+
 class EmergencyTokenSerializer(serializers.Serializer):
     slot_id = serializers.UUIDField()
     patient_id = serializers.UUIDField()
@@ -66,6 +91,33 @@ class SlotDelaySerializer(serializers.Serializer):
     delay_minutes = serializers.IntegerField(min_value=0)
 
 
+class ReportRangeQuerySerializer(serializers.Serializer):
+    MAX_DAYS = 731
+
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    group_by = serializers.CharField(required=False, allow_blank=True, default='')
+    interval = serializers.ChoiceField(choices=list(REPORT_INTERVALS), required=False, allow_null=True, default=None)
+    doctor_id = serializers.UUIDField(required=False, allow_null=True, default=None)
+    specialization = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate_group_by(self, value):
+        dimensions = [dimension.strip() for dimension in value.split(',') if dimension.strip()]
+        unknown = [dimension for dimension in dimensions if dimension not in REPORT_DIMENSIONS]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown dimension(s): {', '.join(unknown)}. Choose from: {', '.join(REPORT_DIMENSIONS)}"
+            )
+        return list(dict.fromkeys(dimensions))
+
+    def validate(self, data):
+        if data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("end_date must not be before start_date")
+        if (data['end_date'] - data['start_date']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError(f"Date range is limited to {self.MAX_DAYS} days")
+        return data
+
+
 class WaitingListSerializer(serializers.ModelSerializer):
     patient_name = serializers.CharField(source='patient.name', read_only=True)
 
@@ -1,10 +1,38 @@
+import asyncio
+import weakref
 from datetime import datetime, timedelta
 from decimal import Decimal
+from redis import asyncio as aioredis
+from django.conf import settings
 from django.db import transaction
-from django.db.models import F
+from django.db.models import DurationField, ExpressionWrapper, F, Max, Value
 from django.core.cache import cache
 from django.utils import timezone
-from .models import Token, Slot, Patient, WaitingList
+from .booking_guard import get_booking_guard
+from .etags import touch_slots
+from .events import RELEASE_EVENTS, publish_on_commit, token_event
+from .metrics import observe_lock, observe_operation
+from .models import Token, Slot, Patient, WaitingList, derived_estimated_time, gapped_ordering
+from .queue_engine import SlotQueue, get_queue_engine
+from .rollups import RollupChanges, record_tokens
+from .waitlist_index import get_waitlist_index
+
+
+# redis.asyncio clients are bound to the event loop that created them
+_async_redis_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """Async Redis client (same server as the default cache) for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_redis_clients.get(loop)
+    if client is None:
+        location = settings.CACHES['default']['LOCATION']
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        client = aioredis.Redis.from_url(location.split(',')[0])
+        _async_redis_clients[loop] = client
+    return client
 
 
 class TokenAllocationService:
@@ -20,6 +48,8 @@ class TokenAllocationService:
     }
 
     AVG_CONSULTATION_TIME = 10  # minutes per patient
+    TIME_BONUS_PER_HOUR = 0.1
+    MAX_TIME_BONUS = 1.0
 
     @classmethod
     def calculate_priority(cls, category, booking_time=None):
@@ -35,7 +65,7 @@ class TokenAllocationService:
         
         # Calculate time bonus
         hours_since_booking = (timezone.now() - booking_time).total_seconds() / 3600
-        time_bonus = min(hours_since_booking * 0.1, 1.0)
+        time_bonus = min(hours_since_booking * cls.TIME_BONUS_PER_HOUR, cls.MAX_TIME_BONUS)
         
         final_priority = base_priority - time_bonus
         return round(final_priority, 2)
@@ -51,9 +81,22 @@ class TokenAllocationService:
     def acquire_slot_lock(cls, slot_id, timeout=10, blocking_timeout=5):
         """Acquire distributed lock for a slot"""
         lock_key = f"slot_lock:{slot_id}"
-        return cache.lock(lock_key, timeout=timeout, blocking_timeout=blocking_timeout)
+        return observe_lock(cache.lock(lock_key, timeout=timeout, blocking_timeout=blocking_timeout))
+
+    @classmethod
+    def acquire_slot_lock_async(cls, slot_id, timeout=10, blocking_timeout=5):
+        """
+        Async counterpart of acquire_slot_lock (use with `async with`)
+        Takes the same Redis key, so sync and async callers exclude each other;
+        while blocked the request only holds a suspended coroutine.
+        """
+        lock_key = cache.make_key(f"slot_lock:{slot_id}")
+        return observe_lock(
+            get_async_redis().lock(lock_key, timeout=timeout, sleep=0.1, blocking_timeout=blocking_timeout)
+        )
 
     @classmethod
+    @observe_operation('allocate_token')
     @transaction.atomic
     def allocate_token(cls, slot_id, patient_id, category):
         """
@@ -76,38 +119,50 @@ class TokenAllocationService:
         except Patient.DoesNotExist:
             return None, "Patient not found"
 
+        queue = get_queue_engine().load(slot)
+        changes = RollupChanges()
+        token, error = cls._book(slot, queue, patient, category, changes)
+        if error:
+            return None, error
+        changes.apply()
+
+        # Update slot capacity
+        slot.current_capacity = F('current_capacity') + 1
+        cls._commit_queue(slot, queue, update_fields=['current_capacity'], events=[('allocated', token)])
+
+        # Refresh to get updated capacity
+        slot.refresh_from_db()
+
+        return token, None
+
+    @classmethod
+    def _book(cls, slot, queue, patient, category, changes, booking_time=None):
+        """
+        Place a patient into a locked slot that has room
+        booking_time is when the patient first asked (waiting-list promotions
+        keep the time bonus they built up). The rollup delta goes into
+        `changes`; the caller applies it, updates capacity and commits the
+        queue.
+        Returns: (token, error_message)
+        """
         # Check for duplicate booking on same day
-        slot_date = slot.start_time.date()
+        slot_date = slot.date
         existing_tokens = Token.objects.filter(
             patient=patient,
             status='CONFIRMED',
-            slot__start_time__date=slot_date
+            slot_date=slot_date
         ).exists()
         
         if existing_tokens:
             return None, "Patient already has a booking for this day"
 
         # Calculate priority
-        priority = cls.calculate_priority(category)
+        priority = cls.calculate_priority(category, booking_time)
 
         # Find insertion position
-        existing_tokens = list(Token.objects.filter(
-            slot=slot,
-            status='CONFIRMED'
-        ).order_by('priority', 'token_number'))
-
-        position = 1
-        for token in existing_tokens:
-            if priority < token.priority:
-                break
-            position += 1
+        position = queue.position_for(priority)
 
-        # Resequence existing tokens if needed
-        if position <= len(existing_tokens):
-            cls._resequence_tokens(slot, position)
-
-        # Create new token
-        token = Token.objects.create(
+        token = Token(
             slot=slot,
             patient=patient,
             token_number=position,
@@ -116,29 +171,245 @@ class TokenAllocationService:
             status='CONFIRMED',
             estimated_time=cls.calculate_estimated_time(slot, position)
         )
+        if booking_time:
+            token.booked_at = booking_time
 
-        # Update slot capacity
-        slot.current_capacity = F('current_capacity') + 1
-        slot.save(update_fields=['current_capacity'])
+        # Resequence existing tokens if needed
+        cls._place_token(slot, queue, token, position)
 
-        # Refresh to get updated capacity
-        slot.refresh_from_db()
+        # Create new token
+        token.save(force_insert=True)
+        changes.add_tokens(slot, category, 'CONFIRMED')
+        get_booking_guard().add(slot_date, [patient.id])
 
         return token, None
 
+    @classmethod
+    def _place_token(cls, slot, queue, token, position):
+        """Give a new (unsaved) token its place in the queue"""
+        if gapped_ordering():
+            # Only the new row is written unless its neighbours need re-spacing
+            token.sort_key, respaced = queue.insert_sparse(token.id, token.priority, position)
+            token.token_number = cls._next_token_number(slot)
+            Token.objects.bulk_update(
+                [Token(id=token_id, sort_key=sort_key) for token_id, sort_key in respaced],
+                ['sort_key']
+            )
+        else:
+            queue.insert(token.id, token.priority, position)
+            cls._resequence_tokens(slot, position)
+
+    @classmethod
+    def _next_token_number(cls, slot):
+        """Stored number for a new token under gapped ordering (never reused)"""
+        last = Token.objects.filter(slot=slot).aggregate(last=Max('token_number'))['last']
+        return (last or 0) + 1
+
+    @classmethod
+    def _estimated_time_expression(cls, slot, token_number=F('token_number')):
+        """SQL expression for calculate_estimated_time over a token number expression"""
+        base_time = slot.start_time + timedelta(
+            minutes=slot.delay_minutes - cls.AVG_CONSULTATION_TIME
+        )
+        offset = ExpressionWrapper(
+            token_number * Value(timedelta(minutes=cls.AVG_CONSULTATION_TIME)),
+            output_field=DurationField()
+        )
+        return Value(base_time) + offset
+
+    @classmethod
+    def _shift_tokens(cls, slot, from_position, offset):
+        """
+        Move confirmed tokens numbered from_position onwards by offset
+        Two statements regardless of queue length: the moved tokens are first
+        parked at negative numbers so the unique (slot, token_number) check
+        never sees two tokens on the same number mid-update.
+        """
+        Token.objects.filter(
+            slot=slot,
+            status='CONFIRMED',
+            token_number__gte=from_position
+        ).update(token_number=-(F('token_number') + offset))
+
+        updates = {'token_number': -F('token_number')}
+        if not derived_estimated_time():
+            updates['estimated_time'] = cls._estimated_time_expression(slot, -F('token_number'))
+        Token.objects.filter(
+            slot=slot,
+            status='CONFIRMED',
+            token_number__lt=0
+        ).update(**updates)
+
     @classmethod
     def _resequence_tokens(cls, slot, from_position):
         """Shift tokens after insertion point"""
-        tokens_to_shift = Token.objects.filter(
-            slot=slot,
-            token_number__gte=from_position,
-            status='CONFIRMED'
-        ).order_by('token_number')
+        cls._shift_tokens(slot, from_position, 1)
+
+    @classmethod
+    def _commit_queue(cls, slot, queue, update_fields=(), events=()):
+        """
+        Bump the slot's queue version and publish the queue after commit
+        events: (type, token) pairs streamed to the slot's listeners, with
+        each token's position in the final queue.
+        """
+        slot.queue_version = F('queue_version') + 1
+        slot.save(update_fields=[*update_fields, 'queue_version'])
+        queue.version += 1
+        engine = get_queue_engine()
+        transaction.on_commit(lambda: engine.commit(queue))
+        publish_on_commit(slot.id, queue.version, [
+            token_event(kind, token, queue.position_of(token.id)) for kind, token in events
+        ])
+
+    @classmethod
+    @observe_operation('allocate_tokens_bulk')
+    @transaction.atomic
+    def allocate_tokens_bulk(cls, allocations):
+        """
+        Allocate many tokens in one transaction
+        allocations: list of dicts with slot_id, patient_id and category
+        Slots are locked once each, and each slot's new tokens, shifted tokens
+        and waiting-list entries are written with batched statements.
+        Returns: list of (status, token, error) in request order, where
+        status is 'allocated', 'waitlisted' or 'rejected'
+        """
+        results = [None] * len(allocations)
+        by_slot = {}
+        for index, item in enumerate(allocations):
+            by_slot.setdefault(item['slot_id'], []).append(index)
+
+        slots = {
+            slot.id: slot
+            for slot in Slot.objects.select_for_update().filter(
+                id__in=list(by_slot), status='ACTIVE'
+            ).order_by('id')
+        }
+        patients = Patient.objects.in_bulk({item['patient_id'] for item in allocations})
+
+        # Patients already holding a booking on any day touched by the batch
+        booked = set(Token.objects.filter(
+            patient_id__in=list(patients),
+            status='CONFIRMED',
+            slot_date__in={slot.date for slot in slots.values()}
+        ).order_by().values_list('patient_id', 'slot_date'))
+
+        waiting = []
+        for slot_id, indexes in by_slot.items():
+            slot = slots.get(slot_id)
+            if slot is None:
+                for index in indexes:
+                    results[index] = ('rejected', None, "Slot not found or not active")
+                continue
+            cls._allocate_into_slot(
+                slot, [(index, allocations[index]) for index in indexes],
+                patients, booked, results, waiting
+            )
+
+        WaitingList.objects.bulk_create(waiting)
+        get_waitlist_index().add(waiting)
+        if waiting:
+            waiting_slots = {entry.slot_id for entry in waiting}
+            Slot.objects.filter(id__in=waiting_slots).update(queue_version=F('queue_version') + 1)
+            touch_slots(waiting_slots)
 
-        for token in tokens_to_shift:
-            token.token_number += 1
-            token.estimated_time = cls.calculate_estimated_time(slot, token.token_number)
-            token.save(update_fields=['token_number', 'estimated_time'])
+        changes = RollupChanges()
+        for _, token, _ in results:
+            if token:
+                changes.add_tokens(token.slot, token.category, 'CONFIRMED')
+        changes.apply()
+
+        return results
+
+    @classmethod
+    def _allocate_into_slot(cls, slot, items, patients, booked, results, waiting):
+        """Place a batch of requests into one locked slot"""
+        queue = get_queue_engine().load(slot)
+        previous = {token_id: number for number, token_id in enumerate(queue.token_ids(), start=1)}
+        sort_keys = {}
+        available = slot.max_capacity - slot.current_capacity
+        slot_date = slot.date
+        placed = []
+
+        for index, item in items:
+            patient = patients.get(item['patient_id'])
+            if patient is None:
+                results[index] = ('rejected', None, "Patient not found")
+                continue
+            if (patient.id, slot_date) in booked:
+                results[index] = ('rejected', None, "Patient already has a booking for this day")
+                continue
+
+            priority = cls.calculate_priority(item['category'])
+            if available <= 0:
+                waiting.append(WaitingList(
+                    slot=slot,
+                    patient=patient,
+                    category=item['category'],
+                    priority=priority
+                ))
+                results[index] = ('waitlisted', None, "Slot is full. Added to waiting list.")
+                continue
+
+            token = Token(
+                slot=slot,
+                patient=patient,
+                priority=priority,
+                category=item['category'],
+                status='CONFIRMED',
+                slot_date=slot_date
+            )
+            position = queue.position_for(priority)
+            if gapped_ordering():
+                token.sort_key, respaced = queue.insert_sparse(token.id, priority, position)
+                sort_keys[token.id] = token.sort_key
+                sort_keys.update(respaced)
+            else:
+                queue.insert(token.id, priority, position)
+
+            booked.add((patient.id, slot_date))
+            available -= 1
+            placed.append(token)
+            results[index] = ('allocated', token, None)
+
+        if not placed:
+            return
+
+        numbers = {token_id: number for number, token_id in enumerate(queue.token_ids(), start=1)}
+        if gapped_ordering():
+            next_number = cls._next_token_number(slot)
+            for offset, token in enumerate(placed):
+                token.token_number = next_number + offset
+                token.sort_key = sort_keys.pop(token.id)
+            Token.objects.bulk_update(
+                [Token(id=token_id, sort_key=sort_key) for token_id, sort_key in sort_keys.items()],
+                ['sort_key']
+            )
+        else:
+            # Park moved tokens below zero, then write their final numbers
+            moved = [
+                Token(id=token_id, token_number=-numbers[token_id])
+                for token_id, number in previous.items()
+                if numbers[token_id] != number
+            ]
+            Token.objects.bulk_update(moved, ['token_number'])
+            for token in moved:
+                token.token_number = -token.token_number
+                token.estimated_time = cls.calculate_estimated_time(slot, token.token_number)
+            fields = ['token_number'] if derived_estimated_time() else ['token_number', 'estimated_time']
+            Token.objects.bulk_update(moved, fields)
+            for token in placed:
+                token.token_number = numbers[token.id]
+
+        for token in placed:
+            token.estimated_time = cls.calculate_estimated_time(slot, numbers[token.id])
+        Token.objects.bulk_create(placed)
+        get_booking_guard().add(slot_date, [token.patient_id for token in placed])
+
+        slot.current_capacity = F('current_capacity') + len(placed)
+        cls._commit_queue(
+            slot, queue, update_fields=['current_capacity'],
+            events=[('allocated', token) for token in placed]
+        )
 
     @classmethod
     def _add_to_waiting_list(cls, slot, patient_id, category):
@@ -147,66 +418,106 @@ class TokenAllocationService:
             patient = Patient.objects.get(id=patient_id)
             priority = cls.calculate_priority(category)
             
-            WaitingList.objects.create(
+            entry = WaitingList.objects.create(
                 slot=slot,
                 patient=patient,
                 category=category,
                 priority=priority
             )
+            get_waitlist_index().add([entry])
+            # The slot version covers its waiting list (board snapshots, ETags)
+            Slot.objects.filter(id=slot.id).update(queue_version=F('queue_version') + 1)
+            touch_slots([slot.id])
         except Patient.DoesNotExist:
             pass
 
     @classmethod
+    @observe_operation('cancel_token')
     @transaction.atomic
     def cancel_token(cls, token_id):
         """Cancel a token and handle reallocation"""
+        error = cls._release_token(token_id, 'CANCELLED')
+        if error:
+            return False, error
+        return True, "Token cancelled successfully"
+
+    @classmethod
+    def _release_token(cls, token_id, new_status):
+        """
+        Take a confirmed token out of the queue and refill the freed place
+        Returns: error message or None
+        """
+        slot_id = Token.objects.filter(id=token_id).values_list('slot_id', flat=True).first()
+        if slot_id is None:
+            return "Token not found"
+
+        # Lock the slot before the token, the order allocation and the aging
+        # job take, so a release cannot deadlock with them
+        slot = Slot.objects.select_for_update().get(id=slot_id)
         try:
-            token = Token.objects.select_for_update().get(id=token_id)
+            token = Token.objects.select_for_update().get(id=token_id, slot_id=slot_id)
         except Token.DoesNotExist:
-            return False, "Token not found"
+            return "Token not found"
 
         if token.status != 'CONFIRMED':
-            return False, "Token is not in confirmed status"
-
-        slot = Slot.objects.select_for_update().get(id=token.slot_id)
-        
-        # Mark token as cancelled
-        token.status = 'CANCELLED'
-        token.save(update_fields=['status'])
-
-        # Decrease capacity
-        slot.current_capacity = F('current_capacity') - 1
-        slot.save(update_fields=['current_capacity'])
-
-        # Check waiting list
-        waiting = WaitingList.objects.filter(slot=slot).order_by('priority', 'created_at').first()
-        
-        if waiting:
-            # Promote waiting patient
-            new_token, error = cls.allocate_token(slot.id, waiting.patient_id, waiting.category)
-            if new_token:
-                waiting.delete()
-        else:
+            return "Token is not in confirmed status"
+
+        queue = get_queue_engine().load(slot)
+
+        # Mark token as released
+        position = queue.remove(token.id) or token.token_number
+        token.status = new_status
+        update_fields = ['status']
+        if gapped_ordering():
+            # Freeze the number the patient was last shown; later tokens
+            # move up implicitly since their numbers are derived
+            token.token_number = position
+            update_fields.append('token_number')
+        if derived_estimated_time():
+            token.estimated_time = cls.calculate_estimated_time(slot, position)
+            update_fields.append('estimated_time')
+        token.save(update_fields=update_fields)
+        # Every rollup delta of the release and the promotion is applied in
+        # one sorted pass, so concurrent releases lock the shared day rows in
+        # the same order
+        changes = RollupChanges()
+        changes.move_tokens(slot, token.category, 'CONFIRMED', new_status)
+        get_booking_guard().remove(slot.date, [token.patient_id])
+
+        if not gapped_ordering():
             # Compact tokens (remove gap)
-            cls._compact_tokens(slot)
+            cls._compact_tokens(slot, position)
+
+        # Promote the head of the waiting list into the freed place, reusing
+        # the slot lock and the loaded queue
+        promoted = None
+        if slot.status == 'ACTIVE':
+            index = get_waitlist_index()
+            waiting = index.head(slot)
+            if waiting:
+                promoted, _ = cls._book(slot, queue, waiting.patient, waiting.category, changes, waiting.created_at)
+                if promoted:
+                    index.remove([waiting])
+                    waiting.delete()
+        changes.apply()
+
+        events = [(RELEASE_EVENTS[new_status], token)]
+        if promoted:
+            cls._commit_queue(slot, queue, events=[*events, ('promoted', promoted)])
+        else:
+            # Decrease capacity
+            slot.current_capacity = F('current_capacity') - 1
+            cls._commit_queue(slot, queue, update_fields=['current_capacity'], events=events)
 
-        return True, "Token cancelled successfully"
+        return None
 
     @classmethod
-    def _compact_tokens(cls, slot):
-        """Remove gaps in token sequence after cancellation"""
-        confirmed_tokens = Token.objects.filter(
-            slot=slot,
-            status='CONFIRMED'
-        ).order_by('token_number')
-
-        for idx, token in enumerate(confirmed_tokens, start=1):
-            if token.token_number != idx:
-                token.token_number = idx
-                token.estimated_time = cls.calculate_estimated_time(slot, idx)
-                token.save(update_fields=['token_number', 'estimated_time'])
+    def _compact_tokens(cls, slot, removed_position):
+        """Remove the gap left by a released token"""
+        cls._shift_tokens(slot, removed_position + 1, -1)
 
     @classmethod
+    @observe_operation('insert_emergency')
     @transaction.atomic
     def insert_emergency(cls, slot_id, patient_id):
         """Insert emergency patient at position 1"""
@@ -223,19 +534,7 @@ class TokenAllocationService:
         # Emergency always gets priority 1
         priority = 1.0
 
-        # Shift all existing tokens
-        Token.objects.filter(slot=slot, status='CONFIRMED').update(
-            token_number=F('token_number') + 1
-        )
-
-        # Recalculate estimated times for all tokens
-        all_tokens = Token.objects.filter(slot=slot, status='CONFIRMED').order_by('token_number')
-        for token in all_tokens:
-            token.estimated_time = cls.calculate_estimated_time(slot, token.token_number)
-            token.save(update_fields=['estimated_time'])
-
-        # Create emergency token at position 1
-        token = Token.objects.create(
+        token = Token(
             slot=slot,
             patient=patient,
             token_number=1,
@@ -245,30 +544,38 @@ class TokenAllocationService:
             estimated_time=cls.calculate_estimated_time(slot, 1)
         )
 
+        # Shift all existing tokens
+        queue = get_queue_engine().load(slot)
+        cls._place_token(slot, queue, token, 1)
+
+        # Create emergency token at position 1
+        token.save(force_insert=True)
+        record_tokens(slot, 'EMERGENCY', 'CONFIRMED')
+        get_booking_guard().add(slot.date, [patient.id])
+
         # Update capacity (allow emergency to exceed if needed)
+        update_fields = []
         if slot.current_capacity < slot.max_capacity:
             slot.current_capacity = F('current_capacity') + 1
-            slot.save(update_fields=['current_capacity'])
+            update_fields.append('current_capacity')
+        cls._commit_queue(slot, queue, update_fields=update_fields, events=[('emergency', token)])
 
         return token, None
 
     @classmethod
+    @observe_operation('mark_no_show')
     @transaction.atomic
     def mark_no_show(cls, token_id):
         """Mark token as no-show"""
-        try:
-            token = Token.objects.get(id=token_id)
-        except Token.DoesNotExist:
-            return False, "Token not found"
-
-        token.status = 'NO_SHOW'
-        token.save(update_fields=['status'])
-
         # Handle as cancellation after grace period
         # In production, this would be scheduled via Celery
-        return cls.cancel_token(token_id)
+        error = cls._release_token(token_id, 'NO_SHOW')
+        if error:
+            return False, error
+        return True, "Token marked as no-show"
 
     @classmethod
+    @observe_operation('delay_slot')
     @transaction.atomic
     def delay_slot(cls, slot_id, delay_minutes):
         """Add delay to slot and update all token times"""
@@ -277,15 +584,53 @@ class TokenAllocationService:
         except Slot.DoesNotExist:
             return False, "Slot not found"
 
-        # Update slot delay
+        # Update slot delay (the queue version bump invalidates cached reads)
         slot.delay_minutes += delay_minutes
         slot.status = 'DELAYED'
-        slot.save(update_fields=['delay_minutes', 'status'])
-
-        # Update all token estimated times
-        tokens = Token.objects.filter(slot=slot, status='CONFIRMED')
-        for token in tokens:
-            token.estimated_time = cls.calculate_estimated_time(slot, token.token_number)
-            token.save(update_fields=['estimated_time'])
+        publish_on_commit(slot.id, slot.queue_version + 1, [
+            {'type': 'delayed', 'delay_minutes': slot.delay_minutes}
+        ])
+        slot.queue_version = F('queue_version') + 1
+        slot.save(update_fields=['delay_minutes', 'status', 'queue_version'])
+
+        # Update all token estimated times (derived times follow the slot)
+        if not derived_estimated_time():
+            Token.objects.filter(slot=slot, status='CONFIRMED').update(
+                estimated_time=F('estimated_time') + timedelta(minutes=delay_minutes)
+            )
 
         return True, f"Slot delayed by {delay_minutes} minutes"
+
+    @classmethod
+    @transaction.atomic
+    def renumber_slot(cls, slot_id):
+        """Rewrite a slot's confirmed tokens in the layout of the current ordering mode"""
+        try:
+            slot = Slot.objects.select_for_update().get(id=slot_id)
+        except Slot.DoesNotExist:
+            return False, "Slot not found"
+
+        tokens = list(Token.objects.filter(
+            slot=slot,
+            status='CONFIRMED'
+        ).order_by('sort_key', 'token_number'))
+
+        if gapped_ordering():
+            for idx, token in enumerate(tokens):
+                token.sort_key = idx * SlotQueue.SORT_KEY_GAP
+            Token.objects.bulk_update(tokens, ['sort_key'])
+        else:
+            # Park numbers below zero first so the dense pass cannot collide
+            for idx, token in enumerate(tokens, start=1):
+                token.token_number = -idx
+            Token.objects.bulk_update(tokens, ['token_number'])
+            for idx, token in enumerate(tokens, start=1):
+                token.token_number = idx
+                token.sort_key = 0
+                token.estimated_time = cls.calculate_estimated_time(slot, idx)
+            Token.objects.bulk_update(tokens, ['token_number', 'sort_key', 'estimated_time'])
+
+        slot.queue_version = F('queue_version') + 1
+        slot.save(update_fields=['queue_version'])
+
+        return True, f"Renumbered {len(tokens)} tokens"
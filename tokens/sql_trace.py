@@ -0,0 +1,124 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger('tokens.sql')
+
+# Trace of the request being served; ORM work handed to the async DB pool
+# runs in a copy of the request's context, so it is recorded too
+_current_trace = ContextVar('sql_trace', default=None)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so repeats of one query match"""
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql.replace('%s', '?'))
+    sql = VALUE_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryTrace:
+    """SQL statements run while serving one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duration_ms(self):
+        return round(self.duration * 1000, 2)
+
+    def repeated(self, threshold):
+        """(fingerprint, count) for statements run at least `threshold` times (likely N+1)"""
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+
+def trace_execute(execute, sql, params, many, context):
+    """Connection execute wrapper feeding the current request's trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.record(sql, time.perf_counter() - started)
+
+
+def install_trace_wrapper(sender, connection, **kwargs):
+    """connection_created receiver (connected when TOKEN_SQL_TRACE is on)"""
+    if trace_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_execute)
+
+
+class SQLTraceMiddleware:
+    """
+    Per-request query count, DB time and repeated statements
+    Requests over TOKEN_SQL_TRACE_MAX_QUERIES statements or
+    TOKEN_SQL_TRACE_MAX_DB_MS of database time, or repeating one statement
+    TOKEN_SQL_TRACE_REPEAT times, are logged on the tokens.sql logger. With
+    DEBUG on the summary is also sent as X-SQL-* response headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_queries = getattr(settings, 'TOKEN_SQL_TRACE_MAX_QUERIES', 50)
+        self.max_db_ms = getattr(settings, 'TOKEN_SQL_TRACE_MAX_DB_MS', 200)
+        self.repeat_threshold = getattr(settings, 'TOKEN_SQL_TRACE_REPEAT', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trace = QueryTrace()
+        token = _current_trace.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_trace.reset(token)
+        return self.report(request, response, trace)
+
+    async def __acall__(self, request):
+        trace = QueryTrace()
+        token = _current_trace.set(trace)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_trace.reset(token)
+        return self.report(request, response, trace)
+
+    def report(self, request, response, trace):
+        repeated = trace.repeated(self.repeat_threshold)
+        if trace.count > self.max_queries or trace.duration_ms > self.max_db_ms or repeated:
+            lines = [
+                f"{request.method} {request.path} -> {response.status_code}: "
+                f"{trace.count} queries, {trace.duration_ms} ms in the database"
+            ]
+            lines.extend(f"  {count}x {sql[:300]}" for sql, count in repeated[:5])
+            logger.warning('\n'.join(lines))
+
+        if settings.DEBUG:
+            response['X-SQL-Queries'] = str(trace.count)
+            response['X-SQL-Time-Ms'] = str(trace.duration_ms)
+            response['X-SQL-Max-Repeat'] = str(max(trace.fingerprints.values(), default=0))
+        return response
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .events import get_event_broker
+from .models import Slot
+from .workers import run_in_db_thread
+
+
+def sse(kind, data):
+    """One Server-Sent Events frame"""
+    return f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+def heartbeat():
+    return getattr(settings, 'TOKEN_EVENT_HEARTBEAT', 15)
+
+
+def slot_version(slot_id):
+    return Slot.objects.filter(id=slot_id).values_list('queue_version', flat=True).first()
+
+
+def ready(slot_id, version):
+    # Sent after subscribing, so a board fetched at this version or later
+    # misses nothing the stream will not deliver
+    return b"retry: 3000\n\n" + sse('ready', {'slot': str(slot_id), 'version': version})
+
+
+def frames(events):
+    return b"".join(sse(event['type'], event) for event in events) or KEEPALIVE
+
+
+def stream_events(slot_id):
+    """Event stream for a WSGI worker (holds the thread while connected)"""
+    broker = get_event_broker()
+    subscription = broker.subscribe(slot_id)
+    try:
+        yield ready(slot_id, slot_version(slot_id))
+        # The stream outlives the request cycle; hand a pooled connection
+        # back now rather than when the client disconnects
+        close_old_connections()
+        while True:
+            yield frames(subscription.wait(heartbeat()))
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def astream_events(slot_id):
+    """Event stream under ASGI (a suspended coroutine while idle)"""
+    broker = get_event_broker()
+    subscription = broker.subscribe(slot_id, loop=asyncio.get_running_loop())
+    try:
+        yield ready(slot_id, await run_in_db_thread(slot_version, slot_id))
+        while True:
+            yield frames(await subscription.await_events(heartbeat()))
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@require_GET
+def slot_events(request, pk):
+    """
+    GET /slots/{id}/events/: live queue events as text/event-stream
+    Events: allocated, cancelled, no_show, emergency, promoted, delayed,
+    reordered, changed, plus resync when the client fell too far behind.
+    404 while TOKEN_EVENT_BROKER is off. 501 under WSGI, where each stream
+    would hold a worker thread, unless TOKEN_EVENT_WSGI_STREAMS allows it.
+    """
+    if get_event_broker().name == 'off' or not Slot.objects.filter(id=pk).exists():
+        raise Http404
+    if isinstance(request, ASGIRequest):
+        stream = astream_events(pk)
+    elif getattr(settings, 'TOKEN_EVENT_WSGI_STREAMS', False):
+        stream = stream_events(pk)
+    else:
+        return HttpResponse(
+            "Queue events need an ASGI server", status=501, content_type='text/plain'
+        )
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies (nginx) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
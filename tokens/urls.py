@@ -1,9 +1,15 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     DoctorViewSet, SlotViewSet, PatientViewSet,
     TokenViewSet, ReportViewSet, WaitingListViewSet
 )
+from .async_views import (
+    TokenListView, TokenBulkView, TokenEmergencyView,
+    TokenDetailView, TokenNoShowView, SlotDelayView
+)
+from .streams import slot_events
 
 router = DefaultRouter()
 router.register(r'doctors', DoctorViewSet, basename='doctor')
@@ -13,6 +19,21 @@ router.register(r'tokens', TokenViewSet, basename='token')
 router.register(r'reports', ReportViewSet, basename='report')
 router.register(r'waiting-list', WaitingListViewSet, basename='waiting-list')
 
-urlpatterns = [
+urlpatterns = []
+
+# Async slot mutations (serve with an ASGI server); they shadow the
+# matching router routes and hand other methods to the viewsets
+if getattr(settings, 'TOKEN_ASYNC_VIEWS', False):
+    urlpatterns += [
+        path('tokens/', TokenListView.as_view(), name='token-list-async'),
+        path('tokens/bulk/', TokenBulkView.as_view(), name='token-bulk-async'),
+        path('tokens/emergency/', TokenEmergencyView.as_view(), name='token-emergency-async'),
+        path('tokens/<uuid:pk>/', TokenDetailView.as_view(), name='token-detail-async'),
+        path('tokens/<uuid:pk>/no_show/', TokenNoShowView.as_view(), name='token-no-show-async'),
+        path('slots/<uuid:pk>/delay/', SlotDelayView.as_view(), name='slot-delay-async'),
+    ]
+
+urlpatterns += [
+    path('slots/<uuid:pk>/events/', slot_events, name='slot-events'),
     path('', include(router.urls)),
 ]
@@ -1,17 +1,88 @@
+import json
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Count, Q
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
-from .models import Doctor, Slot, Patient, Token, WaitingList
+from .models import Doctor, Slot, Patient, Token, WaitingList, DailyReportRollup
 from .serializers import (
     DoctorSerializer, SlotSerializer, PatientSerializer,
     TokenSerializer, TokenCreateSerializer, EmergencyTokenSerializer,
-    SlotDelaySerializer, WaitingListSerializer
+    SlotDelaySerializer, WaitingListSerializer, BulkTokenCreateSerializer,
+    BulkTokenResponseSerializer, ReportRangeQuerySerializer
 )
-from .services import TokenAllocationService
+from .boards import BOARDS, board_snapshot
+from .booking_guard import get_booking_guard
+from .etags import ConditionalGetMixin
+from .importers import PatientImporter, detect_format
+from .projections import token_data, token_projection, waiting_data, waiting_projection
+from .queue_cache import bump_queue_version, doctor_renamed, get_queue_cache, patient_renamed
+from .renderers import MessagePackRenderer, board_renderers
+from .reports import range_report
+from .rollups import RollupChanges
+from .waitlist_index import get_waitlist_index
+from .workers import run_bulk_allocation, run_slot_operation
+
+
+def board_since(request):
+    """The `since` version of a board request, or None for a full snapshot"""
+    since = request.query_params.get('since')
+    try:
+        return int(since) if since is not None else None
+    except ValueError:
+        return None
+
+
+BOARD_PARAMETERS = [
+    OpenApiParameter(
+        'since', int, required=False,
+        description='With Accept: application/x-msgpack, send only changes since this slot version'
+    ),
+]
+
+
+def bulk_response_data(results):
+    """Response body for a bulk allocation from its (status, token, error) results"""
+    allocated = [token.id for _, token, _ in results if token]
+    tokens = Token.objects.filter(id__in=allocated).select_related(
+        'slot', 'patient', 'slot__doctor'
+    ).for_display().in_bulk()
+
+    return {
+        'allocated': len(allocated),
+        'waitlisted': sum(1 for result in results if result[0] == 'waitlisted'),
+        'rejected': sum(1 for result in results if result[0] == 'rejected'),
+        'results': [
+            {
+                'index': index,
+                'status': result_status,
+                'token': TokenSerializer(tokens[token.id]).data if token else None,
+                'error': error,
+            }
+            for index, (result_status, token, error) in enumerate(results)
+        ],
+    }
+
+
+def emergency_response_data(token):
+    """Response body for an emergency insertion, with the tokens it pushed back"""
+    # The whole queue is read (positions are numbered over it), then the new token dropped
+    queue = Token.objects.filter(
+        slot_id=token.slot_id,
+        status='CONFIRMED'
+    ).select_related('slot__doctor', 'patient').in_queue_order()
+    affected_tokens = [queued for queued in queue if queued.id != token.id]
+
+    return {
+        'token': TokenSerializer(token).data,
+        'affected_tokens': TokenSerializer(affected_tokens, many=True).data,
+        'message': 'Emergency patient inserted at position 1'
+    }
 
 
 class DoctorViewSet(viewsets.ModelViewSet):
@@ -19,17 +90,102 @@ class DoctorViewSet(viewsets.ModelViewSet):
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_name = serializer.instance.name
+        super().perform_update(serializer)
+        if serializer.instance.name != old_name:
+            doctor_renamed(serializer.instance.id)
+
 
 class PatientViewSet(viewsets.ModelViewSet):
     """API endpoints for managing patients"""
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_name = serializer.instance.name
+        super().perform_update(serializer)
+        if serializer.instance.name != old_name:
+            patient_renamed(serializer.instance.id)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # The patient's tokens go with it
+        changes = RollupChanges()
+        guard = get_booking_guard()
+        for token in Token.objects.filter(patient=instance).select_related('slot'):
+            changes.add_tokens(token.slot, token.category, token.status, -1)
+            if token.status == 'CONFIRMED':
+                guard.remove(token.slot_date, [instance.id])
+        instance.delete()
+        changes.apply()
+
+    @extend_schema(
+        request={
+            'text/csv': {'type': 'string', 'format': 'binary'},
+            'application/x-ndjson': {'type': 'string', 'format': 'binary'},
+            'multipart/form-data': {'type': 'object', 'properties': {'file': {'type': 'string', 'format': 'binary'}}},
+        },
+        parameters=[
+            OpenApiParameter('progress', required=False, type=bool, description='Stream NDJSON progress lines'),
+            OpenApiParameter('batch_size', required=False, type=int, description='Rows per chunk'),
+        ]
+    )
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_patients(self, request):
+        """Stream a CSV or NDJSON patient file into the patients table"""
+        content_type = request.content_type or ''
+        if content_type.startswith('multipart/form-data'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response(
+                    {'error': 'file is required'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            fmt = detect_format(upload.content_type, upload.name)
+            stream = upload
+        else:
+            fmt = detect_format(content_type)
+            stream = request.stream
+
+        if fmt is None or stream is None:
+            return Response(
+                {'error': 'Send text/csv or application/x-ndjson content'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            batch_size = int(request.query_params.get('batch_size', 0)) or None
+        except ValueError:
+            return Response(
+                {'error': 'batch_size must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        importer = PatientImporter(batch_size=batch_size)
+        lines = (line.decode('utf-8-sig') for line in stream)
+
+        if request.query_params.get('progress') in ('1', 'true'):
+            def events():
+                for counts in importer.import_chunks(lines, fmt):
+                    yield json.dumps(counts) + '\n'
+                yield json.dumps({**importer.summary(), 'done': True}) + '\n'
+
+            return StreamingHttpResponse(events(), content_type='application/x-ndjson')
 
-class SlotViewSet(viewsets.ModelViewSet):
+        return Response(importer.run(lines, fmt))
+
+
+class SlotViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """API endpoints for managing time slots"""
     queryset = Slot.objects.select_related('doctor').all()
     serializer_class = SlotSerializer
+    etag_actions = ('list', 'retrieve', 'tokens')
+
+    def etag_slot_id(self, request):
+        return self.kwargs.get('pk') if self.action in ('retrieve', 'tokens') else None
 
     @extend_schema(
         request=SlotDelaySerializer,
@@ -44,50 +200,127 @@ class SlotViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             delay_minutes = serializer.validated_data['delay_minutes']
             
-            lock = TokenAllocationService.acquire_slot_lock(slot.id)
             try:
-                with lock:
-                    success, message = TokenAllocationService.delay_slot(slot.id, delay_minutes)
-                    
-                    if success:
-                        slot.refresh_from_db()
-                        return Response({
-                            'message': message,
-                            'slot': SlotSerializer(slot).data
-                        })
-                    else:
-                        return Response(
-                            {'error': message},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
+                success, message = run_slot_operation(slot.id, 'delay_slot', slot.id, delay_minutes)
             except Exception as e:
                 return Response(
                     {'error': f'Failed to acquire lock: {str(e)}'},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
+
+            if success:
+                slot.refresh_from_db()
+                return Response({
+                    'message': message,
+                    'slot': SlotSerializer(slot).data
+                })
+            else:
+                return Response(
+                    {'error': message},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @extend_schema(responses={200: TokenSerializer(many=True)})
-    @action(detail=True, methods=['get'])
+    @extend_schema(responses={200: TokenSerializer(many=True)}, parameters=BOARD_PARAMETERS)
+    @action(detail=True, methods=['get'], renderer_classes=board_renderers())
     def tokens(self, request, pk=None):
         """Get all tokens for a specific slot"""
         slot = self.get_object()
-        tokens = Token.objects.filter(slot=slot).select_related('patient').order_by('token_number')
-        serializer = TokenSerializer(tokens, many=True)
-        return Response(serializer.data)
+        if isinstance(request.accepted_renderer, MessagePackRenderer):
+            return Response(board_snapshot(BOARDS['tokens'], slot, board_since(request)))
+
+        def build():
+            return token_data(token_projection(Token.objects.filter(slot=slot).in_queue_order()))
+
+        data, hit = get_queue_cache().fetch(slot, build)
+        response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Hit/miss counters of the slot queue cache (this process)"""
+        return Response(get_queue_cache().stats())
+
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        changes = RollupChanges()
+        changes.add_slot(serializer.instance)
+        changes.apply()
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        slot = serializer.instance
+        old_date = slot.date
+        changes = RollupChanges()
+        changes.add_slot_with_tokens(slot, -1)
+        super().perform_update(serializer)
+        changes.add_slot_with_tokens(slot)
+        changes.apply()
 
-class TokenViewSet(viewsets.ModelViewSet):
+        if slot.date != old_date:
+            # Moved to another day: bookings now count against the new date
+            Token.objects.filter(slot=slot).update(slot_date=slot.date)
+            patient_ids = list(Token.objects.filter(slot=slot, status='CONFIRMED').values_list('patient_id', flat=True))
+            get_booking_guard().remove(old_date, patient_ids)
+            get_booking_guard().add(slot.date, patient_ids)
+        bump_queue_version(slot.id)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        changes = RollupChanges()
+        changes.add_slot_with_tokens(instance, -1)
+        patient_ids = list(Token.objects.filter(slot=instance, status='CONFIRMED').values_list('patient_id', flat=True))
+        instance.delete()
+        changes.apply()
+        get_booking_guard().remove(instance.date, patient_ids)
+
+
+class TokenViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """API endpoints for managing tokens"""
     queryset = Token.objects.select_related('slot', 'patient', 'slot__doctor').all()
     serializer_class = TokenSerializer
 
+    def get_queryset(self):
+        return super().get_queryset().for_display()
+
     def get_serializer_class(self):
         if self.action == 'create':
             return TokenCreateSerializer
         return TokenSerializer
 
+    def list(self, request, *args, **kwargs):
+        """List tokens (rows projected in SQL, same output as TokenSerializer)"""
+        rows = token_projection(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(token_data(page))
+        return Response(token_data(rows))
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        token = serializer.instance
+        old_slot, old_category, old_status = token.slot, token.category, token.status
+        old_patient_id, old_date = token.patient_id, token.slot_date
+        super().perform_update(serializer)
+
+        changes = RollupChanges()
+        changes.add_tokens(old_slot, old_category, old_status, -1)
+        changes.add_tokens(token.slot, token.category, token.status)
+        changes.apply()
+
+        guard = get_booking_guard()
+        if old_status == 'CONFIRMED':
+            guard.remove(old_date, [old_patient_id])
+        if token.status == 'CONFIRMED':
+            guard.add(token.slot_date, [token.patient_id])
+
+        bump_queue_version(old_slot.id)
+        if token.slot_id != old_slot.id:
+            bump_queue_version(token.slot_id)
+
     @extend_schema(
         request=TokenCreateSerializer,
         responses={201: TokenSerializer}
@@ -101,56 +334,82 @@ class TokenViewSet(viewsets.ModelViewSet):
             patient_id = serializer.validated_data['patient_id']
             category = serializer.validated_data['category']
 
-            # Acquire lock for concurrency control
-            lock = TokenAllocationService.acquire_slot_lock(slot_id)
-            
+            # Refuse known same-day duplicates without touching the slot lock
+            if get_booking_guard().already_booked(slot_id, patient_id):
+                return Response(
+                    {'error': "Patient already has a booking for this day"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            # Acquire lock (or the slot's shard worker) for concurrency control
             try:
-                with lock:
-                    token, error = TokenAllocationService.allocate_token(
-                        slot_id, patient_id, category
-                    )
-                    
-                    if token:
-                        return Response(
-                            TokenSerializer(token).data,
-                            status=status.HTTP_201_CREATED
-                        )
-                    else:
-                        return Response(
-                            {'error': error},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
+                token, error = run_slot_operation(
+                    slot_id, 'allocate_token', slot_id, patient_id, category
+                )
             except Exception as e:
                 return Response(
                     {'error': f'Failed to acquire lock: {str(e)}'},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
+
+            if token:
+                return Response(
+                    TokenSerializer(token).data,
+                    status=status.HTTP_201_CREATED
+                )
+            else:
+                return Response(
+                    {'error': error},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @extend_schema(
+        request=BulkTokenCreateSerializer,
+        responses={200: BulkTokenResponseSerializer}
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Allocate a batch of tokens across one or more slots"""
+        serializer = BulkTokenCreateSerializer(data=request.data)
+
+        if serializer.is_valid():
+            allocations = serializer.validated_data['allocations']
+
+            try:
+                results = run_bulk_allocation(allocations)
+            except Exception as e:
+                return Response(
+                    {'error': f'Failed to acquire lock: {str(e)}'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+
+            return Response(bulk_response_data(results))
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @extend_schema(responses={200: {'type': 'object', 'properties': {'message': {'type': 'string'}}}})
     def destroy(self, request, *args, **kwargs):
         """Cancel a token"""
         token = self.get_object()
         
-        lock = TokenAllocationService.acquire_slot_lock(token.slot_id)
         try:
-            with lock:
-                success, message = TokenAllocationService.cancel_token(token.id)
-                
-                if success:
-                    return Response({'message': message})
-                else:
-                    return Response(
-                        {'error': message},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+            success, message = run_slot_operation(token.slot_id, 'cancel_token', token.id)
         except Exception as e:
             return Response(
                 {'error': f'Failed to acquire lock: {str(e)}'},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
+        if success:
+            return Response({'message': message})
+        else:
+            return Response(
+                {'error': message},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
     @extend_schema(
         request=EmergencyTokenSerializer,
         responses={201: TokenSerializer}
@@ -164,34 +423,24 @@ class TokenViewSet(viewsets.ModelViewSet):
             slot_id = serializer.validated_data['slot_id']
             patient_id = serializer.validated_data['patient_id']
 
-            lock = TokenAllocationService.acquire_slot_lock(slot_id)
             try:
-                with lock:
-                    token, error = TokenAllocationService.insert_emergency(slot_id, patient_id)
-                    
-                    if token:
-                        # Get affected tokens
-                        affected_tokens = Token.objects.filter(
-                            slot_id=slot_id,
-                            status='CONFIRMED',
-                            token_number__gt=1
-                        ).order_by('token_number')
-                        
-                        return Response({
-                            'token': TokenSerializer(token).data,
-                            'affected_tokens': TokenSerializer(affected_tokens, many=True).data,
-                            'message': 'Emergency patient inserted at position 1'
-                        }, status=status.HTTP_201_CREATED)
-                    else:
-                        return Response(
-                            {'error': error},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
+                token, error = run_slot_operation(slot_id, 'insert_emergency', slot_id, patient_id)
             except Exception as e:
                 return Response(
                     {'error': f'Failed to acquire lock: {str(e)}'},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
+
+            if token:
+                return Response(
+                    emergency_response_data(token),
+                    status=status.HTTP_201_CREATED
+                )
+            else:
+                return Response(
+                    {'error': error},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -201,24 +450,22 @@ class TokenViewSet(viewsets.ModelViewSet):
         """Mark a token as no-show"""
         token = self.get_object()
         
-        lock = TokenAllocationService.acquire_slot_lock(token.slot_id)
         try:
-            with lock:
-                success, message = TokenAllocationService.mark_no_show(token.id)
-                
-                if success:
-                    return Response({'message': message})
-                else:
-                    return Response(
-                        {'error': message},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+            success, message = run_slot_operation(token.slot_id, 'mark_no_show', token.id)
         except Exception as e:
             return Response(
                 {'error': f'Failed to acquire lock: {str(e)}'},
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
 
+        if success:
+            return Response({'message': message})
+        else:
+            return Response(
+                {'error': message},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
 
 class ReportViewSet(viewsets.ViewSet):
     """API endpoints for reports and analytics"""
@@ -239,34 +486,42 @@ class ReportViewSet(viewsets.ViewSet):
         else:
             report_date = timezone.now().date()
 
-        # Build filters
-        slot_filter = Q(start_time__date=report_date)
+        # One indexed read of the maintained rollups
+        rollups = DailyReportRollup.objects.filter(date=report_date)
         doctor_id = request.query_params.get('doctor_id')
         if doctor_id:
-            slot_filter &= Q(doctor_id=doctor_id)
+            rollups = rollups.filter(doctor_id=doctor_id)
 
-        # Get slots for the day
-        slots = Slot.objects.filter(slot_filter)
-        total_slots = slots.count()
+        total_slots = 0
+        total_capacity = 0
+        category_counts = {}
+        status_counts = {}
+        for category, token_status, count, slot_count, capacity in rollups.values_list(
+            'category', 'status', 'tokens', 'slots', 'capacity'
+        ):
+            total_slots += slot_count
+            total_capacity += capacity
+            if category:
+                category_counts[category] = category_counts.get(category, 0) + count
+                status_counts[token_status] = status_counts.get(token_status, 0) + count
+
+        category_stats = [
+            {'category': category, 'count': count}
+            for category, count in sorted(category_counts.items()) if count
+        ]
+        status_stats = [
+            {'status': token_status, 'count': count}
+            for token_status, count in sorted(status_counts.items()) if count
+        ]
 
-        # Get tokens for these slots
-        tokens = Token.objects.filter(slot__in=slots)
-        
-        # Category breakdown
-        category_stats = tokens.values('category').annotate(count=Count('id'))
-        
-        # Status breakdown
-        status_stats = tokens.values('status').annotate(count=Count('id'))
-        
         # Calculate rates
-        total_tokens = tokens.count()
-        confirmed = tokens.filter(status='CONFIRMED').count()
-        cancelled = tokens.filter(status='CANCELLED').count()
-        no_shows = tokens.filter(status='NO_SHOW').count()
-        completed = tokens.filter(status='COMPLETED').count()
+        total_tokens = sum(status_counts.values())
+        confirmed = status_counts.get('CONFIRMED', 0)
+        cancelled = status_counts.get('CANCELLED', 0)
+        no_shows = status_counts.get('NO_SHOW', 0)
+        completed = status_counts.get('COMPLETED', 0)
 
         # Capacity utilization
-        total_capacity = sum(slot.max_capacity for slot in slots)
         utilization = (confirmed / total_capacity * 100) if total_capacity > 0 else 0
 
         report = {
@@ -280,19 +535,43 @@ class ReportViewSet(viewsets.ViewSet):
             'cancellation_rate': round((cancelled / total_tokens * 100) if total_tokens > 0 else 0, 2),
             'no_show_rate': round((no_shows / total_tokens * 100) if total_tokens > 0 else 0, 2),
             'capacity_utilization': round(utilization, 2),
-            'category_breakdown': list(category_stats),
-            'status_breakdown': list(status_stats),
+            'category_breakdown': category_stats,
+            'status_breakdown': status_stats,
         }
 
         return Response(report)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('start_date', required=True, type=str, description='First day (YYYY-MM-DD)'),
+            OpenApiParameter('end_date', required=True, type=str, description='Last day, inclusive (YYYY-MM-DD)'),
+            OpenApiParameter('group_by', required=False, type=str, description='Comma-separated: doctor, specialization, category, status, hour'),
+            OpenApiParameter('interval', required=False, type=str, enum=['day', 'week', 'month', 'year'], description='Time bucket'),
+            OpenApiParameter('doctor_id', required=False, type=str, description='Filter by doctor UUID'),
+            OpenApiParameter('specialization', required=False, type=str, description='Filter by specialization'),
+        ]
+    )
+    @action(detail=False, methods=['get'])
+    def range(self, request):
+        """Aggregate report over a date range, grouped by the requested dimensions"""
+        serializer = ReportRangeQuerySerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(range_report(**serializer.validated_data))
+
 
-class WaitingListViewSet(viewsets.ReadOnlyModelViewSet):
+class WaitingListViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoints for viewing waiting list"""
     queryset = WaitingList.objects.select_related('slot', 'patient').all()
     serializer_class = WaitingListSerializer
+    etag_actions = ('list', 'retrieve', 'by_slot')
 
-    @action(detail=False, methods=['get'])
+    def etag_slot_id(self, request):
+        return request.query_params.get('slot_id') if self.action == 'by_slot' else None
+
+    @extend_schema(parameters=BOARD_PARAMETERS)
+    @action(detail=False, methods=['get'], renderer_classes=board_renderers())
     def by_slot(self, request):
         """Get waiting list for a specific slot"""
         slot_id = request.query_params.get('slot_id')
@@ -301,7 +580,26 @@ class WaitingListViewSet(viewsets.ReadOnlyModelViewSet):
                 {'error': 'slot_id parameter is required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        waiting_list = self.queryset.filter(slot_id=slot_id).order_by('priority', 'created_at')
-        serializer = self.get_serializer(waiting_list, many=True)
-        return Response(serializer.data)
+
+        if isinstance(request.accepted_renderer, MessagePackRenderer):
+            try:
+                slot = Slot.objects.select_related('doctor').get(id=slot_id)
+            except (Slot.DoesNotExist, DjangoValidationError):
+                return Response({'error': 'Slot not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response(board_snapshot(BOARDS['waiting'], slot, board_since(request)))
+
+        entry_ids = get_waitlist_index().entry_ids(slot_id)
+        queryset = WaitingList.objects.filter(slot_id=slot_id)
+        if entry_ids is None:
+            waiting_list = waiting_projection(queryset.order_by('priority', 'created_at'))
+        else:
+            # The table is the record and the index only orders it: rows
+            # deleted since are skipped, and if any row is missing from the
+            # index (enabled on existing data, a lost write, an eviction) the
+            # whole list falls back to the table order
+            rows = {row['id']: row for row in waiting_projection(queryset.order_by())}
+            if rows.keys() <= set(entry_ids):
+                waiting_list = [rows[entry_id] for entry_id in entry_ids if entry_id in rows]
+            else:
+                waiting_list = sorted(rows.values(), key=lambda row: (row['priority'], row['created_at']))
+        return Response(waiting_data(waiting_list))
@@ -0,0 +1,198 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import WaitingList
+
+
+class NullWaitlistIndex:
+    """
+    Promotion order of each slot's waiting list
+    The waiting_list table stays the record; an index only answers "who is
+    next" and "in what order" without the ordered query. This base class
+    reads the table (TOKEN_WAITLIST_INDEX=off).
+    """
+
+    name = 'off'
+
+    def head(self, slot):
+        """Next entry to promote, with its patient loaded, or None"""
+        return WaitingList.objects.filter(slot=slot).select_related('patient').order_by('priority', 'created_at').first()
+
+    def entry_ids(self, slot_id):
+        """Entry ids in promotion order, or None when the table has to be read"""
+        return None
+
+    def add(self, entries):
+        """Index new or re-prioritized entries once the current transaction commits"""
+
+    def remove(self, entries):
+        """Drop promoted entries once the current transaction commits"""
+
+
+class RedisWaitlistIndex(NullWaitlistIndex):
+    """
+    One sorted set per slot in the default Redis
+    Scored by priority; members are "<created_at timestamp>:<id>", so equal
+    priorities fall back to lexicographic member order, i.e. arrival order.
+    Writes happen after commit, so a rolled back transaction leaves no trace.
+    Members whose row is gone (slot or patient deleted) are dropped when met;
+    entries missing from Redis are restored by `manage.py repair_waiting_lists`.
+    An empty or unreachable set falls back to the table.
+    """
+
+    name = 'redis'
+    HEAD_BATCH = 8
+
+    def __init__(self):
+        from django_redis import get_redis_connection
+        self._client = get_redis_connection('default')
+
+    def key(self, slot_id):
+        return cache.make_key(f"waitlist:{slot_id}")
+
+    @staticmethod
+    def member(entry):
+        return f"{entry.created_at.timestamp():017.6f}:{entry.id}"
+
+    @staticmethod
+    def entry_id(member):
+        if isinstance(member, bytes):
+            member = member.decode()
+        return uuid.UUID(member.rsplit(':', 1)[1])
+
+    def expires_at(self, slot):
+        return int((slot.end_time + timedelta(days=1)).timestamp())
+
+    def head(self, slot):
+        key = self.key(slot.id)
+        start = 0
+        while True:
+            try:
+                members = self._client.zrange(key, start, start + self.HEAD_BATCH - 1)
+            except Exception:
+                return super().head(slot)
+            if not members:
+                return super().head(slot)
+            rows = WaitingList.objects.select_related('patient').in_bulk(
+                [self.entry_id(member) for member in members]
+            )
+            stale = []
+            for member in members:
+                entry = rows.get(self.entry_id(member))
+                if entry is not None:
+                    self._discard(key, stale)
+                    return entry
+                stale.append(member)
+            if not self._discard(key, stale):
+                start += len(members)
+
+    def entry_ids(self, slot_id):
+        try:
+            members = self._client.zrange(self.key(slot_id), 0, -1)
+        except Exception:
+            return None
+        return [self.entry_id(member) for member in members] or None
+
+    def _discard(self, key, members):
+        """Drop members whose row is gone; False if Redis refused"""
+        if not members:
+            return True
+        try:
+            self._client.zrem(key, *members)
+        except Exception:
+            return False
+        return True
+
+    def add(self, entries):
+        by_slot = {}
+        for entry in entries:
+            by_slot.setdefault(entry.slot_id, (entry.slot, {}))[1][self.member(entry)] = entry.priority
+        if not by_slot:
+            return
+
+        def write():
+            try:
+                pipe = self._client.pipeline()
+                for slot_id, (slot, scores) in by_slot.items():
+                    pipe.zadd(self.key(slot_id), scores)
+                    pipe.expireat(self.key(slot_id), self.expires_at(slot))
+                pipe.execute()
+            except Exception:
+                pass
+
+        transaction.on_commit(write)
+
+    def remove(self, entries):
+        by_slot = {}
+        for entry in entries:
+            by_slot.setdefault(entry.slot_id, []).append(self.member(entry))
+        if not by_slot:
+            return
+
+        def write():
+            try:
+                pipe = self._client.pipeline()
+                for slot_id, members in by_slot.items():
+                    pipe.zrem(self.key(slot_id), *members)
+                pipe.execute()
+            except Exception:
+                pass
+
+        transaction.on_commit(write)
+
+    def slot_ids(self):
+        """Slots that currently have a sorted set"""
+        prefix = cache.make_key('waitlist:')
+        for key in self._client.scan_iter(match=f"{prefix}*", count=500):
+            if isinstance(key, bytes):
+                key = key.decode()
+            yield key[len(prefix):]
+
+    def clear(self, slot_id):
+        """Drop a slot's set; True if there was one"""
+        return bool(self._client.delete(self.key(slot_id)))
+
+    def rebuild(self, slot, entries):
+        """
+        Replace a slot's set with the given entries if it differs
+        Returns: True when the set was rewritten
+        """
+        key = self.key(slot.id)
+        expected = {self.member(entry): float(entry.priority) for entry in entries}
+        current = {
+            (member.decode() if isinstance(member, bytes) else member): score
+            for member, score in self._client.zrange(key, 0, -1, withscores=True)
+        }
+        if current == expected:
+            return False
+        pipe = self._client.pipeline(transaction=True)
+        pipe.delete(key)
+        if expected:
+            pipe.zadd(key, expected)
+            pipe.expireat(key, self.expires_at(slot))
+        pipe.execute()
+        return True
+
+
+WAITLIST_INDEXES = {
+    'off': NullWaitlistIndex,
+    'redis': RedisWaitlistIndex,
+}
+
+_waitlist_index = None
+
+
+def get_waitlist_index():
+    """Return the index selected by settings.TOKEN_WAITLIST_INDEX"""
+    global _waitlist_index
+    name = getattr(settings, 'TOKEN_WAITLIST_INDEX', 'off')
+    if _waitlist_index is None or _waitlist_index.name != name:
+        try:
+            _waitlist_index = WAITLIST_INDEXES[name]()
+        except KeyError:
+            raise ValueError(f"Unknown TOKEN_WAITLIST_INDEX: {name}")
+    return _waitlist_index
@@ -0,0 +1,468 @@
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import time
+import uuid
+import zlib
+from contextlib import AsyncExitStack, ExitStack
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Token
+from .services import TokenAllocationService, get_async_redis
+
+logger = logging.getLogger('tokens.workers')
+
+
+# Service methods that may be routed to a slot worker
+SLOT_OPERATIONS = {
+    'allocate_token',
+    'allocate_tokens_bulk',
+    'cancel_token',
+    'insert_emergency',
+    'mark_no_show',
+    'delay_slot',
+}
+
+
+# Argument types of the single-slot operations on the redis wire, where
+# UUIDs travel as strings (allocate_tokens_bulk has its own encoding)
+OPERATION_ARGS = {
+    'allocate_token': (uuid.UUID, uuid.UUID, str),
+    'cancel_token': (uuid.UUID,),
+    'insert_emergency': (uuid.UUID, uuid.UUID),
+    'mark_no_show': (uuid.UUID,),
+    'delay_slot': (uuid.UUID, int),
+}
+
+# Operations returning (token, error); the others return (success, message)
+TOKEN_OPERATIONS = {'allocate_token', 'insert_emergency'}
+
+
+class SlotWorkerTimeout(Exception):
+    pass
+
+
+class SlotWorkerError(Exception):
+    """A mutation raised inside a redis-transport slot worker (carries its message)"""
+
+
+def check_timeout(timeout):
+    """Refuse waits that would never end (None) or never start (zero, negative)"""
+    if timeout is None or timeout <= 0:
+        raise ValueError(f"Slot worker timeout must be a positive number of seconds, not {timeout!r}")
+    return timeout
+
+
+def shard_timeout():
+    return check_timeout(getattr(settings, 'TOKEN_SHARD_TIMEOUT', 5))
+
+
+def sharded_mode():
+    """True when slot mutations go to single-writer shard workers instead of Redis locks"""
+    return getattr(settings, 'TOKEN_ALLOCATION_MODE', 'locking') == 'sharded'
+
+
+def shard_for(slot_id):
+    """Stable shard index for a slot (same in every process)"""
+    shards = getattr(settings, 'TOKEN_SHARD_COUNT', 4)
+    return zlib.crc32(str(slot_id).encode()) % shards
+
+
+def call_operation(operation, args):
+    """Execute a TokenAllocationService mutation in the current thread"""
+    if operation not in SLOT_OPERATIONS:
+        raise ValueError(f"Unknown slot operation: {operation}")
+    return getattr(TokenAllocationService, operation)(*args)
+
+
+def call_with_connection(func, *args):
+    """Call func on a worker thread, recycling its DB connection like a request would"""
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def run_operation(operation, args):
+    """Execute a mutation on a worker thread"""
+    return call_with_connection(call_operation, operation, args)
+
+
+_db_executor = None
+_db_executor_lock = Lock()
+
+
+def get_db_executor():
+    """
+    Bounded thread pool that async views use for ORM work
+    Each thread holds at most one DB connection (checked out per call with
+    TOKEN_DB_POOL), so the pool size caps the connections one ASGI process
+    opens however many requests are in flight.
+    """
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TOKEN_ASYNC_DB_THREADS', 16),
+                thread_name_prefix='async-db'
+            )
+        return _db_executor
+
+
+async def run_in_db_thread(func, *args):
+    """Await blocking ORM code from an async view without tying up the event loop"""
+    loop = asyncio.get_running_loop()
+    # Carry the request's context (e.g. its SQL trace) onto the pool thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_db_executor(), context.run, call_with_connection, func, *args)
+
+
+class LocalReply:
+    def __init__(self, future, timeout):
+        self._future = future
+        self._deadline = time.monotonic() + check_timeout(timeout)
+
+    def result(self):
+        try:
+            return self._future.result(max(self._deadline - time.monotonic(), 0))
+        except FutureTimeout:
+            if self._future.cancel():
+                raise SlotWorkerTimeout("Timed out waiting for slot worker")
+            # Already running: the caller must see its outcome, not a 503
+            return self._future.result()
+
+
+class LocalTransport:
+    """
+    One single-threaded executor per shard inside this process
+    Only valid when a single process handles all writes (runserver, one
+    gunicorn worker); use the redis transport otherwise. A request still
+    queued when its caller times out is cancelled, so it never runs.
+    """
+
+    def __init__(self, shards):
+        self._executors = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'slot-shard-{shard}')
+            for shard in range(shards)
+        ]
+
+    def _submit(self, shard, operation, args):
+        context = contextvars.copy_context()
+        return self._executors[shard].submit(context.run, run_operation, operation, args)
+
+    def submit(self, shard, operation, args, timeout):
+        return LocalReply(self._submit(shard, operation, args), timeout)
+
+    async def acall(self, shard, operation, args, timeout):
+        future = self._submit(shard, operation, args)
+        # asyncio.wait (unlike wait_for) leaves the future alone on timeout
+        wrapped = asyncio.wrap_future(future)
+        done, _ = await asyncio.wait({wrapped}, timeout=check_timeout(timeout))
+        if not done and future.cancel():
+            raise SlotWorkerTimeout("Timed out waiting for slot worker")
+        return await wrapped
+
+
+def encode_args(operation, args):
+    """Arguments of a mutation as JSON values (strings and ints)"""
+    if operation == 'allocate_tokens_bulk':
+        return [[str(item['slot_id']), str(item['patient_id']), item['category']] for item in args[0]]
+    return [value if isinstance(value, int) else str(value) for value in args]
+
+
+def decode_args(operation, values):
+    """Arguments read off the wire; ValueError/TypeError on anything unexpected"""
+    if operation == 'allocate_tokens_bulk':
+        return ([
+            {'slot_id': uuid.UUID(slot_id), 'patient_id': uuid.UUID(patient_id), 'category': str(category)}
+            for slot_id, patient_id, category in values
+        ],)
+    types = OPERATION_ARGS.get(operation)
+    if types is None or len(values) != len(types):
+        raise ValueError(f"Invalid slot operation request: {operation}")
+    return tuple(kind(value) for kind, value in zip(types, values))
+
+
+def encode_result(operation, result):
+    """A mutation's result as JSON values, tokens replaced by their ids"""
+    if operation == 'allocate_tokens_bulk':
+        return [[status, token and str(token.id), error] for status, token, error in result]
+    if operation in TOKEN_OPERATIONS:
+        token, error = result
+        return [token and str(token.id), error]
+    return list(result)
+
+
+def decode_result(operation, value):
+    """A mutation's result from its wire form, tokens loaded back from the database"""
+    if operation == 'allocate_tokens_bulk':
+        token_ids = [token_id for _, token_id, _ in value if token_id]
+    elif operation in TOKEN_OPERATIONS:
+        token_ids = [value[0]] if value[0] else []
+    else:
+        return tuple(value)
+
+    tokens = Token.objects.select_related('slot__doctor', 'patient').in_bulk(token_ids)
+
+    def token(token_id):
+        return tokens.get(uuid.UUID(token_id)) if token_id else None
+
+    if operation == 'allocate_tokens_bulk':
+        return [(status, token(token_id), error) for status, token_id, error in value]
+    return token(value[0]), value[1]
+
+
+def unpack_reply(message):
+    reply = json.loads(message)
+    if not reply['ok']:
+        raise SlotWorkerError(reply['error'])
+    return reply['result']
+
+
+def wait_seconds(deadline):
+    # BRPOP takes whole seconds and treats 0 as "forever"
+    return max(math.ceil(deadline - time.monotonic()), 1)
+
+
+class RedisReply:
+    def __init__(self, transport, request_id, operation, timeout):
+        self._transport = transport
+        self._request_id = request_id
+        self._operation = operation
+        self._timeout = timeout
+        self._deadline = time.monotonic() + timeout
+
+    def result(self):
+        client = self._transport.client
+        reply_key = self._transport.REPLY_KEY.format(request_id=self._request_id)
+        reply = client.brpop(reply_key, timeout=wait_seconds(self._deadline))
+        if reply is None:
+            if self._transport.abandon(client, self._request_id):
+                raise SlotWorkerTimeout("Timed out waiting for slot worker")
+            # The worker took the request before we gave up: wait for its outcome
+            reply = client.brpop(reply_key, timeout=math.ceil(self._timeout))
+            if reply is None:
+                raise SlotWorkerTimeout("Slot worker took the request but did not answer")
+        return decode_result(self._operation, unpack_reply(reply[1]))
+
+
+class RedisTransport:
+    """
+    Requests are pushed onto a Redis list per shard and executed by
+    `manage.py run_slot_workers`; results come back on a per-request list.
+    Messages are JSON: the operation name, its arguments as strings and
+    ints, and a deadline. A request is claimed (SET NX) by the worker before
+    it runs or by the caller when it stops waiting, never both, so a request
+    answered with a timeout is never applied later.
+    """
+
+    QUEUE_KEY = 'slot_shard:{shard}'
+    REPLY_KEY = 'slot_shard_reply:{request_id}'
+    CLAIM_KEY = 'slot_shard_claim:{request_id}'
+    REPLY_TTL = 60
+
+    def __init__(self, shards):
+        from django_redis import get_redis_connection
+        self.client = get_redis_connection('default')
+
+    def request(self, operation, args, timeout):
+        """(request id, message) for a mutation"""
+        request_id = uuid.uuid4().hex
+        return request_id, json.dumps({
+            'id': request_id,
+            'operation': operation,
+            'args': encode_args(operation, args),
+            # Wall clock, compared by the worker on another host
+            'deadline': time.time() + check_timeout(timeout),
+        })
+
+    def abandon(self, client, request_id):
+        """Claim a request for the caller; False if the worker already took it (sync or async client)"""
+        return client.set(self.CLAIM_KEY.format(request_id=request_id), 'caller', nx=True, ex=self.REPLY_TTL)
+
+    def submit(self, shard, operation, args, timeout):
+        request_id, message = self.request(operation, args, timeout)
+        self.client.lpush(self.QUEUE_KEY.format(shard=shard), message)
+        return RedisReply(self, request_id, operation, timeout)
+
+    async def acall(self, shard, operation, args, timeout):
+        client = get_async_redis()
+        request_id, message = self.request(operation, args, timeout)
+        reply_key = self.REPLY_KEY.format(request_id=request_id)
+        await client.lpush(self.QUEUE_KEY.format(shard=shard), message)
+        reply = await client.brpop(reply_key, timeout=math.ceil(timeout))
+        if reply is None:
+            if await self.abandon(client, request_id):
+                raise SlotWorkerTimeout("Timed out waiting for slot worker")
+            reply = await client.brpop(reply_key, timeout=math.ceil(timeout))
+            if reply is None:
+                raise SlotWorkerTimeout("Slot worker took the request but did not answer")
+        return await run_in_db_thread(decode_result, operation, unpack_reply(reply[1]))
+
+    def serve(self, shards, stop=None):
+        """Worker loop: apply queued requests for the given shards in arrival order"""
+        keys = [self.QUEUE_KEY.format(shard=shard) for shard in shards]
+        while stop is None or not stop():
+            item = self.client.brpop(keys, timeout=1)
+            if item is None:
+                continue
+            try:
+                request = json.loads(item[1])
+                request_id, operation = request['id'], request['operation']
+                args = decode_args(operation, request['args'])
+                deadline = float(request['deadline'])
+            except (ValueError, TypeError, KeyError):
+                logger.error("Dropping malformed slot worker request: %r", item[1][:200])
+                continue
+            # Past its deadline, or already given up by the caller: drop it
+            claim_key = self.CLAIM_KEY.format(request_id=request_id)
+            if time.time() > deadline or not self.client.set(claim_key, 'worker', nx=True, ex=self.REPLY_TTL):
+                continue
+            try:
+                reply = {'ok': True, 'result': encode_result(operation, run_operation(operation, args))}
+            except Exception as e:
+                logger.exception("Slot operation %s failed", operation)
+                reply = {'ok': False, 'error': str(e) or type(e).__name__}
+            reply_key = self.REPLY_KEY.format(request_id=request_id)
+            pipe = self.client.pipeline()
+            pipe.lpush(reply_key, json.dumps(reply))
+            pipe.expire(reply_key, self.REPLY_TTL)
+            pipe.execute()
+
+
+TRANSPORTS = {
+    'local': LocalTransport,
+    'redis': RedisTransport,
+}
+
+_transport = None
+_transport_lock = Lock()
+
+
+def get_transport():
+    """Return the transport selected by settings.TOKEN_SHARD_TRANSPORT"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            name = getattr(settings, 'TOKEN_SHARD_TRANSPORT', 'local')
+            try:
+                transport_class = TRANSPORTS[name]
+            except KeyError:
+                raise ValueError(f"Unknown TOKEN_SHARD_TRANSPORT: {name}")
+            _transport = transport_class(getattr(settings, 'TOKEN_SHARD_COUNT', 4))
+        return _transport
+
+
+def run_slot_operation(slot_id, operation, *args):
+    """
+    Run a slot mutation with exclusive access to the slot
+    In locking mode this takes the Redis slot lock in the calling thread; in
+    sharded mode the call is handed to the slot's shard worker and awaited.
+    """
+    if not sharded_mode():
+        with TokenAllocationService.acquire_slot_lock(slot_id):
+            return call_operation(operation, args)
+    return get_transport().submit(shard_for(slot_id), operation, args, shard_timeout()).result()
+
+
+async def arun_slot_operation(slot_id, operation, *args):
+    """
+    Async run_slot_operation
+    Waiting for the slot lock or the shard worker suspends the coroutine
+    instead of blocking a thread; the mutation itself runs on the DB pool.
+    """
+    if not sharded_mode():
+        async with TokenAllocationService.acquire_slot_lock_async(slot_id):
+            return await run_in_db_thread(call_operation, operation, args)
+    return await get_transport().acall(shard_for(slot_id), operation, args, shard_timeout())
+
+
+def group_by_slot(allocations):
+    """Map slot_id -> indexes of its allocations in the batch"""
+    by_slot = {}
+    for index, item in enumerate(allocations):
+        by_slot.setdefault(item['slot_id'], []).append(index)
+    return by_slot
+
+
+def merge_results(size, batches):
+    """Put per-slot sub-batch results back in batch order"""
+    results = [None] * size
+    for indexes, batch_results in batches:
+        for index, result in zip(indexes, batch_results):
+            results[index] = result
+    return results
+
+
+def timed_out_batch(size, error):
+    """Results for a sub-batch its shard worker never ran"""
+    return [('rejected', None, str(error))] * size
+
+
+def run_bulk_allocation(allocations):
+    """Allocate a batch spanning several slots with exclusive access to each"""
+    by_slot = group_by_slot(allocations)
+
+    if not sharded_mode():
+        # Lock each slot once, in a fixed order so batches cannot deadlock
+        with ExitStack() as stack:
+            for slot_id in sorted(by_slot):
+                stack.enter_context(TokenAllocationService.acquire_slot_lock(slot_id))
+            return call_operation('allocate_tokens_bulk', (allocations,))
+
+    # One sub-batch per slot, sent to every shard before waiting on any
+    transport = get_transport()
+    timeout = shard_timeout()
+    pending = [
+        (indexes, transport.submit(
+            shard_for(slot_id),
+            'allocate_tokens_bulk',
+            ([allocations[index] for index in indexes],),
+            timeout
+        ))
+        for slot_id, indexes in by_slot.items()
+    ]
+
+    # A sub-batch that timed out never ran; the others are reported as done
+    batches = []
+    for indexes, reply in pending:
+        try:
+            batches.append((indexes, reply.result()))
+        except SlotWorkerTimeout as e:
+            batches.append((indexes, timed_out_batch(len(indexes), e)))
+    return merge_results(len(allocations), batches)
+
+
+async def arun_bulk_allocation(allocations):
+    """Async run_bulk_allocation"""
+    by_slot = group_by_slot(allocations)
+
+    if not sharded_mode():
+        async with AsyncExitStack() as stack:
+            for slot_id in sorted(by_slot):
+                await stack.enter_async_context(TokenAllocationService.acquire_slot_lock_async(slot_id))
+            return await run_in_db_thread(call_operation, 'allocate_tokens_bulk', (allocations,))
+
+    transport = get_transport()
+    timeout = shard_timeout()
+
+    async def allocate(slot_id, indexes):
+        try:
+            return await transport.acall(
+                shard_for(slot_id),
+                'allocate_tokens_bulk',
+                ([allocations[index] for index in indexes],),
+                timeout
+            )
+        except SlotWorkerTimeout as e:
+            return timed_out_batch(len(indexes), e)
+
+    batches = await asyncio.gather(*(allocate(slot_id, indexes) for slot_id, indexes in by_slot.items()))
+    return merge_results(len(allocations), zip(by_slot.values(), batches))